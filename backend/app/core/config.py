@@ -14,6 +14,78 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     KMP_DUPLICATE_LIB_OK: str = "TRUE"
 
+    # Import sinh viên hàng loạt (CSV + zip ảnh)
+    STUDENT_IMPORT_CHUNK_SIZE: int = 500  # số sinh viên mỗi transaction
+    STUDENT_IMPORT_HASH_WORKERS: int = 0  # số process hash mật khẩu, 0 = số CPU
+    STUDENT_IMPORT_MAX_AVATAR_BYTES: int = 10 * 1024 * 1024  # kích thước tối đa (giải nén) mỗi ảnh trong zip
+
+    # Nhận diện khuôn mặt
+    FACE_PRELOAD_MODELS: bool = True  # load model AdaFace khi khởi động server
+    FACE_MODEL_RUNTIME: str = "eager"  # eager | torchscript | onnx (artifact tạo bằng cli export-models)
+    FACE_MODEL_QUANTIZE: bool = False  # dùng artifact INT8 (dynamic quantization)
+    FACE_MODEL_ARTIFACT_DIR: str = ""  # mặc định: face_service/models_services/exported
+    FACE_DETECTOR_BACKEND: str = "mtcnn"  # mtcnn | yolo (YOLOv8-face)
+    FACE_YOLO_CONFIDENCE: float = 0.5
+    # Profile phát hiện (default | selfie_kiosk | classroom | camera_stream) theo nguồn ảnh
+    FACE_PROFILE_SINGLE: str = "selfie_kiosk"  # ảnh một người: điểm danh từng sinh viên, ảnh đăng ký
+    FACE_PROFILE_GROUP: str = "classroom"  # ảnh chụp cả lớp
+    FACE_PROFILE_CAMERA: str = "camera_stream"  # frame từ camera
+    FACE_INDEX_BACKEND: str = "faiss"  # faiss (file FACE_INDEX_PATH) | pgvector (cột student_faces.embedding)
+    FACE_INDEX_PATH: str = "face.index"
+    FACE_INDEX_CHECKPOINT_SECONDS: float = 5.0  # thời gian chờ trước khi ghi index xuống file
+    FACE_INDEX_RELOAD_CHECK_SECONDS: float = 2.0  # chu kỳ kiểm tra file index bị worker khác thay đổi
+    FACE_INDEX_TYPE: str = "flat"  # flat | hnsw | ivf_flat | ivf_pq
+    FACE_INDEX_METRIC: str = "ip"  # ip (cosine, embedding đã chuẩn hóa) | l2
+    FACE_INDEX_HNSW_M: int = 32
+    FACE_INDEX_EF_CONSTRUCTION: int = 80
+    FACE_INDEX_EF_SEARCH: int = 64  # HNSW: càng lớn recall càng cao, càng chậm
+    FACE_INDEX_NLIST: int = 256  # IVF: số cụm
+    FACE_INDEX_NPROBE: int = 16  # IVF: số cụm được quét khi search
+    FACE_INDEX_PQ_M: int = 64  # IVF-PQ: số sub-quantizer (512 phải chia hết)
+    FACE_INDEX_PQ_NBITS: int = 8
+    FACE_INDEX_TRAIN_SIZE: int = 50000  # số embedding tối đa dùng để train IVF
+    # Ngưỡng cosine similarity để coi là cùng một người.
+    # 0.82 tương đương ngưỡng cũ sqrt(L2) < 0.6 trên vector chuẩn hóa (cos = 1 - 0.6^2 / 2)
+    FACE_COSINE_THRESHOLD: float = 0.82
+    # Nhiều ảnh khuôn mặt (template) cho mỗi sinh viên
+    FACE_TEMPLATES_MAX: int = 5
+    FACE_TEMPLATE_MODE: str = "all"  # all (mọi template trong index) | centroid (1 vector trung bình / sinh viên)
+    FACE_TEMPLATE_SEARCH_K: int = 10  # số kết quả k-NN gom theo sinh viên (chế độ all)
+    FACE_TEMPLATE_AGGREGATION: str = "max"  # max | mean similarity trên các template khớp của một sinh viên
+    FACE_INFERENCE_WORKERS: int = 2  # số thread chạy nhận diện song song
+    FACE_INFERENCE_QUEUE_SIZE: int = 16  # số request được xếp hàng thêm, vượt quá trả về 503
+    FACE_INFERENCE_TIMEOUT_SECONDS: float = 30.0
+    FACE_INFERENCE_TORCH_THREADS: int = 0  # số thread intra-op của torch, 0 = cpu_count / số worker
+    FACE_BATCH_ENABLED: bool = True  # gom các request embedding đồng thời thành một batch
+    FACE_BATCH_MAX_SIZE: int = 32  # số khuôn mặt tối đa mỗi batch
+    FACE_BATCH_MAX_WAIT_MS: float = 5.0  # thời gian chờ gom thêm request
+    FACE_CACHE_ENABLED: bool = True  # cache embedding theo hash nội dung ảnh
+    FACE_CACHE_MAX_ENTRIES: int = 1024  # áp dụng cho cả cache trong process và backend file / sqlite
+    FACE_CACHE_TTL_SECONDS: float = 300.0  # 0 = không hết hạn
+    FACE_CACHE_MAX_BYTES: int = 0  # giới hạn bytes của cache trong process và thư mục cache file, 0 = không giới hạn
+    FACE_CACHE_BACKEND: str = "memory"  # memory | file | sqlite (file/sqlite dùng chung giữa các worker)
+    FACE_CACHE_PATH: str = ""  # thư mục (file) hoặc file .sqlite3 (sqlite)
+    # Điểm danh liên tục từ Room.camera_stream_url; chỉ bật ở một worker
+    FACE_CAMERA_INGESTION_ENABLED: bool = False
+    FACE_CAMERA_PROCESS_FPS: float = 5.0  # số frame xử lý mỗi giây cho mỗi phòng
+    FACE_CAMERA_STALE_SECONDS: float = 2.0  # frame cũ hơn mức này bị bỏ qua
+    FACE_CAMERA_RECONNECT_SECONDS: float = 5.0
+    FACE_CAMERA_REFRESH_SECONDS: float = 60.0  # chu kỳ đọc lại danh sách phòng
+    FACE_CAMERA_SCHEDULE_CHECK_SECONDS: float = 30.0  # chu kỳ kiểm tra lịch học đang diễn ra
+    # Theo dõi khuôn mặt qua các frame: mỗi người chỉ embed vài lần rồi bỏ phiếu danh tính
+    FACE_TRACK_IOU_THRESHOLD: float = 0.3
+    FACE_TRACK_MAX_MISSED: int = 10  # số frame liên tiếp không thấy trước khi xóa track
+    FACE_TRACK_MAX_EMBEDDINGS: int = 3  # số lần embed tối đa mỗi track
+    FACE_TRACK_EMBED_INTERVAL: int = 3  # số frame gom lại để chọn frame tốt nhất cho mỗi lần embed
+    FACE_TRACK_MIN_VOTES: int = 2  # số phiếu cùng một sinh viên để chốt danh tính
+    # Cổng chất lượng trước khi embedding: bỏ khuôn mặt mờ, quá nhỏ, quay nghiêng
+    FACE_QUALITY_ENABLED: bool = True
+    FACE_QUALITY_MIN_SHARPNESS: float = 30.0  # phương sai Laplacian của khuôn mặt 112x112
+    FACE_QUALITY_MIN_FACE_SIZE: float = 32.0  # cạnh ngắn của box (pixel ảnh gốc)
+    FACE_QUALITY_MAX_YAW: float = 0.4  # 0 = nhìn thẳng, 1 = nghiêng hẳn
+    FACE_QUALITY_MAX_PITCH: float = 0.5
+    FACE_QUALITY_MIN_CONFIDENCE: float = 0.8  # độ tin cậy của detector
+
     model_config = SettingsConfigDict(
         env_file=str(BASE_DIR / ".env"),   # Đọc từ file .env
         env_file_encoding="utf-8",
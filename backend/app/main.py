@@ -4,6 +4,7 @@ import os
 
 from app.routers import test, rooms, programs, users, teacher, program_courses,schedules, students, enrollments, course_class, auth, courses, semesters, attendances
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.config import settings
 # Import models to ensure they are registered with SQLAlchemy
 import app.models
 
@@ -24,6 +25,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+def preload_face_models():
+    # Load model nhận diện một lần cho cả process thay vì mỗi request
+    if settings.FACE_PRELOAD_MODELS:
+        from app.services.face_service.detector.face_detector import get_detector
+        from app.services.face_service.embedding.model_registry import preload_models
+        preload_models()
+        get_detector()
+
+@app.on_event("startup")
+def start_camera_ingestion():
+    # Đọc camera của các phòng và điểm danh liên tục theo lịch học
+    if settings.FACE_CAMERA_INGESTION_ENABLED:
+        from app.services.face_service.camera_ingestion import camera_ingestion
+        camera_ingestion.start()
+
+@app.on_event("shutdown")
+def stop_camera_ingestion():
+    if settings.FACE_CAMERA_INGESTION_ENABLED:
+        from app.services.face_service.camera_ingestion import camera_ingestion
+        camera_ingestion.stop()
+
+@app.on_event("shutdown")
+def flush_face_index():
+    # Ghi các vector chưa lưu của FAISS index xuống file
+    from app.services.face_service.index.face_index import face_index
+    face_index.flush()
+
+@app.on_event("shutdown")
+def shutdown_inference_pool():
+    from app.services.face_service.inference_pool import inference_pool
+    inference_pool.shutdown()
+
 app.include_router(test.router, prefix="/api", tags=["Test"])
 app.include_router(rooms.router, prefix="/api", tags=["Rooms"])
 app.include_router(programs.router, prefix="/api", tags=["Programs"])
@@ -1,14 +1,34 @@
 # student_face.py
 from sqlalchemy import Column, Integer, Boolean, ForeignKey, LargeBinary, TIMESTAMP, text
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.types import UserDefinedType
 from app.database import Base
 
+EMBEDDING_DIM = 512  # AdaFace IR-101
+
+
+class Vector(UserDefinedType):
+    """Kiểu vector(n) của pgvector, giá trị dạng chuỗi '[x1,x2,...]'"""
+
+    cache_ok = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return f"vector({self.dim})"
+
+
 class StudentFace(Base):
     __tablename__ = "student_faces"
+    # face_id cũng là id của vector trong FAISS index (IndexIDMap2)
 
     face_id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     student_id = Column(Integer, ForeignKey("students.student_id", ondelete="CASCADE"), nullable=False, index=True)
     embedding_vector = Column(LargeBinary, nullable=True)  # lưu vector nhị phân
+    # Bản sao dạng pgvector cho FACE_INDEX_BACKEND=pgvector (migration add_student_faces_pgvector),
+    # deferred để các query thông thường không đọc cột này
+    embedding = deferred(Column(Vector(EMBEDDING_DIM), nullable=True))
     is_primary = Column(Boolean, default=False)
 
     created_at = Column(TIMESTAMP, server_default=text("CURRENT_TIMESTAMP"))
@@ -17,7 +37,6 @@ class StudentFace(Base):
         server_default=text("CURRENT_TIMESTAMP"),
         server_onupdate=text("CURRENT_TIMESTAMP")
     )
-    faiss_index = Column(Integer, nullable=True)
 
     # Quan hệ với bảng students
     student = relationship("Student", back_populates="student_faces")
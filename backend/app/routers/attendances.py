@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.schemas.attendance import AttendanceBulkMark
 from app.services import attendance_service
+from app.services.face_service.inference_pool import inference_pool
 
 router = APIRouter()
 
@@ -26,9 +29,10 @@ async def recognize_face(
         # Read file content
         image_content = await file.read()
         
-        # Process face recognition
-        result = attendance_service.search_face_by_image(image_content, schedule_id, db)
-        return result
+        # Chỉ inference chạy trong inference pool; truy vấn database chạy trong phạm vi request
+        # (session của get_db không được dùng tiếp sau khi request đã trả về 504)
+        query_vector = await inference_pool.run(attendance_service.embed_single_face, image_content)
+        return await run_in_threadpool(attendance_service.match_single_face, query_vector, schedule_id, db)
         
     except HTTPException:
         raise
@@ -37,6 +41,33 @@ async def recognize_face(
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
 
 
+@router.post("/attendances/face-recognition/batch", summary="Nhận diện nhiều sinh viên trong ảnh chụp cả lớp")
+async def recognize_faces_batch(
+    file: UploadFile = File(..., description="Ảnh chụp lớp học"),
+    schedule_id: int = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Nhận diện tất cả sinh viên trong một ảnh chụp lớp học
+
+    - **file**: Ảnh chụp cả lớp (JPG, PNG)
+    - **schedule_id**: ID lịch học để lưu điểm danh
+    - Trả về danh sách khuôn mặt và sinh viên khớp, ghi điểm danh một lần cho cả lớp
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File phải là ảnh (JPG, PNG, etc.)")
+
+    try:
+        image_content = await file.read()
+        bboxes, query_vectors = await inference_pool.run(attendance_service.embed_group_faces, image_content)
+        return await run_in_threadpool(attendance_service.match_group_faces, bboxes, query_vectors, schedule_id, db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in batch face recognition endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
+
+
 @router.post("/attendances/face-recognition-camera", summary="Nhận diện khuôn mặt sinh viên qua camera")
 def recognize_face_camera(
     schedule_id: int = None,
@@ -61,6 +92,26 @@ def recognize_face_camera(
         print(f"Error in camera recognition endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
     
+@router.get("/attendances/face-engine/status", summary="Trạng thái hệ thống nhận diện khuôn mặt")
+def get_face_engine_status():
+    """
+    Trạng thái hệ thống nhận diện khuôn mặt
+
+    - Các model đã load, thời gian load và bộ nhớ sử dụng
+    """
+    return attendance_service.get_face_engine_status()
+
+@router.get("/attendances/cameras/status", summary="Trạng thái điểm danh liên tục qua camera các phòng")
+def get_camera_ingestion_status():
+    """
+    Trạng thái dịch vụ đọc camera theo phòng
+
+    - Tốc độ đọc / xử lý frame (frame/s), độ trễ, số frame bị bỏ
+    - Lịch học đang diễn ra, số khuôn mặt khớp và số lượt điểm danh đã ghi
+    """
+    from app.services.face_service.camera_ingestion import camera_ingestion
+    return camera_ingestion.status()
+
 @router.get("/attendances/getStatus", summary="Lấy thông tin điểm danh theo ID")
 def get_attendance_status(
     student_id: int,
@@ -121,4 +172,21 @@ def mark_attendance(
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
+
+@router.post("/attendances/bulk", summary="Ghi nhận điểm danh cho nhiều sinh viên của một lịch học")
+def mark_attendances_bulk(payload: AttendanceBulkMark, db: Session = Depends(get_db)):
+    """
+    Ghi nhận điểm danh cho cả lớp trong một request.
+    - **attendances**: danh sách {student_id, status}, status là present / late / absent
+    - Sinh viên không thuộc lớp được báo lỗi riêng, các sinh viên khác vẫn được ghi.
+    - Trả về kết quả từng sinh viên.
+    """
+    try:
+        return attendance_service.mark_attendances_bulk(
+            payload.schedule_id, payload.attendances, payload.confirmed_by, db
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi server: {str(e)}")
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Form, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, Annotated
 import os
@@ -7,8 +8,11 @@ import uuid
 
 # Đảm bảo bạn đã import StudentCreate và StudentUpdate từ file schema của bạn
 from app.schemas.student import StudentCreate, StudentUpdate, Student as StudentSchema 
+from app.schemas.student_face import StudentFaceOut
 from app.database import get_db
 from app.services import student_service 
+from app.services import student_import_service
+from app.services.face_service.inference_pool import inference_pool
 
 # --- CONFIGURATION FOR FILE UPLOAD ---
 # Đảm bảo thư mục tồn tại và được cấu hình trong main.py
@@ -56,12 +60,39 @@ async def create_student_with_avatar(
 
     try:
         student_obj = StudentCreate(**data_dict)
-        return student_service.create_student(db, student_obj)
+        # Chỉ tạo embedding trong inference pool; ghi database chạy trong phạm vi request
+        # (session của get_db không được dùng tiếp sau khi request đã trả về 504)
+        emb = await inference_pool.run(student_service.embed_avatar, student_obj.avatar)
+        return await run_in_threadpool(student_service.create_student, db, student_obj, emb)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error in create_student endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Lỗi server nội bộ: {str(e)}")
+
+@router.post("/students/import")
+async def import_students(
+    csv_file: UploadFile = File(..., description="CSV thông tin sinh viên, cột avatar là tên file ảnh trong zip"),
+    avatars_zip: UploadFile = File(..., description="File zip chứa ảnh đại diện"),
+    db: Session = Depends(get_db)
+):
+    """
+    Import sinh viên hàng loạt, trả về kết quả từng dòng CSV
+    """
+    csv_bytes = await csv_file.read()
+    zip_bytes = await avatars_zip.read()
+    try:
+        # Chạy ngoài inference pool: một lần import có thể vượt timeout của request nhận diện
+        return await run_in_threadpool(student_import_service.import_students, db, csv_bytes, zip_bytes, UPLOAD_DIR)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error in import_students endpoint: {e}")
+        raise HTTPException(status_code=500, detail=f"Lỗi server nội bộ: {str(e)}")
 # ==============================================================================
 
 @router.get("/students/{student_id}", response_model=StudentSchema)
@@ -71,6 +102,21 @@ def get_student(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Student not found")
     return student
 
+@router.post("/students/{student_id}/faces", response_model=StudentFaceOut, status_code=201)
+async def add_student_face(student_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    """
+    Thêm ảnh khuôn mặt (template) cho sinh viên, vd: ảnh đeo kính, ánh sáng khác
+    """
+    content = await file.read()
+    try:
+        emb = await inference_pool.run(student_service.embed_face_image, content, True)
+        face = await run_in_threadpool(student_service.add_student_face, db, student_id, emb)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if face is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return face
+
 @router.put("/students/{student_id}", response_model=StudentSchema)
 def update_student(student_id: int, payload: StudentUpdate, db: Session = Depends(get_db)):
     student = student_service.update_student(db, student_id, payload)
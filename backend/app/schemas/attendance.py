@@ -1,18 +1,18 @@
 from pydantic import BaseModel, Field
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 
 class AttendanceBase(BaseModel):
     student_id: int
     schedule_id: int
     date: date
-    status: str = Field(..., regex="^(present|absent|late)$")
+    status: str = Field(..., pattern="^(present|absent|late)$")
 
 class AttendanceCreate(AttendanceBase):
     pass
 
 class AttendanceUpdate(BaseModel):
-    status: Optional[str] = Field(None, regex="^(present|absent|late)$")
+    status: Optional[str] = Field(None, pattern="^(present|absent|late)$")
     confirmed_at: Optional[datetime]
     confirmed_by: Optional[int]
 
@@ -27,4 +27,13 @@ class AttendanceInDBBase(AttendanceBase):
         orm_mode = True
 
 class Attendance(AttendanceInDBBase):
-    pass
\ No newline at end of file
+    pass
+
+class AttendanceBulkItem(BaseModel):
+    student_id: int
+    status: str = Field(..., pattern="^(present|absent|late)$")
+
+class AttendanceBulkMark(BaseModel):
+    schedule_id: int
+    confirmed_by: int = 1  # ID giảng viên, tạm mặc định như /attendances/mark
+    attendances: List[AttendanceBulkItem] = Field(..., min_length=1)
@@ -7,7 +7,6 @@ from datetime import datetime
 class StudentFaceBase(BaseModel):
     student_id: int
     is_primary: Optional[bool] = False
-    faiss_index: Optional[int] = None
 
 
 # ----- Schema khi tạo mới -----
@@ -21,7 +20,6 @@ class StudentFaceUpdate(BaseModel):
     student_id: Optional[int] = None
     embedding_vector: Optional[bytes] = None
     is_primary: Optional[bool] = None
-    faiss_index: Optional[int] = None
 
 
 # ----- Schema trả ra khi đọc -----
@@ -31,4 +29,4 @@ class StudentFaceOut(StudentFaceBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
+        from_attributes = True
@@ -1,10 +1,11 @@
 import os
 import numpy as np
-import faiss
 import cv2
 import time
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, delete, func, literal_column, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
 from fastapi import HTTPException
 
 from app.schemas import schedule, user
@@ -12,46 +13,255 @@ from app.schemas import schedule, user
 # Set environment variable để tránh lỗi OpenMP
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-from app.services.face_service.embedding.face_embedding import get_face_embedding
+from app.services.face_service.embedding.face_embedding import (
+    embed_faces,
+    embedding_cache,
+    get_face_embedding,
+    get_face_embeddings,
+    micro_batcher,
+)
+from app.services.face_service.embedding.model_registry import get_model_stats
+from app.services.face_service.detector.face_detector import get_detector
+from app.services.face_service.tracking import create_tracker
+from app.services.face_service.quality import quality_gate
+from app.services.face_service.index.face_index import face_index
+from app.services.face_service.inference_pool import inference_pool
+from app.core.config import settings
 from app.models.student_faces import StudentFace 
 from app.models.student import Student
 from app.models.course_class import CourseClass
 from app.models.attendance import Attendance
 from app.models.schedule import Schedule
 from app.models.enrollment import Enrollment
+from app.models.period import Period
 
-FAISS_INDEX_PATH = "face.index"
-RECOGNITION_THRESHOLD = 0.6  # ngưỡng khớp (càng nhỏ càng khớp, L2 distance)
+RECOGNITION_THRESHOLD = settings.FACE_COSINE_THRESHOLD  # ngưỡng khớp (cosine similarity, càng lớn càng khớp)
 CAMERA_TIMEOUT = 15  # thời gian tối đa quét camera (giây)
 
 # ==============================================================================
 # UTILITY FUNCTIONS
 # ==============================================================================
 
-def load_faiss_index():
-    """Load FAISS index từ file"""
-    if not os.path.exists(FAISS_INDEX_PATH):
-        raise ValueError("Không tìm thấy file FAISS index. Vui lòng tạo ít nhất một sinh viên trước.")
-    return faiss.read_index(FAISS_INDEX_PATH)
+def normalize_embeddings(embeddings) -> np.ndarray:
+    """Chuẩn hóa L2 từng dòng của ma trận embedding [n, d]"""
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms)
+
+def student_to_dict(student: Student) -> dict:
+    return {
+        "student_id": student.student_id,
+        "student_code": student.student_code,
+        "full_name": f"{student.last_name} {student.first_name}",
+        "email": student.email,
+        "avatar": student.avatar
+    }
+
+def get_roster_face_ids(schedule_id: int, db: Session):
+    """
+    Lấy face_id (id trong FAISS index) của sinh viên đăng ký lớp học phần đang học theo lịch
+
+    Returns:
+        list | None: None nếu không có schedule_id (tìm trên toàn bộ index)
+    """
+    if not schedule_id:
+        return None
+
+    rows = db.query(StudentFace.face_id).join(
+        Enrollment, Enrollment.student_id == StudentFace.student_id
+    ).join(
+        Schedule, Schedule.course_class_id == Enrollment.course_class_id
+    ).filter(
+        Schedule.schedule_id == schedule_id
+    ).all()
+
+    roster_ids = [face_id for (face_id,) in rows]
+    if not roster_ids:
+        raise ValueError("Lớp học không có sinh viên nào đã đăng ký khuôn mặt.")
+    return roster_ids
+
+def template_search_k() -> int:
+    """Số kết quả k-NN cần lấy: nhiều template / sinh viên thì lấy k kết quả để gom theo sinh viên"""
+    return settings.FACE_TEMPLATE_SEARCH_K if settings.FACE_TEMPLATE_MODE == "all" else 1
+
+def search_roster(query_vectors, schedule_id: int, db: Session, k: int = 1):
+    """
+    k-NN trong sinh viên của lớp học theo lịch
+
+    Backend pgvector lọc danh sách lớp ngay trong câu SQL (join enrollments),
+    FAISS lọc theo danh sách face_id lấy từ database.
+    """
+    if schedule_id and face_index.backend == "pgvector":
+        return face_index.search_schedule(query_vectors, schedule_id, k=k)
+    return face_index.search(query_vectors, k=k, ids=get_roster_face_ids(schedule_id, db))
+
+def aggregate_matches(S, I, db: Session):
+    """
+    Gom kết quả k-NN theo sinh viên, chọn sinh viên có điểm cao nhất cho mỗi truy vấn
+
+    Điểm của sinh viên là max hoặc mean (FACE_TEMPLATE_AGGREGATION) similarity
+    trên các template của sinh viên đó nằm trong k kết quả.
+
+    Returns:
+        list: (face_id khớp nhất, similarity, student_id) cho mỗi truy vấn, (-1, -1.0, None) nếu không có kết quả
+    """
+    hit_ids = {int(face_id) for face_id in np.asarray(I).ravel() if face_id >= 0}
+    student_by_face = {}
+    if hit_ids:
+        student_by_face = dict(
+            db.query(StudentFace.face_id, StudentFace.student_id).filter(StudentFace.face_id.in_(hit_ids)).all()
+        )
+
+    aggregate = np.mean if settings.FACE_TEMPLATE_AGGREGATION == "mean" else np.max
+    results = []
+    for scores, face_ids in zip(S, I):
+        hits_by_student = {}
+        for similarity, face_id in zip(scores, face_ids):
+            student_id = student_by_face.get(int(face_id))
+            if face_id >= 0 and student_id is not None:
+                hits_by_student.setdefault(student_id, []).append((float(similarity), int(face_id)))
+        if not hits_by_student:
+            results.append((-1, -1.0, None))
+            continue
+        student_id, hits = max(hits_by_student.items(), key=lambda item: aggregate([h[0] for h in item[1]]))
+        results.append((max(hits)[1], float(aggregate([h[0] for h in hits])), student_id))
+    return results
+
+def identify_embeddings(embeddings, roster_ids, db: Session):
+    """
+    Tìm sinh viên khớp cho từng embedding trong danh sách lớp
+
+    Returns:
+        list: (face_id, similarity, student_id hoặc None nếu dưới ngưỡng) cho mỗi embedding
+    """
+    S, I = face_index.search(normalize_embeddings(embeddings), k=template_search_k(), ids=roster_ids)
+    return [
+        (face_id, similarity, student_id if similarity >= RECOGNITION_THRESHOLD else None)
+        for face_id, similarity, student_id in aggregate_matches(S, I, db)
+    ]
+
+def select_track_faces(tracker, tracks, rgb_frame, detector):
+    """
+    Căn chỉnh khuôn mặt của các track chưa chốt danh tính, qua cổng chất lượng,
+    mỗi track giữ frame tốt nhất cho tới lượt embed
+
+    Returns:
+        tuple: (các track cần embedding, khuôn mặt đã align tương ứng)
+    """
+    open_tracks = [track for track in tracks if not track.closed]
+    if not open_tracks:
+        return [], []
+    faces = detector.align_faces(rgb_frame, [track.landmarks for track in open_tracks])
+    for track, face in zip(open_tracks, faces):
+        if quality_gate.enabled:
+            report = quality_gate.assess(face, track.box, track.landmarks)
+            if not report["passed"]:
+                continue
+            track.offer(face, report["score"])
+        else:
+            track.offer(face, float(track.box[4]))
+    pending = [track for track in open_tracks if tracker.needs_embedding(track)]
+    return pending, [track.take_candidate() for track in pending]
+
+def upsert_attendances(schedule_id: int, statuses: dict, db: Session, confirmed_by: int = 1,
+                       overwrite: bool = True, commit: bool = True):
+    """
+    Ghi điểm danh hôm nay cho nhiều sinh viên bằng một câu lệnh
+    INSERT ... ON CONFLICT (student_id, schedule_id, date) DO UPDATE
+
+    statuses: {student_id: status}
+    overwrite=False: bản ghi đã có giữ nguyên trạng thái và thời điểm xác nhận, chỉ cập nhật
+    updated_at (nhận diện lặp lại không ghi đè điểm danh thủ công và không lỗi unique).
+
+    Returns:
+        dict: {student_id: (confirmed_at, confirmed_by, True nếu vừa tạo mới)}
+    """
+    if not statuses:
+        return {}
+    now = datetime.now()
+    stmt = pg_insert(Attendance).values([
+        {
+            "student_id": student_id,
+            "schedule_id": schedule_id,
+            "date": now.date(),
+            "status": status,
+            "confirmed_at": now,
+            "confirmed_by": confirmed_by
+        }
+        for student_id, status in statuses.items()
+    ])
+    # onupdate của updated_at không áp dụng cho nhánh ON CONFLICT, phải gán tường minh
+    set_ = {"updated_at": func.current_timestamp()}
+    if overwrite:
+        set_.update(status=stmt.excluded.status, confirmed_at=stmt.excluded.confirmed_at,
+                    confirmed_by=stmt.excluded.confirmed_by)
+    stmt = stmt.on_conflict_do_update(constraint="unique_student_schedule_date", set_=set_).returning(
+        Attendance.student_id,
+        Attendance.confirmed_at,
+        Attendance.confirmed_by,
+        literal_column("xmax = 0").label("inserted"),  # xmax = 0: dòng mới, không phải dòng được update
+    )
+    rows = db.execute(stmt).all()
+    if commit:
+        db.commit()
+    return {student_id: (confirmed_at, confirmed, inserted) for student_id, confirmed_at, confirmed, inserted in rows}
+
+def record_attendances(schedule_id: int, student_ids, db: Session):
+    """
+    Ghi điểm danh "present" hôm nay cho nhiều sinh viên bằng một câu lệnh upsert
+
+    Sinh viên đã được điểm danh thì giữ nguyên bản ghi. Trả về danh sách student_id vừa ghi mới.
+    """
+    written = upsert_attendances(schedule_id, dict.fromkeys(student_ids, "present"), db, overwrite=False)
+    return [sid for sid in student_ids if written.get(sid, (None, None, False))[2]]
+
+def get_current_schedule(room_id: int, db: Session, now: datetime = None):
+    """Lịch học đang diễn ra trong phòng tại thời điểm now (mặc định: bây giờ), không có thì None"""
+    now = now or datetime.now()
+    start_period = aliased(Period)
+    end_period = aliased(Period)
+    return (
+        db.query(Schedule)
+        .join(start_period, Schedule.period_start == start_period.period_id)
+        .join(end_period, Schedule.period_end == end_period.period_id)
+        .filter(
+            Schedule.room_id == room_id,
+            or_(
+                Schedule.specific_date == now.date(),
+                and_(Schedule.specific_date.is_(None), Schedule.day_of_week == now.isoweekday())
+            ),
+            start_period.start_time <= now.time(),
+            end_period.end_time >= now.time()
+        )
+        .order_by(Schedule.specific_date.desc().nulls_last())
+        .first()
+    )
+
+def get_face_engine_status():
+    """Trạng thái các thành phần nhận diện khuôn mặt (model đã load, thời gian load, bộ nhớ)"""
+    return {
+        "models": get_model_stats(),
+        "index": face_index.stats(),
+        "inference_pool": inference_pool.stats(),
+        "micro_batcher": micro_batcher.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "quality_gate": quality_gate.stats()
+    }
 
 # ==============================================================================
 # FACE RECOGNITION SERVICES
 # ==============================================================================
 
-def search_face_by_image(image_content: bytes, schedule_id: int, db: Session):
+def embed_single_face(image_content: bytes) -> np.ndarray:
     """
-    Tìm kiếm sinh viên qua ảnh khuôn mặt
-    
-    Args:
-        image_content: Nội dung file ảnh dạng bytes
-        db: Database session
-        
+    Phần inference của nhận diện qua ảnh (chạy trong inference pool, không dùng database)
+
     Returns:
-        dict: Thông tin sinh viên khớp và độ tương đồng
+        np.ndarray: embedding đã chuẩn hóa [1, d]
     """
-    # 1. Tạo embedding từ ảnh
     try:
-        embedding = get_face_embedding(image_content)
+        embedding = get_face_embedding(image_content, profile=settings.FACE_PROFILE_SINGLE, quality=True)
         if embedding is None:
             raise ValueError("Không phát hiện khuôn mặt trong ảnh.")
 
@@ -62,61 +272,45 @@ def search_face_by_image(image_content: bytes, schedule_id: int, db: Session):
             raise ValueError("Embedding không hợp lệ.")
         embedding /= norm
         
-        query_vector = embedding.reshape(1, -1)
+        return embedding.reshape(1, -1)
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Lỗi xử lý ảnh: {str(e)}")
 
-    # 2. Tìm kiếm trong FAISS index
+def match_single_face(query_vector: np.ndarray, schedule_id: int, db: Session):
+    """Phần database của nhận diện qua ảnh: tìm sinh viên khớp và ghi điểm danh"""
+    # 2. Tìm kiếm trong FAISS index (đã load sẵn trong bộ nhớ), chỉ trong sinh viên của lớp
     try:
-        index = load_faiss_index()
-        
-        # Tìm k=1 kết quả gần nhất
-        D, I = index.search(query_vector, k=1)
+        # k kết quả gần nhất, gom theo sinh viên (mỗi sinh viên có thể có nhiều template)
+        S, I = search_roster(query_vector, schedule_id, db, k=template_search_k())
         
-        # D[0][0] là khoảng cách L2 bình phương, cần sqrt
-        distance = float(np.sqrt(D[0][0]))
-        faiss_idx = int(I[0][0])
+        # similarity là cosine similarity giữa hai embedding đã chuẩn hóa
+        face_id, similarity, student_id = aggregate_matches(S, I, db)[0]
         
-        print(f"FAISS search result - Index: {faiss_idx}, Distance: {distance}")
+        print(f"FAISS search result - Face ID: {face_id}, Similarity: {similarity}")
+        if face_id < 0:
+            raise ValueError("Không tìm thấy sinh viên phù hợp trong lớp học.")
         
     except ValueError as ve:
         raise HTTPException(status_code=404, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi tìm kiếm FAISS: {str(e)}")
 
-    # 3. Tìm student face record từ faiss_index
-    embedding_match = db.query(StudentFace).filter(StudentFace.faiss_index == faiss_idx).first()
-    if not embedding_match:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"Không tìm thấy embedding tương ứng với FAISS index {faiss_idx}."
-        )
-
-    # 4. Tìm thông tin sinh viên
-    student = db.query(Student).filter(Student.student_id == embedding_match.student_id).first()
+    # 3. Tìm thông tin sinh viên
+    student = db.query(Student).filter(Student.student_id == student_id).first()
     if not student:
         raise HTTPException(
             status_code=404, 
-            detail=f"Không tìm thấy sinh viên với ID {embedding_match.student_id}."
+            detail=f"Không tìm thấy sinh viên với ID {student_id}."
         )
 
     # 5. Kiểm tra ngưỡng khớp
-    is_match = distance < RECOGNITION_THRESHOLD
-    confidence = max(0, min(100, (1 - distance) * 100))  # Chuyển thành % confidence
-
-    if is_match:
-        attendance = Attendance(
-            student_id=student.student_id,
-            schedule_id=schedule_id,
-            date=datetime.now().date(),
-            status="present",
-            confirmed_at=datetime.now(),
-            confirmed_by=1
-        )
-        db.add(attendance)
-        db.commit()
+    is_match = similarity >= RECOGNITION_THRESHOLD
+    confidence = max(0, min(100, similarity * 100))  # Chuyển thành % confidence
+
+    if is_match and schedule_id:
+        record_attendances(schedule_id, [student.student_id], db)
 
     return {
         "matched": is_match,
@@ -128,14 +322,122 @@ def search_face_by_image(image_content: bytes, schedule_id: int, db: Session):
             "avatar": student.avatar
         },
         "recognition_details": {
-            "distance": round(distance, 4),
+            "similarity": round(similarity, 4),
             "confidence": round(confidence, 2),
             "threshold": RECOGNITION_THRESHOLD,
-            "faiss_index": faiss_idx
+            "face_id": face_id
         },
-        "message": "✅ Nhận diện thành công!" if is_match else f"⚠️ Độ tương đồng thấp (distance: {distance:.4f} >= threshold: {RECOGNITION_THRESHOLD})"
+        "message": "✅ Nhận diện thành công!" if is_match else f"⚠️ Độ tương đồng thấp (similarity: {similarity:.4f} < threshold: {RECOGNITION_THRESHOLD})"
     }
 
+def search_face_by_image(image_content: bytes, schedule_id: int, db: Session):
+    """
+    Tìm kiếm sinh viên qua ảnh khuôn mặt
+    
+    Args:
+        image_content: Nội dung file ảnh dạng bytes
+        db: Database session
+        
+    Returns:
+        dict: Thông tin sinh viên khớp và độ tương đồng
+    """
+    # 1. Tạo embedding từ ảnh, 2-5. tìm kiếm và ghi điểm danh
+    return match_single_face(embed_single_face(image_content), schedule_id, db)
+
+
+def embed_group_faces(image_content: bytes):
+    """
+    Phần inference của nhận diện ảnh cả lớp (chạy trong inference pool, không dùng database)
+
+    Returns:
+        (bboxes, query_vectors): khung và embedding đã chuẩn hóa của từng khuôn mặt
+    """
+    try:
+        bboxes, embeddings = get_face_embeddings(image_content, profile=settings.FACE_PROFILE_GROUP, quality=True)
+        if embeddings is None:
+            raise ValueError("Không phát hiện khuôn mặt đủ chất lượng trong ảnh.")
+        return bboxes, normalize_embeddings(embeddings)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Lỗi xử lý ảnh: {str(e)}")
+
+def match_group_faces(bboxes, query_vectors: np.ndarray, schedule_id: int, db: Session):
+    """Phần database của nhận diện ảnh cả lớp: tìm sinh viên khớp và ghi điểm danh một lần"""
+    # 2. Một lần k-NN cho cả ma trận, chỉ trong sinh viên của lớp
+    try:
+        S, I = search_roster(query_vectors, schedule_id, db, k=template_search_k())
+        matches = aggregate_matches(S, I, db)
+    except ValueError as ve:
+        raise HTTPException(status_code=404, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Lỗi tìm kiếm FAISS: {str(e)}")
+
+    # 3. Tra cứu sinh viên khớp bằng một query
+    student_ids = {student_id for _, _, student_id in matches if student_id is not None}
+    students = {}
+    if student_ids:
+        students = {
+            student.student_id: student
+            for student in db.query(Student).filter(Student.student_id.in_(student_ids)).all()
+        }
+
+    # 4. Mỗi sinh viên chỉ giữ khuôn mặt có độ tương đồng cao nhất
+    faces = []
+    best_by_student = {}
+    for face_no, (bbox, (face_id, similarity, student_id)) in enumerate(zip(bboxes, matches)):
+        student = students.get(student_id)
+        is_match = student is not None and similarity >= RECOGNITION_THRESHOLD
+        confidence = max(0, min(100, similarity * 100))
+        faces.append({
+            "face_no": face_no,
+            "bbox": [round(float(v), 1) for v in bbox[:4]],
+            "matched": is_match,
+            "student": student_to_dict(student) if is_match else None,
+            "recognition_details": {
+                "similarity": round(similarity, 4),
+                "confidence": round(confidence, 2),
+                "threshold": RECOGNITION_THRESHOLD,
+                "face_id": face_id
+            }
+        })
+        if is_match:
+            best = best_by_student.get(student.student_id)
+            if best is None or similarity > best:
+                best_by_student[student.student_id] = similarity
+
+    # 5. Ghi điểm danh cho tất cả sinh viên khớp bằng một câu upsert
+    recorded_ids = []
+    if schedule_id and best_by_student:
+        recorded_ids = record_attendances(schedule_id, list(best_by_student), db)
+
+    return {
+        "total_faces": len(faces),
+        "matched_students": len(best_by_student),
+        "recorded_attendances": len(recorded_ids),
+        "faces": faces,
+        "message": f"✅ Nhận diện {len(best_by_student)}/{len(faces)} khuôn mặt"
+    }
+
+def search_faces_by_image_batch(image_content: bytes, schedule_id: int, db: Session):
+    """
+    Nhận diện tất cả sinh viên trong một ảnh chụp cả lớp
+
+    Toàn bộ khuôn mặt được embedding trong một batch, tìm kiếm FAISS một lần
+    cho cả ma trận và ghi điểm danh bằng một câu lệnh upsert.
+
+    Args:
+        image_content: Nội dung file ảnh dạng bytes
+        schedule_id: ID lịch học để lưu điểm danh
+        db: Database session
+
+    Returns:
+        dict: Danh sách khuôn mặt phát hiện được và sinh viên khớp
+    """
+    # 1. Phát hiện + embedding tất cả khuôn mặt, 2-5. tìm kiếm và ghi điểm danh
+    bboxes, query_vectors = embed_group_faces(image_content)
+    return match_group_faces(bboxes, query_vectors, schedule_id, db)
+
 
 def search_face_by_camera(schedule_id: int, db: Session, timeout: int = CAMERA_TIMEOUT):
     """
@@ -159,9 +461,10 @@ def search_face_by_camera(schedule_id: int, db: Session, timeout: int = CAMERA_T
     frame_count = 0
     
     try:
-        # Load FAISS index
-        index = load_faiss_index()
-        
+        roster_ids = get_roster_face_ids(schedule_id, db)
+        detector = get_detector()
+        tracker = create_tracker()
+
         print(f"[CAMERA] Bắt đầu quét camera trong {timeout} giây...")
         
         while time.time() - start_time < timeout:
@@ -172,65 +475,41 @@ def search_face_by_camera(schedule_id: int, db: Session, timeout: int = CAMERA_T
             
             frame_count += 1
             
-            # Chỉ xử lý mỗi 5 frames để tăng hiệu suất
-            if frame_count % 5 != 0:
+            # Frame chỉ tốn detection nhờ tracker, xử lý mỗi 2 frames
+            if frame_count % 2 != 0:
                 continue
             
             try:
-                # Chuyển frame sang bytes
-                _, buffer = cv2.imencode('.jpg', frame)
-                image_bytes = buffer.tobytes()
-                
-                # Lấy embedding từ frame
-                embedding = get_face_embedding(image_bytes)
-                if embedding is None:
-                    continue
-                
-                # Chuẩn hóa embedding
-                embedding = np.array(embedding, dtype=np.float32).flatten()
-                norm = np.linalg.norm(embedding)
-                if norm == 0:
-                    continue
-                embedding /= norm
-                
-                query_vector = embedding.reshape(1, -1)
-                
-                # Tìm kiếm trong FAISS
-                D, I = index.search(query_vector, k=1)
-                distance = float(np.sqrt(D[0][0]))
-                faiss_idx = int(I[0][0])
+                # Frame BGR -> RGB, đưa thẳng mảng vào pipeline (không encode/decode JPEG)
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 
-                print(f"[CAMERA] Frame {frame_count}: Distance={distance:.4f}, Threshold={RECOGNITION_THRESHOLD}")
+                # Mỗi frame chỉ chạy detection + chấm chất lượng, track chưa đủ phiếu
+                # mới được embed bằng frame tốt nhất của nó
+                boxes, landmarks = detector.detect(rgb_frame, settings.FACE_PROFILE_CAMERA)
+                tracks = tracker.update(boxes, landmarks)
+                pending, faces = select_track_faces(tracker, tracks, rgb_frame, detector)
+                if pending:
+                    matches = identify_embeddings(embed_faces(faces), roster_ids, db)
+                    for track, (face_id, similarity, student_id) in zip(pending, matches):
+                        tracker.add_vote(track, student_id, similarity, face_id)
+                        print(f"[CAMERA] Frame {frame_count}, track {track.track_id}: Similarity={similarity:.4f}, Threshold={RECOGNITION_THRESHOLD}")
                 
-                # Kiểm tra ngưỡng
-                if distance >= RECOGNITION_THRESHOLD:
+                identified = next((track for track in tracks if track.identity is not None), None)
+                if identified is None:
                     continue
+                similarity, face_id = identified.match_details()
                 
-                # Tìm student từ faiss_index
-                embedding_match = db.query(StudentFace).filter(StudentFace.faiss_index == faiss_idx).first()
-                if not embedding_match:
-                    continue
-                
-                print(f"[CAMERA] Tìm thấy embedding match với FAISS index {faiss_idx}")
-                student = db.query(Student).filter(Student.student_id == embedding_match.student_id).first()
+                student = db.query(Student).filter(Student.student_id == identified.identity).first()
                 if not student:
                     continue
+                print(f"[CAMERA] Track {identified.track_id} khớp face_id {face_id} sau {identified.embeddings} lần embed")
                 
                 # Tìm thấy sinh viên khớp!
-                confidence = max(0, min(100, (1 - distance) * 100))
+                confidence = max(0, min(100, similarity * 100))
                 
                 # Lưu điểm danh nếu có schedule_id
                 if schedule_id:
-                    attendance = Attendance(
-                        student_id=student.student_id,
-                        schedule_id=schedule_id,
-                        date=datetime.now().date(),
-                        status="present",
-                        confirmed_at=datetime.now(),
-                        confirmed_by=1
-                    )
-                    db.add(attendance)
-                    db.commit()
+                    record_attendances(schedule_id, [student.student_id], db)
                 
                 found_student = {
                     "matched": True,
@@ -242,10 +521,10 @@ def search_face_by_camera(schedule_id: int, db: Session, timeout: int = CAMERA_T
                         "avatar": student.avatar
                     },
                     "recognition_details": {
-                        "distance": round(distance, 4),
+                        "similarity": round(similarity, 4),
                         "confidence": round(confidence, 2),
                         "threshold": RECOGNITION_THRESHOLD,
-                        "faiss_index": faiss_idx,
+                        "face_id": face_id,
                         "frames_processed": frame_count
                     },
                     "message": "✅ Nhận diện thành công qua camera!"
@@ -397,16 +676,14 @@ def mark_attendance(schedule_id: int, student_id: int, status: str, confirmed_by
     - Nếu status = 'absent' → xóa bản ghi nếu tồn tại
     """
     try:
-        attendance = db.query(Attendance).filter(
-            Attendance.schedule_id == schedule_id,
-            Attendance.student_id == student_id
-        ).first()
-
-        # ✅ Nếu là vắng mặt → xóa bản ghi nếu có
+        # ✅ Nếu là vắng mặt → xóa bản ghi hôm nay nếu có (một câu DELETE, cùng ngày upsert ghi)
         if status == "absent":
-            if attendance:
-                db.delete(attendance)
-                db.commit()
+            db.query(Attendance).filter(
+                Attendance.schedule_id == schedule_id,
+                Attendance.student_id == student_id,
+                Attendance.date == datetime.now().date()
+            ).delete(synchronize_session=False)
+            db.commit()
             return {
                 "student_id": student_id,
                 "schedule_id": schedule_id,
@@ -414,31 +691,86 @@ def mark_attendance(schedule_id: int, student_id: int, status: str, confirmed_by
                 "message": "Đã ghi nhận vắng mặt (xóa bản ghi)"
             }
 
-        # ✅ Nếu là có mặt → thêm hoặc cập nhật
-        if attendance:
-            attendance.status = "present"
-            attendance.confirmed_at = datetime.now()
-            attendance.confirmed_by = confirmed_by
-        else:
-            attendance = Attendance(
-                student_id=student_id,
-                schedule_id=schedule_id,
-                date=datetime.now().date(),
-                status="present",
-                confirmed_at=datetime.now(),
-                confirmed_by=confirmed_by
-            )
-            db.add(attendance)
-
-        db.commit()
+        # ✅ Nếu là có mặt → thêm hoặc cập nhật bằng một câu upsert
+        confirmed_at, confirmed, _ = upsert_attendances(
+            schedule_id, {student_id: "present"}, db, confirmed_by=confirmed_by
+        )[student_id]
 
         return {
             "student_id": student_id,
             "schedule_id": schedule_id,
             "status": "present",
-            "confirmed_at": attendance.confirmed_at.isoformat(),
-            "confirmed_by": attendance.confirmed_by
+            "confirmed_at": confirmed_at.isoformat(),
+            "confirmed_by": confirmed
         }
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Lỗi đánh dấu điểm danh: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Lỗi đánh dấu điểm danh: {str(e)}")
+
+def mark_attendances_bulk(schedule_id: int, items, confirmed_by: int, db: Session):
+    """
+    Đánh dấu điểm danh cho nhiều sinh viên của một lịch học trong một transaction
+
+    - Kiểm tra lịch học và danh sách lớp bằng một query
+    - 'present' / 'late' → một câu upsert cho tất cả sinh viên
+    - 'absent' → một câu DELETE bản ghi hôm nay (giống mark_attendance), ngày khác giữ nguyên
+    Sinh viên xuất hiện nhiều lần thì lấy trạng thái cuối cùng.
+
+    Returns:
+        dict: Tổng kết và kết quả từng sinh viên
+    """
+    statuses = {item.student_id: item.status for item in items}
+
+    # Outer join để phân biệt lịch học không tồn tại với sinh viên không thuộc lớp
+    rows = db.query(Schedule.schedule_id, Enrollment.student_id).outerjoin(
+        Enrollment, and_(
+            Enrollment.course_class_id == Schedule.course_class_id,
+            Enrollment.student_id.in_(list(statuses))
+        )
+    ).filter(Schedule.schedule_id == schedule_id).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy lịch học với ID {schedule_id}.")
+    enrolled = {student_id for _, student_id in rows if student_id is not None}
+
+    marked = {sid: status for sid, status in statuses.items() if sid in enrolled and status != "absent"}
+    absent_ids = [sid for sid, status in statuses.items() if sid in enrolled and status == "absent"]
+    try:
+        written = upsert_attendances(schedule_id, marked, db, confirmed_by=confirmed_by, commit=False)
+        deleted = set()
+        if absent_ids:
+            deleted = set(db.execute(
+                delete(Attendance).where(
+                    Attendance.schedule_id == schedule_id,
+                    Attendance.student_id.in_(absent_ids),
+                    Attendance.date == datetime.now().date()
+                ).returning(Attendance.student_id)
+            ).scalars())
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Lỗi đánh dấu điểm danh: {str(e)}")
+
+    results = []
+    for student_id, status in statuses.items():
+        result = {"student_id": student_id, "status": status, "success": student_id in enrolled}
+        if student_id not in enrolled:
+            result["error"] = "Sinh viên không thuộc lớp của lịch học"
+        elif status == "absent":
+            result["action"] = "deleted" if student_id in deleted else "unchanged"
+        else:
+            confirmed_at, confirmed, inserted = written[student_id]
+            result.update({
+                "action": "created" if inserted else "updated",
+                "confirmed_at": confirmed_at.isoformat(),
+                "confirmed_by": confirmed
+            })
+        results.append(result)
+
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "schedule_id": schedule_id,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results
+    }
@@ -0,0 +1,539 @@
+"""
+Benchmark các thành phần nhận diện khuôn mặt
+
+Chạy từ thư mục backend:
+    python -m app.services.face_service.benchmark index
+    python -m app.services.face_service.benchmark index --synthetic 200000
+    python -m app.services.face_service.benchmark vector-backends --schedule-id 12
+    python -m app.services.face_service.benchmark detection --images ./classroom_photos
+    python -m app.services.face_service.benchmark nms
+    python -m app.services.face_service.benchmark pipeline --image photo.jpg
+    python -m app.services.face_service.benchmark quality --images ./camera_frames
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+import faiss
+import numpy as np
+
+from app.services.face_service.index.index_factory import (
+    INDEX_TYPES,
+    METRICS,
+    base_index,
+    build_index,
+    min_train_size,
+    search_parameters,
+)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def load_stored_embeddings():
+    """Đọc toàn bộ embedding trong bảng student_faces -> (ids, vectors)"""
+    import app.models  # noqa: F401
+    from app.database import SessionLocal
+    from app.models.student_faces import StudentFace
+
+    db = SessionLocal()
+    try:
+        rows = db.query(StudentFace.face_id, StudentFace.embedding_vector).filter(
+            StudentFace.embedding_vector.isnot(None)
+        ).all()
+    finally:
+        db.close()
+    if not rows:
+        raise ValueError("Không có embedding nào trong bảng student_faces.")
+    ids = np.array([face_id for face_id, _ in rows], dtype=np.int64)
+    vectors = np.vstack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+    return ids, _normalize(vectors)
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, noise: float, seed: int = 42) -> np.ndarray:
+    """Truy vấn = embedding đã lưu + nhiễu Gaussian (mô phỏng ảnh chụp khác ảnh đăng ký)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[picks] + rng.normal(0, noise, size=(len(picks), vectors.shape[1]))
+    return _normalize(queries)
+
+
+def benchmark_index(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        vectors = _normalize(rng.normal(size=(args.synthetic, 512)))
+        ids = np.arange(len(vectors), dtype=np.int64)
+        source = f"synthetic ({args.synthetic} vectors)"
+    else:
+        ids, vectors = load_stored_embeddings()
+        source = f"student_faces ({len(vectors)} vectors)"
+
+    queries = make_queries(vectors, args.queries, args.noise)
+    d = vectors.shape[1]
+    metric = METRICS[args.metric]
+
+    # Kết quả chính xác từ flat index làm ground truth
+    exact = build_index("flat", d, metric=metric)
+    exact.add_with_ids(vectors, ids)
+    _, ground_truth = exact.search(queries, 1)
+
+    print(f"Dữ liệu: {source}, {len(queries)} truy vấn, nhiễu={args.noise}, metric={args.metric}")
+    print(f"{'mode':<10} {'param':<14} {'recall@1':>9} {'ms/query':>10} {'build s':>9}")
+
+    for index_type in args.modes:
+        required = min_train_size(index_type, args.nlist, args.pq_nbits)
+        if required > len(vectors):
+            print(f"{index_type:<10} bỏ qua: cần ít nhất {required} vector để train")
+            continue
+
+        start = time.perf_counter()
+        index = build_index(index_type, d, metric=metric, nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits)
+        if not index.is_trained:
+            index.train(vectors[:args.train_size])
+        index.add_with_ids(vectors, ids)
+        build_time = time.perf_counter() - start
+
+        base = base_index(index)
+        if isinstance(base, faiss.IndexHNSW):
+            sweep = [("efSearch", v) for v in args.ef_search]
+        elif isinstance(base, faiss.IndexIVF):
+            sweep = [("nprobe", v) for v in args.nprobe]
+        else:
+            sweep = [("-", None)]
+
+        for name, value in sweep:
+            kwargs = {}
+            if name == "efSearch":
+                kwargs["ef_search"] = value
+            elif name == "nprobe":
+                kwargs["nprobe"] = value
+            params = search_parameters(index, **kwargs)
+
+            # Mỗi request nhận diện search một vector, đo độ trễ từng truy vấn
+            predictions = np.empty(len(queries), dtype=np.int64)
+            start = time.perf_counter()
+            for i in range(len(queries)):
+                _, I = index.search(queries[i:i + 1], 1, params=params)
+                predictions[i] = I[0, 0]
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            recall = float(np.mean(predictions == ground_truth[:, 0]))
+            label = f"{name}={value}" if value is not None else "exact"
+            print(f"{index_type:<10} {label:<14} {recall:>9.4f} {latency_ms:>10.3f} {build_time:>9.2f}")
+
+
+def benchmark_vector_backends(args):
+    """
+    So sánh backend FAISS (file, trong bộ nhớ process) với pgvector (cột vector trong PostgreSQL)
+
+    Dùng embedding trong student_faces (cần đã chạy migration / rebuild-index với pgvector).
+    Đo recall@1 so với tìm kiếm chính xác, độ trễ mỗi truy vấn và một lần gọi cho cả lô;
+    --schedule-id đo thêm truy vấn lọc theo danh sách lớp.
+    """
+    import tempfile
+
+    import app.models  # noqa: F401
+    from app.database import SessionLocal
+    from app.services.attendance_service import get_roster_face_ids
+    from app.services.face_service.index.face_index import FaceIndexManager
+    from app.services.face_service.index.pgvector_index import PgVectorFaceIndex
+
+    ids, vectors = load_stored_embeddings()
+    queries = make_queries(vectors, args.queries, args.noise)
+    ground_truth = ids[np.argmax(queries @ vectors.T, axis=1)]
+
+    faiss_backend = FaceIndexManager(os.path.join(tempfile.mkdtemp(), "face.index"),
+                                     index_options={"index_type": args.faiss_type})
+    faiss_backend.add(vectors, ids)
+    pg_backend = PgVectorFaceIndex(ef_search=args.ef_search, probes=args.probes)
+    backends = {"faiss": faiss_backend, "pgvector": pg_backend}
+
+    roster_ids = None
+    if args.schedule_id:
+        db = SessionLocal()
+        try:
+            roster_ids = get_roster_face_ids(args.schedule_id, db)
+        finally:
+            db.close()
+
+    print(f"Dữ liệu: {len(vectors)} embedding, {len(queries)} truy vấn, nhiễu={args.noise}, "
+          f"faiss={args.faiss_type}, pgvector ef_search={args.ef_search} probes={args.probes}")
+    print(f"{'backend':<10} {'recall@1':>9} {'ms/query':>10} {'ms/batch':>10} {'ms/roster':>10}")
+
+    for name, backend in backends.items():
+        backend.search(queries[:1])  # warm-up (kết nối, cache)
+        predictions = np.empty(len(queries), dtype=np.int64)
+        start = time.perf_counter()
+        for i in range(len(queries)):
+            _, I = backend.search(queries[i:i + 1], 1)
+            predictions[i] = I[0, 0]
+        query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        backend.search(queries, 1)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        roster_ms = float("nan")
+        if roster_ids is not None:
+            start = time.perf_counter()
+            for i in range(len(queries)):
+                if name == "pgvector":
+                    backend.search_schedule(queries[i:i + 1], args.schedule_id)
+                else:
+                    backend.search(queries[i:i + 1], 1, ids=roster_ids)
+            roster_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = float(np.mean(predictions == ground_truth))
+        print(f"{name:<10} {recall:>9.4f} {query_ms:>10.3f} {batch_ms:>10.1f} {roster_ms:>10.3f}")
+
+
+def _iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.maximum(0.0, x2 - x1 + 1.0) * np.maximum(0.0, y2 - y1 + 1.0)
+    area = (box[2] - box[0] + 1.0) * (box[3] - box[1] + 1.0)
+    areas = (boxes[:, 2] - boxes[:, 0] + 1.0) * (boxes[:, 3] - boxes[:, 1] + 1.0)
+    return inter / (area + areas - inter)
+
+
+def _matched(reference, boxes, iou_threshold):
+    """Số box tham chiếu có box phát hiện tương ứng (IoU >= ngưỡng)"""
+    if len(reference) == 0 or len(boxes) == 0:
+        return 0
+    boxes = np.asarray(boxes)
+    return sum(1 for box in reference if _iou(box, boxes).max() >= iou_threshold)
+
+
+def load_images(directory):
+    from PIL import Image
+
+    files = sorted(f for f in glob.glob(os.path.join(directory, "*"))
+                   if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    if not files:
+        raise ValueError(f"Không có ảnh nào trong {directory}")
+    return [Image.open(f).convert("RGB") for f in files]
+
+
+def benchmark_detection(args):
+    from app.services.face_service.detector.face_detector import create_detector
+    from app.services.face_service.face_alignment.mtcnn import DETECTION_PROFILES
+
+    detector = create_detector(args.backend)
+    images = load_images(args.images)
+
+    # Ground truth: profile default trên ảnh gốc (hoặc profile chỉ định)
+    references = [np.asarray(detector.detect(img, args.reference)[0]) for img in images]
+    total_reference = sum(len(r) for r in references)
+
+    print(f"Backend: {args.backend}, dữ liệu: {len(images)} ảnh, {total_reference} khuôn mặt tham chiếu ({args.reference}), "
+          f"IoU >= {args.iou}")
+    print(f"{'profile':<14} {'max side':>9} {'min face':>9} {'faces':>7} {'recall':>8} {'ms/image':>10}")
+
+    for profile in args.profiles:
+        params = DETECTION_PROFILES[profile]
+        detector.detect(images[0], profile)  # warm-up
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            detections = [detector.detect(img, profile)[0] for img in images]
+        latency_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(images))
+
+        found = sum(len(d) for d in detections)
+        matched = sum(_matched(r, d, args.iou) for r, d in zip(references, detections))
+        recall = matched / total_reference if total_reference else 0.0
+        print(f"{profile:<14} {str(params['max_side'] or '-'):>9} {params['min_face_size']:>9} "
+              f"{found:>7} {recall:>8.4f} {latency_ms:>10.1f}")
+
+
+def benchmark_detectors(args):
+    """
+    So sánh các backend phát hiện trên cùng bộ ảnh
+
+    Lấy MTCNN làm tham chiếu: recall theo box, sai số landmark (NME, chia cho
+    khoảng cách hai mắt) và cosine giữa embedding của khuôn mặt được căn chỉnh
+    bởi backend với khuôn mặt do MTCNN căn chỉnh.
+    """
+    import torch
+
+    from app.services.face_service.detector.face_detector import create_detector
+    from app.services.face_service.embedding.face_embedding import to_input_batch
+    from app.services.face_service.embedding.model_registry import get_model
+
+    images = load_images(args.images)
+    detectors = {backend: create_detector(backend) for backend in args.backends}
+    reference = detectors.get("mtcnn") or create_detector("mtcnn")
+    model = get_model("ir_101")
+
+    def embed(faces):
+        with torch.no_grad():
+            features, _ = model(to_input_batch(faces))
+        return features.numpy()
+
+    ref_results = []
+    for img in images:
+        boxes, faces = reference.align_multi(img, profile=args.profile)
+        landmarks = reference.detect(img, args.profile)[1]
+        ref_results.append((boxes, landmarks, embed(faces) if faces else None))
+    total_reference = sum(len(boxes) for boxes, _, _ in ref_results)
+
+    print(f"Dữ liệu: {len(images)} ảnh, {total_reference} khuôn mặt (MTCNN), profile={args.profile}")
+    print(f"{'backend':<8} {'faces':>7} {'recall':>8} {'NME':>8} {'cosine':>8} {'ms/image':>10}")
+
+    for backend, detector in detectors.items():
+        detector.detect(images[0], args.profile)  # warm-up
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            detections = [detector.detect(img, args.profile) for img in images]
+        latency_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(images))
+
+        found, matched, errors, cosines = 0, 0, [], []
+        for img, (boxes, landmarks), (ref_boxes, ref_landmarks, ref_features) in zip(images, detections, ref_results):
+            found += len(boxes)
+            if len(boxes) == 0 or len(ref_boxes) == 0:
+                continue
+            _, faces = detector.align_multi(img, profile=args.profile)
+            features = embed(faces)
+            for r, ref_box in enumerate(ref_boxes):
+                ious = _iou(ref_box, np.asarray(boxes))
+                i = int(ious.argmax())
+                if ious[i] < args.iou:
+                    continue
+                matched += 1
+                ref_points = ref_landmarks[r].reshape(2, 5).T
+                points = landmarks[i].reshape(2, 5).T
+                inter_ocular = np.linalg.norm(ref_points[0] - ref_points[1]) or 1.0
+                errors.append(np.linalg.norm(points - ref_points, axis=1).mean() / inter_ocular)
+                a, b = features[i], ref_features[r]
+                cosines.append(float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b))))
+
+        recall = matched / total_reference if total_reference else 0.0
+        nme = float(np.mean(errors)) if errors else float("nan")
+        cosine = float(np.mean(cosines)) if cosines else float("nan")
+        print(f"{backend:<8} {found:>7} {recall:>8.4f} {nme:>8.4f} {cosine:>8.4f} {latency_ms:>10.1f}")
+
+
+def _measure(func, repeat):
+    """Chạy func, trả về (kết quả, ms trung bình, MB cấp phát cao nhất trong một lần chạy)"""
+    tracemalloc.start()
+    try:
+        result = func()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed_ms, (peak - base) / (1024 * 1024)
+
+
+def _legacy_decode(image_bytes):
+    from io import BytesIO
+
+    from PIL import Image
+    img = Image.open(BytesIO(image_bytes)).convert('RGB')
+    return img, np.array(img)
+
+
+def _legacy_to_input(faces):
+    import torch
+    tensors = []
+    for face in faces:
+        np_img = np.array(face)
+        bgr_img = ((np_img[:, :, ::-1] / 255.0) - 0.5) / 0.5
+        tensors.append(torch.tensor([bgr_img.transpose(2, 0, 1)]).float())
+    return torch.cat(tensors, dim=0)
+
+
+def benchmark_pipeline(args):
+    """
+    Thời gian và bộ nhớ cấp phát (tracemalloc: numpy, PIL, Python) theo từng bước
+    từ bytes ảnh tới tensor đầu vào model, so sánh đường cũ và đường mới
+    """
+    from app.services.face_service.detector.face_detector import get_detector
+    from app.services.face_service.embedding.face_embedding import to_input_batch
+    from app.services.face_service.shared.image import read_rgb_image
+
+    with open(args.image, "rb") as f:
+        image_bytes = f.read()
+    detector = get_detector()
+
+    rows = []
+    _, ms, mb = _measure(lambda: _legacy_decode(image_bytes), args.repeat)
+    rows.append(("cũ", "decode PIL + np.array", ms, mb))
+    image, ms, mb = _measure(lambda: read_rgb_image(image_bytes), args.repeat)
+    rows.append(("mới", "decode cv2 (read_rgb_image)", ms, mb))
+
+    (_, faces), ms, mb = _measure(lambda: detector.align_multi(image, profile=args.profile), args.repeat)
+    rows.append(("chung", "detect + align", ms, mb))
+    if not faces:
+        raise ValueError("Không phát hiện khuôn mặt nào trong ảnh.")
+
+    _, ms, mb = _measure(lambda: _legacy_to_input(faces), args.repeat)
+    rows.append(("cũ", "to_input (float64, torch.tensor)", ms, mb))
+    _, ms, mb = _measure(lambda: to_input_batch(faces), args.repeat)
+    rows.append(("mới", "to_input_batch (float32, from_numpy)", ms, mb))
+
+    print(f"Ảnh: {args.image} ({image.shape[1]}x{image.shape[0]}), {len(faces)} khuôn mặt")
+    print(f"{'đường':<6} {'bước':<38} {'ms':>9} {'peak MB':>9}")
+    for path, stage, ms, mb in rows:
+        print(f"{path:<6} {stage:<38} {ms:>9.2f} {mb:>9.2f}")
+
+
+def _synthetic_boxes(n, rng, image_size=1920):
+    """Box ngẫu nhiên dạng (x1, y1, x2, y2, score), gom quanh một số tâm như output P-Net"""
+    centers = rng.uniform(0, image_size, size=(max(1, n // 20), 2))
+    picks = centers[rng.integers(0, len(centers), size=n)]
+    sizes = rng.uniform(12, 200, size=(n, 1))
+    xy1 = np.round(picks + rng.normal(0, 10, size=(n, 2)) - sizes / 2)
+    xy2 = np.round(xy1 + sizes)
+    return np.hstack([xy1, xy2, rng.uniform(0, 1, size=(n, 1))])
+
+
+def benchmark_nms(args):
+    """Đo thời gian các backend NMS (kết quả giống nhau được kiểm tra trong tests/test_nms.py)"""
+    from app.services.face_service.face_alignment.mtcnn_pytorch.src import box_utils
+
+    backends = {
+        "reference": box_utils.nms_reference,
+        "vectorized": box_utils.nms_vectorized,
+        "nms": box_utils.nms,
+    }
+    rng = np.random.default_rng(0)
+    print(f"torchvision: {'có' if box_utils.torchvision is not None else 'không'}")
+    print(f"{'boxes':>7} {'mode':<6} " + " ".join(f"{name + ' ms':>15}" for name in backends))
+
+    for n in args.sizes:
+        boxes = _synthetic_boxes(n, rng)
+        for mode in args.modes:
+            timings = []
+            for func in backends.values():
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    func(boxes.copy(), args.threshold, mode)
+                timings.append((time.perf_counter() - start) * 1000 / args.repeat)
+            print(f"{n:>7} {mode:<6} " + " ".join(f"{t:>15.2f}" for t in timings))
+
+
+def benchmark_quality(args):
+    """Tỉ lệ khuôn mặt bị cổng chất lượng loại, chi phí chấm điểm so với chi phí embedding tiết kiệm được"""
+    from app.services.face_service.detector.face_detector import create_detector
+    from app.services.face_service.embedding.face_embedding import embed_faces
+    from app.services.face_service.quality import quality_gate
+
+    detector = create_detector(args.backend)
+    images = load_images(args.images)
+    faces, boxes, landmarks = [], [], []
+    for img in images:
+        b, l, f = detector.detect_and_align(img, profile=args.profile)
+        faces.extend(f)
+        boxes.extend(b)
+        landmarks.extend(l)
+    if not faces:
+        raise ValueError("Không phát hiện khuôn mặt nào")
+
+    print(f"Dữ liệu: {len(images)} ảnh, {len(faces)} khuôn mặt, profile={args.profile}")
+    print(f"{'#':>4} {'sharpness':>10} {'size':>7} {'yaw':>6} {'pitch':>6} {'conf':>7} {'score':>7}  kết quả")
+    reports = [quality_gate.assess(face, box, landmark) for face, box, landmark in zip(faces, boxes, landmarks)]
+    for i, report in enumerate(reports):
+        result = "✅" if report["passed"] else "❌ " + ", ".join(report["reasons"])
+        print(f"{i:>4} {report['sharpness']:>10.1f} {report['size']:>7.1f} {report['yaw']:>6.3f} {report['pitch']:>6.3f} "
+              f"{report['confidence']:>7.4f} {report['score']:>7.4f}  {result}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for face, box, landmark in zip(faces, boxes, landmarks):
+            quality_gate.assess(face, box, landmark)
+    assess_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(faces))
+
+    embed_faces(faces[:1])  # warm-up
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        embed_faces(faces)
+    embed_ms = (time.perf_counter() - start) * 1000 / (args.repeat * len(faces))
+
+    rejected = sum(1 for report in reports if not report["passed"])
+    print(f"\nBị loại: {rejected}/{len(faces)} ({rejected / len(faces):.1%})")
+    print(f"Chấm chất lượng: {assess_ms:.2f} ms/khuôn mặt, embedding: {embed_ms:.2f} ms/khuôn mặt")
+    print(f"Tiết kiệm ước tính: {rejected * embed_ms - len(faces) * assess_ms:.1f} ms trên bộ ảnh")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nhận diện khuôn mặt")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("index", help="So sánh recall@1 và độ trễ giữa các loại FAISS index")
+    index.add_argument("--modes", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    index.add_argument("--metric", default="ip", choices=list(METRICS))
+    index.add_argument("--synthetic", type=int, default=0, help="Dùng N vector ngẫu nhiên thay cho database")
+    index.add_argument("--queries", type=int, default=1000)
+    index.add_argument("--noise", type=float, default=0.02)
+    index.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    index.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    index.add_argument("--nlist", type=int, default=256)
+    index.add_argument("--pq-m", type=int, default=64)
+    index.add_argument("--pq-nbits", type=int, default=8)
+    index.add_argument("--train-size", type=int, default=50000)
+    index.set_defaults(func=benchmark_index)
+
+    backends = subparsers.add_parser("vector-backends", help="So sánh FAISS (file) và pgvector trên embedding đã lưu")
+    backends.add_argument("--queries", type=int, default=500)
+    backends.add_argument("--noise", type=float, default=0.02)
+    backends.add_argument("--faiss-type", default="flat", choices=INDEX_TYPES)
+    backends.add_argument("--ef-search", type=int, default=64)
+    backends.add_argument("--probes", type=int, default=16)
+    backends.add_argument("--schedule-id", type=int, default=0, help="Đo thêm tìm kiếm trong danh sách lớp")
+    backends.set_defaults(func=benchmark_vector_backends)
+
+    detection = subparsers.add_parser("detection", help="So sánh độ trễ và recall giữa các profile phát hiện")
+    detection.add_argument("--images", default=os.path.join(os.path.dirname(__file__), "face_alignment", "test_images"))
+    detection.add_argument("--profiles", nargs="+", default=["default", "selfie_kiosk", "classroom", "camera_stream"])
+    detection.add_argument("--reference", default="default", help="Profile dùng làm ground truth")
+    detection.add_argument("--backend", default="mtcnn", choices=["mtcnn", "yolo"])
+    detection.add_argument("--iou", type=float, default=0.5)
+    detection.add_argument("--repeat", type=int, default=3)
+    detection.set_defaults(func=benchmark_detection)
+
+    detectors = subparsers.add_parser("detectors", help="So sánh độ trễ và chất lượng căn chỉnh giữa MTCNN và YOLO")
+    detectors.add_argument("--images", default=os.path.join(os.path.dirname(__file__), "face_alignment", "test_images"))
+    detectors.add_argument("--backends", nargs="+", default=["mtcnn", "yolo"], choices=["mtcnn", "yolo"])
+    detectors.add_argument("--profile", default="default")
+    detectors.add_argument("--iou", type=float, default=0.5)
+    detectors.add_argument("--repeat", type=int, default=3)
+    detectors.set_defaults(func=benchmark_detectors)
+
+    pipeline = subparsers.add_parser("pipeline", help="Thời gian và bộ nhớ cấp phát từng bước decode -> tensor")
+    pipeline.add_argument("--image", default=os.path.join(os.path.dirname(__file__), "face_alignment", "test_images", "img1.jpeg"))
+    pipeline.add_argument("--profile", default="default")
+    pipeline.add_argument("--repeat", type=int, default=5)
+    pipeline.set_defaults(func=benchmark_pipeline)
+
+    nms = subparsers.add_parser("nms", help="So sánh tốc độ các cài đặt NMS")
+    nms.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 10000])
+    nms.add_argument("--modes", nargs="+", default=["union", "min"], choices=["union", "min"])
+    nms.add_argument("--threshold", type=float, default=0.7)
+    nms.add_argument("--repeat", type=int, default=3)
+    nms.set_defaults(func=benchmark_nms)
+
+    quality = subparsers.add_parser("quality", help="Tỉ lệ khuôn mặt bị cổng chất lượng loại và chi phí chấm điểm")
+    quality.add_argument("--images", default=os.path.join(os.path.dirname(__file__), "face_alignment", "test_images"))
+    quality.add_argument("--backend", default="mtcnn", choices=["mtcnn", "yolo"])
+    quality.add_argument("--profile", default="default")
+    quality.add_argument("--repeat", type=int, default=3)
+    quality.set_defaults(func=benchmark_quality)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
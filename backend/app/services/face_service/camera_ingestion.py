@@ -0,0 +1,418 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from app.core.config import settings
+from app.services.face_service.tracking import create_tracker
+
+
+class _RateMeter:
+    """Đếm số sự kiện trong cửa sổ trượt window giây -> tốc độ / giây"""
+
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, now: float = None):
+        now = now or time.monotonic()
+        with self._lock:
+            self._events.append(now)
+            self._trim(now)
+
+    def _trim(self, now):
+        while self._events and now - self._events[0] > self.window:
+            self._events.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return round(len(self._events) / self.window, 2)
+
+
+class StreamReader:
+    """
+    Đọc liên tục một stream camera (RTSP / HTTP / file video) trong thread riêng
+
+    Chỉ giữ frame mới nhất: frame chưa kịp xử lý bị ghi đè (đếm là dropped).
+    File video cục bộ được phát theo FPS gốc và lặp lại, dùng thay camera thật khi thử nghiệm.
+    """
+
+    def __init__(self, url: str, reconnect_seconds: float = 5.0, loop_files: bool = True):
+        self.url = url
+        self.reconnect_seconds = reconnect_seconds
+        self.loop_files = loop_files
+
+        self._frame = None
+        self._frame_time = 0.0
+        self._frame_no = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.connected = False
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.last_error = None
+        self.read_rate = _RateMeter()
+        self._consumed_no = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"camera-reader-{self.url}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _is_file(self) -> bool:
+        return "://" not in self.url
+
+    def _run(self):
+        while not self._stop.is_set():
+            cap = cv2.VideoCapture(self.url)
+            if not cap.isOpened():
+                self.connected = False
+                self.last_error = "Không mở được stream"
+                self._stop.wait(self.reconnect_seconds)
+                self.reconnects += 1
+                continue
+
+            self.connected = True
+            # File video không tự giới hạn tốc độ, phát theo FPS gốc để giống camera
+            frame_interval = 0.0
+            if self._is_file():
+                fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+                frame_interval = 1.0 / fps
+
+            try:
+                next_time = time.monotonic()
+                while not self._stop.is_set():
+                    ok, frame = cap.read()
+                    if not ok:
+                        if self._is_file() and self.loop_files:
+                            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                            continue
+                        self.last_error = "Mất kết nối stream"
+                        break
+                    self._publish(frame)
+
+                    if frame_interval:
+                        next_time += frame_interval
+                        delay = next_time - time.monotonic()
+                        if delay > 0:
+                            self._stop.wait(delay)
+                        else:
+                            next_time = time.monotonic()
+            finally:
+                cap.release()
+                self.connected = False
+
+            if not self._stop.is_set():
+                self.reconnects += 1
+                self._stop.wait(self.reconnect_seconds)
+
+    def _publish(self, frame):
+        now = time.monotonic()
+        with self._cond:
+            if self._frame is not None and self._consumed_no != self._frame_no:
+                self.frames_dropped += 1
+            self._frame = frame
+            self._frame_time = now
+            self._frame_no += 1
+            self.frames_read += 1
+            self._cond.notify_all()
+        self.read_rate.tick(now)
+
+    def latest(self, timeout: float = 1.0):
+        """Chờ frame mới hơn frame đã lấy lần trước -> (frame BGR, thời điểm đọc) hoặc (None, None)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame_no != self._consumed_no or self._stop.is_set(), timeout):
+                return None, None
+            if self._stop.is_set():
+                return None, None
+            self._consumed_no = self._frame_no
+            return self._frame, self._frame_time
+
+
+class RoomWorker:
+    """
+    Xử lý frame của một phòng: phát hiện khuôn mặt, theo dõi qua các frame,
+    embedding mỗi track vài lần qua pipeline dùng chung, bỏ phiếu danh tính
+    trong danh sách sinh viên của lịch học đang diễn ra và ghi điểm danh
+    """
+
+    def __init__(self, room_id: int, room_name: str, url: str):
+        self.room_id = room_id
+        self.room_name = room_name
+        self.url = url
+        self.reader = StreamReader(url, reconnect_seconds=settings.FACE_CAMERA_RECONNECT_SECONDS)
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._schedule = None
+        self._roster = None  # face_id của sinh viên lớp đang học, làm mới cùng lịch học
+        self._schedule_checked_at = 0.0
+        self._marked = set()  # student_id đã ghi cho _marked_key, tránh query lại
+        self._marked_key = None  # (schedule_id, date)
+        self.tracker = create_tracker()
+        self._tracked_schedule = None
+
+        self.frames_processed = 0
+        self.frames_stale = 0
+        self.faces_detected = 0
+        self.embeddings = 0
+        self.matches = 0
+        self.attendances_recorded = 0
+        self.last_lag_ms = 0.0
+        self.avg_lag_ms = 0.0
+        self.last_error = None
+        self.process_rate = _RateMeter()
+
+    def start(self):
+        self.reader.start()
+        self._thread = threading.Thread(target=self._run, name=f"camera-room-{self.room_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.reader.stop()
+
+    def join(self, timeout: float = None):
+        self.reader.join(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _current_schedule_id(self, db):
+        from app.services.attendance_service import get_current_schedule, get_roster_face_ids
+
+        # Lịch học và danh sách lớp chỉ đổi theo tiết, không cần query mỗi frame
+        now = time.monotonic()
+        if now - self._schedule_checked_at > settings.FACE_CAMERA_SCHEDULE_CHECK_SECONDS:
+            schedule = get_current_schedule(self.room_id, db)
+            self._schedule = schedule.schedule_id if schedule else None
+            try:
+                self._roster = get_roster_face_ids(self._schedule, db) if self._schedule else None
+            except ValueError:
+                self._roster = []  # lớp chưa có sinh viên đăng ký khuôn mặt
+            self._schedule_checked_at = now
+        return self._schedule
+
+    def _run(self):
+        from app.database import SessionLocal
+
+        interval = 1.0 / settings.FACE_CAMERA_PROCESS_FPS if settings.FACE_CAMERA_PROCESS_FPS > 0 else 0.0
+        # Một session cho cả vòng đời worker, mỗi frame kết thúc transaction của nó
+        db = SessionLocal()
+        try:
+            self._loop(db, interval)
+        finally:
+            db.close()
+
+    def _loop(self, db, interval: float):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            frame, frame_time = self.reader.latest(timeout=1.0)
+            if frame is None:
+                continue
+
+            lag = time.monotonic() - frame_time
+            if lag > settings.FACE_CAMERA_STALE_SECONDS:
+                self.frames_stale += 1
+                continue
+
+            try:
+                schedule_id = self._current_schedule_id(db)
+                if schedule_id is not None:
+                    self._process(frame, schedule_id, self._roster, db)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[CAMERA] Phòng {self.room_name}: lỗi xử lý frame: {e}")
+            finally:
+                # Điểm danh đã commit trong record_attendances, chỉ đóng transaction đọc còn mở
+                db.rollback()
+
+            self.frames_processed += 1
+            self.process_rate.tick()
+            self.last_lag_ms = round((time.monotonic() - frame_time) * 1000, 1)
+            self.avg_lag_ms = round(0.9 * self.avg_lag_ms + 0.1 * self.last_lag_ms, 1) if self.avg_lag_ms else self.last_lag_ms
+
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0:
+                self._stop.wait(remaining)
+
+    def _process(self, frame, schedule_id: int, roster_ids, db):
+        from datetime import date
+
+        from app.services.attendance_service import (
+            identify_embeddings,
+            record_attendances,
+            select_track_faces,
+        )
+        from app.services.face_service.detector.face_detector import get_detector
+        from app.services.face_service.embedding.face_embedding import embed_faces
+
+        # Đổi lịch học thì danh sách sinh viên đổi, bắt đầu theo dõi lại
+        if schedule_id != self._tracked_schedule:
+            self.tracker.reset()
+            self._tracked_schedule = schedule_id
+
+        # Mỗi frame chỉ chạy detection và chấm chất lượng; embedding chỉ cho track
+        # cần thêm phiếu, bằng frame tốt nhất của track
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        detector = get_detector()
+        boxes, landmarks = detector.detect(rgb_frame, settings.FACE_PROFILE_CAMERA)
+        self.faces_detected += len(boxes)
+        tracks = self.tracker.update(boxes, landmarks)
+
+        pending, faces = select_track_faces(self.tracker, tracks, rgb_frame, detector)
+        if pending:
+            if not roster_ids:
+                return  # lớp chưa có sinh viên đăng ký khuôn mặt
+            embeddings = embed_faces(faces)
+            self.embeddings += len(embeddings)
+            for track, (face_id, similarity, student_id) in zip(pending, identify_embeddings(embeddings, roster_ids, db)):
+                self.tracker.add_vote(track, student_id, similarity, face_id)
+
+        identified = [track for track in tracks if track.identity is not None and not track.recorded]
+        if not identified:
+            return
+        self.matches += len(identified)
+
+        # Chỉ nhớ sinh viên đã ghi của lịch học và ngày hiện tại
+        marked_key = (schedule_id, date.today())
+        if marked_key != self._marked_key:
+            self._marked.clear()
+            self._marked_key = marked_key
+
+        new_ids = list({track.identity for track in identified if track.identity not in self._marked})
+        if new_ids:
+            recorded = record_attendances(schedule_id, new_ids, db)
+            self.attendances_recorded += len(recorded)
+            self._marked.update(new_ids)
+        for track in identified:
+            track.recorded = True
+
+    def stats(self) -> dict:
+        return {
+            "room_id": self.room_id,
+            "room_name": self.room_name,
+            "stream_url": self.url,
+            "connected": self.reader.connected,
+            "schedule_id": self._schedule,
+            "read_fps": self.reader.read_rate.rate(),
+            "process_fps": self.process_rate.rate(),
+            "lag_ms": self.last_lag_ms,
+            "avg_lag_ms": self.avg_lag_ms,
+            "frames_read": self.reader.frames_read,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.reader.frames_dropped,
+            "frames_stale": self.frames_stale,
+            "faces_detected": self.faces_detected,
+            "embeddings": self.embeddings,
+            "tracks": self.tracker.stats(),
+            "matches": self.matches,
+            "attendances_recorded": self.attendances_recorded,
+            "reconnects": self.reader.reconnects,
+            "last_error": self.last_error or self.reader.last_error,
+        }
+
+
+class CameraIngestionService:
+    """
+    Quản lý một RoomWorker cho mỗi phòng có camera_stream_url
+
+    Danh sách phòng được đọc lại định kỳ: phòng mới được thêm, phòng bị xóa
+    hoặc đổi URL thì worker cũ dừng. overrides (room_id -> url) cho phép thay
+    stream bằng file video cục bộ khi thử nghiệm.
+    """
+
+    def __init__(self, refresh_seconds: float = 60.0):
+        self.refresh_seconds = refresh_seconds
+        self.overrides = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, overrides: dict = None):
+        if self._thread is not None:
+            return
+        self.overrides = dict(overrides or {})
+        self._stop.clear()
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="camera-ingestion", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[CAMERA] Lỗi cập nhật danh sách phòng: {e}")
+
+    def _load_streams(self) -> dict:
+        from app.database import SessionLocal
+        from app.models.room import Room
+
+        db = SessionLocal()
+        try:
+            rooms = db.query(Room.room_id, Room.room_name, Room.camera_stream_url).all()
+        finally:
+            db.close()
+        streams = {
+            room_id: (room_name, url)
+            for room_id, room_name, url in rooms
+            if url or room_id in self.overrides
+        }
+        for room_id, url in self.overrides.items():
+            name = streams.get(room_id, (f"room-{room_id}", None))[0]
+            streams[room_id] = (name, url)
+        return streams
+
+    def refresh(self):
+        streams = self._load_streams()
+        with self._lock:
+            for room_id in list(self._workers):
+                worker = self._workers[room_id]
+                if room_id not in streams or streams[room_id][1] != worker.url:
+                    worker.stop()
+                    del self._workers[room_id]
+            for room_id, (room_name, url) in streams.items():
+                if room_id not in self._workers:
+                    worker = RoomWorker(room_id, room_name, url)
+                    worker.start()
+                    self._workers[room_id] = worker
+                    print(f"[CAMERA] Bắt đầu đọc stream phòng {room_name}: {url}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(timeout)
+        self._thread = None
+
+    def status(self) -> dict:
+        with self._lock:
+            workers = list(self._workers.values())
+        return {
+            "running": self._thread is not None,
+            "rooms": [worker.stats() for worker in workers],
+        }
+
+
+camera_ingestion = CameraIngestionService(refresh_seconds=settings.FACE_CAMERA_REFRESH_SECONDS)
@@ -0,0 +1,191 @@
+"""
+Các lệnh quản trị dữ liệu nhận diện khuôn mặt
+
+Chạy từ thư mục backend:
+    python -m app.services.face_service.cli rebuild-index
+    python -m app.services.face_service.cli convert-index
+    python -m app.services.face_service.cli pgvector-index --type hnsw
+    python -m app.services.face_service.cli export-models --runtime onnx --quantize
+    python -m app.services.face_service.cli check-parity --runtime onnx --quantize
+    python -m app.services.face_service.cli ingest-cameras --stream 1=./videos/room1.mp4
+    python -m app.services.face_service.cli import-students --csv k2026.csv --avatars k2026.zip
+"""
+import argparse
+import json
+import sys
+import time
+
+import torch
+
+import app.models  # noqa: F401  đăng ký toàn bộ model với SQLAlchemy
+from app.core.config import settings
+from app.database import SessionLocal
+from app.services.face_service.index.face_index import face_index
+
+
+def rebuild_index(args):
+    db = SessionLocal()
+    try:
+        total = face_index.rebuild_from_db(db, batch_size=args.batch_size,
+                                           template_mode=settings.FACE_TEMPLATE_MODE)
+        if face_index.backend == "pgvector":
+            print(f"✅ Đã chép {total} embedding sang cột student_faces.embedding")
+        else:
+            print(f"✅ Đã tạo lại FAISS index: {total} vector -> {face_index.index_path}")
+    finally:
+        db.close()
+
+
+def convert_index(args):
+    # Chuyển file index có ID map sang FACE_INDEX_TYPE / FACE_INDEX_METRIC (index cũ theo vị trí: dùng rebuild-index)
+    total = face_index.convert()
+    print(f"✅ Đã chuyển FAISS index: {total} vector -> {face_index.index_path}")
+
+
+def pgvector_index(args):
+    # Tạo lại index ANN trên student_faces.embedding (IVFFlat nên tạo sau khi đã backfill dữ liệu)
+    from app.services.face_service.index.pgvector_index import PgVectorFaceIndex
+
+    db = SessionLocal()
+    try:
+        definition = PgVectorFaceIndex().create_ann_index(
+            db, args.type, m=args.m, ef_construction=args.ef_construction, lists=args.lists
+        )
+        print(f"✅ Đã tạo index pgvector: {definition}")
+    finally:
+        db.close()
+
+
+def _eager_models():
+    # Import ở đây để không load model khi chỉ chạy lệnh index
+    from app.services.face_service.embedding.model_registry import load_pretrained_model
+    from app.services.face_service.face_alignment.mtcnn import build_eager_nets
+
+    models = {"ir_101": load_pretrained_model("ir_101")}
+    models.update(build_eager_nets("cpu"))
+    return models
+
+
+def export_models(args):
+    from app.services.face_service.models_services.exported import export_module
+
+    for name, module in _eager_models().items():
+        path = export_module(module, name, args.runtime, args.quantize, args.artifact_dir)
+        print(f"✅ {name} -> {path}")
+
+
+def check_parity(args):
+    # Cosine similarity giữa output eager và artifact phải > min-cosine cho mọi model
+    from app.services.face_service.models_services.exported import cosine_parity, load_artifact, parity_inputs
+
+    failed = False
+    for name, module in _eager_models().items():
+        exported = load_artifact(name, args.runtime, args.quantize, args.artifact_dir)
+        x = parity_inputs(name, args.samples)
+        with torch.no_grad():
+            worst = cosine_parity(module(x), exported(x))
+        ok = worst > args.min_cosine
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {name}: min cosine = {worst:.5f} (yêu cầu > {args.min_cosine})")
+    if failed:
+        sys.exit(1)
+
+
+def ingest_cameras(args):
+    # Chạy dịch vụ camera ở foreground; --stream ROOM_ID=URL thay stream của phòng (vd: file video)
+    from app.services.face_service.camera_ingestion import camera_ingestion
+
+    overrides = {}
+    for item in args.stream:
+        room_id, _, url = item.partition("=")
+        if not url:
+            raise SystemExit(f"--stream phải có dạng ROOM_ID=URL: {item}")
+        overrides[int(room_id)] = url
+
+    camera_ingestion.start(overrides)
+    started = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            time.sleep(args.report_every)
+            print(json.dumps(camera_ingestion.status(), ensure_ascii=False, indent=2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        camera_ingestion.stop()
+
+
+def import_students(args):
+    from app.services.student_import_service import import_students as run_import
+
+    with open(args.csv, "rb") as f:
+        csv_bytes = f.read()
+    with open(args.avatars, "rb") as f:
+        zip_bytes = f.read()
+
+    db = SessionLocal()
+    try:
+        result = run_import(db, csv_bytes, zip_bytes, avatar_dir=args.avatar_dir, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+
+    for row in result["rows"]:
+        if row["status"] != "created":
+            print(f"❌ Dòng {row['row']}: {row['error']}")
+    print(f"✅ Đã tạo {result['created']}/{result['total_rows']} sinh viên trong {result['elapsed_seconds']}s "
+          f"{json.dumps(result['timings'])}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản trị dữ liệu nhận diện khuôn mặt")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-index", help="Tạo lại FAISS index từ bảng student_faces")
+    rebuild.add_argument("--batch-size", type=int, default=1000)
+    rebuild.set_defaults(func=rebuild_index)
+
+    convert = subparsers.add_parser("convert-index", help="Chuyển face.index sang loại index / metric đang cấu hình")
+    convert.set_defaults(func=convert_index)
+
+    pgvector = subparsers.add_parser("pgvector-index", help="Tạo lại index HNSW / IVFFlat trên cột vector (pgvector)")
+    pgvector.add_argument("--type", choices=["hnsw", "ivfflat"], default="hnsw")
+    pgvector.add_argument("--m", type=int, default=16)
+    pgvector.add_argument("--ef-construction", type=int, default=64)
+    pgvector.add_argument("--lists", type=int, default=100, help="IVFFlat: khoảng số vector / 1000")
+    pgvector.set_defaults(func=pgvector_index)
+
+    for command, func, help_text in (
+        ("export-models", export_models, "Export IR-101 và P/R/O-Net sang TorchScript / ONNX"),
+        ("check-parity", check_parity, "So sánh output của artifact với model eager"),
+    ):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument("--runtime", choices=["torchscript", "onnx"], default="onnx")
+        sub.add_argument("--quantize", action="store_true", help="INT8 dynamic quantization")
+        sub.add_argument("--artifact-dir", default=None)
+        sub.set_defaults(func=func)
+        if command == "check-parity":
+            sub.add_argument("--samples", type=int, default=16)
+            sub.add_argument("--min-cosine", type=float, default=0.99)
+
+    ingest = subparsers.add_parser("ingest-cameras", help="Điểm danh liên tục từ camera các phòng")
+    ingest.add_argument("--stream", action="append", default=[], help="ROOM_ID=URL hoặc đường dẫn file video")
+    ingest.add_argument("--duration", type=float, default=0, help="Số giây chạy, 0 = tới khi Ctrl+C")
+    ingest.add_argument("--report-every", type=float, default=5.0)
+    ingest.set_defaults(func=ingest_cameras)
+
+    students = subparsers.add_parser("import-students", help="Import sinh viên hàng loạt từ CSV + zip ảnh đại diện")
+    students.add_argument("--csv", required=True)
+    students.add_argument("--avatars", required=True, help="File zip chứa ảnh, CSV ghi tên file ở cột avatar")
+    students.add_argument("--avatar-dir", default="static/avatars")
+    students.add_argument("--chunk-size", type=int, default=None, help="Mặc định STUDENT_IMPORT_CHUNK_SIZE")
+    students.add_argument("--report", default=None, help="Ghi kết quả từng dòng ra file JSON")
+    students.set_defaults(func=import_students)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
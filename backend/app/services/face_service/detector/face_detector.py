@@ -1,20 +1,164 @@
-from ultralytics import YOLO
 import numpy as np
 import cv2
+from abc import ABC, abstractmethod
 from typing import List, Tuple
 import os
+import threading
+
+from PIL import Image
+
+from app.core.config import settings
+from app.services.face_service.shared.image import to_rgb_array
+from app.services.face_service.face_alignment.mtcnn import (
+    DETECTION_PROFILES,
+    MTCNN,
+    get_reference_facial_points,
+    warp_and_crop_face,
+)
 
 # Lấy thư mục hiện tại của file face_detector.py
 BASE_DIR = os.path.dirname(__file__)
 MODEL_PATH = os.path.join(BASE_DIR, "models_services", "yolov8n-face.pt")
 
-model = YOLO(MODEL_PATH)
+DETECTOR_BACKENDS = ("mtcnn", "yolo")
+
+
+class FaceDetector(ABC):
+    """
+    Interface chung cho các backend phát hiện khuôn mặt
+
+    detect() nhận PIL.Image hoặc mảng RGB uint8, trả về (boxes [n,5] = x1,y1,x2,y2,score;
+    landmarks [n,10] = x1..x5,y1..y5) theo tọa độ ảnh gốc, sắp xếp theo độ tin cậy
+    giảm dần. align_multi() dùng 5 landmark để căn chỉnh khuôn mặt bằng warp_and_crop_face.
+    """
+
+    name = None
+
+    def __init__(self, crop_size: Tuple[int, int] = (112, 112)):
+        self.crop_size = crop_size
+        self.reference = get_reference_facial_points(default_square=crop_size[0] == crop_size[1])
+
+    @abstractmethod
+    def detect(self, img, profile=None):
+        """(boxes [n,5], landmarks [n,10]) của các khuôn mặt trong ảnh"""
+
+    def align_multi(self, img, limit=None, profile=None):
+        boxes, _, faces = self.detect_and_align(img, limit, profile)
+        return boxes, faces
+
+    def detect_and_align(self, img, limit=None, profile=None):
+        """Như align_multi() nhưng trả thêm landmark: (boxes, landmarks, faces)"""
+        # Detection và warp dùng chung một mảng RGB
+        img_array = to_rgb_array(img)
+        boxes, landmarks = self.detect(img_array, profile)
+        if limit:
+            boxes = boxes[:limit]
+            landmarks = landmarks[:limit]
+        return boxes, landmarks, self.align_faces(img_array, landmarks)
+
+    def align_faces(self, img_array, landmarks):
+        """Căn chỉnh các khuôn mặt đã biết landmark (vd: từ tracker) trên mảng RGB"""
+        faces = []
+        for landmark in landmarks:
+            facial5points = [[landmark[j], landmark[j + 5]] for j in range(5)]
+            warped_face = warp_and_crop_face(img_array, facial5points, self.reference, crop_size=self.crop_size)
+            faces.append(Image.fromarray(warped_face))
+        return faces
+
+
+class MTCNNDetector(FaceDetector):
+    name = "mtcnn"
+
+    def __init__(self, crop_size: Tuple[int, int] = (112, 112)):
+        super().__init__(crop_size)
+        self.model = MTCNN(device='cpu', crop_size=crop_size)
+        if settings.FACE_MODEL_RUNTIME != 'eager':
+            self.model.load_exported_nets(settings.FACE_MODEL_RUNTIME, settings.FACE_MODEL_QUANTIZE,
+                                          settings.FACE_MODEL_ARTIFACT_DIR or None)
+
+    def detect(self, img, profile=None):
+        boxes, landmarks = self.model.detect(img, profile)
+        if len(boxes) == 0:
+            return np.zeros((0, 5), 'float32'), np.zeros((0, 10), 'float32')
+        order = np.argsort(boxes[:, 4])[::-1]
+        return boxes[order], landmarks[order]
+
+
+class YoloFaceDetector(FaceDetector):
+    """
+    YOLOv8-face (ultralytics). Model pose 5 điểm (mắt, mũi, khóe miệng) cho landmark trực tiếp;
+    model chỉ có box thì landmark được ước lượng từ vị trí trung bình trong box.
+    """
+
+    name = "yolo"
+
+    # Vị trí tương đối trung bình của 5 landmark trong box khuôn mặt (x, y theo tỉ lệ w, h)
+    MEAN_LANDMARKS = np.array([
+        [0.31, 0.40], [0.69, 0.40], [0.50, 0.58], [0.35, 0.76], [0.65, 0.76],
+    ], dtype='float32')
+
+    def __init__(self, model_path: str = MODEL_PATH, confidence: float = 0.5, crop_size: Tuple[int, int] = (112, 112)):
+        super().__init__(crop_size)
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.confidence = confidence
+
+    def detect(self, img, profile=None):
+        img = to_rgb_array(img)
+        params = DETECTION_PROFILES[profile or 'default']
+        kwargs = {"conf": self.confidence, "verbose": False}
+        if params['max_side']:
+            kwargs["imgsz"] = params['max_side']
+        results = self.model.predict(source=img[:, :, ::-1], **kwargs)[0]
 
+        if results.boxes is None or len(results.boxes) == 0:
+            return np.zeros((0, 5), 'float32'), np.zeros((0, 10), 'float32')
+
+        xyxy = results.boxes.xyxy.cpu().numpy()
+        scores = results.boxes.conf.cpu().numpy()
+        if results.keypoints is not None and results.keypoints.xy.shape[1] == 5:
+            points = results.keypoints.xy.cpu().numpy()  # [n, 5, 2]
+        else:
+            wh = np.stack([xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]], axis=1)
+            points = xyxy[:, None, 0:2] + self.MEAN_LANDMARKS[None] * wh[:, None]
+
+        boxes = np.hstack([xyxy, scores[:, None]])
+        landmarks = np.hstack([points[:, :, 0], points[:, :, 1]])
+
+        # min_face_size của profile tính theo ảnh đã thu nhỏ về max_side
+        scale = min(1.0, params['max_side'] / max(img.shape[:2])) if params['max_side'] else 1.0
+        sizes = np.minimum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]) * scale
+        keep = np.where(sizes >= params['min_face_size'])[0]
+        order = keep[np.argsort(scores[keep])[::-1]]
+        return boxes[order], landmarks[order]
+
+
+_detector = None
+_detector_lock = threading.Lock()
+
+
+def create_detector(backend: str) -> FaceDetector:
+    if backend == "mtcnn":
+        return MTCNNDetector()
+    if backend == "yolo":
+        return YoloFaceDetector(confidence=settings.FACE_YOLO_CONFIDENCE)
+    raise ValueError(f"Backend phát hiện khuôn mặt không hợp lệ: {backend} (chọn một trong {DETECTOR_BACKENDS})")
+
+
+def get_detector() -> FaceDetector:
+    """Detector dùng chung cho cả process, load lần đầu theo FACE_DETECTOR_BACKEND"""
+    global _detector
+    if _detector is not None:
+        return _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = create_detector(settings.FACE_DETECTOR_BACKEND)
+    return _detector
 
 
 def detect_faces(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
     """
-    Phát hiện bounding box các khuôn mặt trong ảnh sử dụng YOLOv8.
+    Phát hiện bounding box các khuôn mặt trong ảnh bằng detector đang cấu hình.
 
     Args:
         image (np.ndarray): Ảnh đầu vào (BGR).
@@ -22,17 +166,8 @@ def detect_faces(image: np.ndarray) -> List[Tuple[int, int, int, int]]:
     Returns:
         List[Tuple[int, int, int, int]]: Danh sách các bounding box (x1, y1, x2, y2).
     """
-    results = model.predict(source=image, verbose=False)[0]
-
-    faces = []
-    if results.boxes is None or len(results.boxes) == 0:
-        return faces
-
-    for box in results.boxes.xyxy:
-        x1, y1, x2, y2 = box.tolist()
-        faces.append((int(x1), int(y1), int(x2), int(y2)))
-
-    return faces
+    boxes, _ = get_detector().detect(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return [tuple(int(v) for v in box[:4]) for box in boxes]
 
 
 def crop_faces(image: np.ndarray, boxes: List[Tuple[int, int, int, int]], size: int = 112) -> List[np.ndarray]:
@@ -60,8 +195,3 @@ def crop_faces(image: np.ndarray, boxes: List[Tuple[int, int, int, int]], size:
         faces.append(face_resized)
 
     return faces
-
-
-
-
-
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_BACKENDS = ("memory", "file", "sqlite")
+
+
+def content_key(image, *parts) -> str:
+    """
+    Hash nội dung ảnh (bytes file hoặc mảng đã decode) kèm các tham số ảnh hưởng kết quả
+
+    blake2b nhanh hơn sha256 trên CPU 64-bit và đủ chống trùng cho mục đích cache.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(image, np.ndarray):
+        h.update(str((image.shape, image.dtype.str)).encode())
+        h.update(np.ascontiguousarray(image).data)
+    else:
+        h.update(image)
+    for part in parts:
+        h.update(b"\x00" + str(part).encode())
+    return h.hexdigest()
+
+
+class _FileStore:
+    """
+    Mỗi entry là một file .npy, TTL theo mtime; dùng chung giữa các worker trên cùng máy
+
+    Sau mỗi max_entries / 10 lần ghi, thư mục được dọn: xóa file hết hạn, rồi xóa file cũ
+    nhất (theo mtime) tới khi còn tối đa max_entries file và max_bytes bytes.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int = 0, ttl: float = 0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.prune_every = max(1, max_entries // 10)
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.prune()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.npy")
+
+    def get(self, key, ttl):
+        file = self._file(key)
+        try:
+            if ttl and time.time() - os.path.getmtime(file) > ttl:
+                os.remove(file)
+                return None
+            return np.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        file = self._file(key)
+        tmp_file = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.save(f, value)
+        os.replace(tmp_file, file)
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= self.prune_every
+            if due:
+                self._writes = 0
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Xóa file hết hạn và file cũ nhất vượt giới hạn, trả về số file đã xóa"""
+        now = time.time()
+        entries, removed = [], 0
+        for entry in os.scandir(self.path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # worker khác vừa xóa
+            expired = self.ttl and now - stat.st_mtime > self.ttl
+            # File tạm của lần ghi bị gián đoạn
+            stale_tmp = entry.name.endswith(".tmp") and now - stat.st_mtime > 60
+            if expired or stale_tmp:
+                removed += self._remove(entry.path)
+            elif entry.name.endswith(".npy"):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and not (self.max_bytes and total_bytes > self.max_bytes):
+                break
+            removed += self._remove(path)
+            count -= 1
+            total_bytes -= size
+
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    @staticmethod
+    def _remove(path) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(self.path, name))
+
+
+class _SQLiteStore:
+    """Bảng key -> embedding trong một file SQLite (WAL) dùng chung giữa các worker"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, dtype TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embedding_cache_created_at ON embedding_cache (created_at)")
+
+    def get(self, key, ttl):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, dtype, created_at FROM embedding_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, dtype, created_at = row
+        if ttl and time.time() - created_at > ttl:
+            return None
+        return np.frombuffer(value, dtype=dtype).copy()
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, value, dtype, created_at) VALUES (?, ?, ?, ?)",
+                (key, value.tobytes(), value.dtype.str, time.time()),
+            )
+            # Giữ tối đa max_entries bản ghi mới nhất
+            self._conn.execute(
+                "DELETE FROM embedding_cache WHERE key IN ("
+                "SELECT key FROM embedding_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embedding_cache")
+
+
+class EmbeddingCache:
+    """
+    Cache embedding theo hash nội dung ảnh
+
+    Tầng 1 là LRU trong process (giới hạn số entry, TTL và tổng số bytes).
+    Tầng 2 (tùy chọn) là thư mục file hoặc SQLite để các uvicorn worker dùng chung.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, max_bytes: int = 0,
+                 backend: str = "memory", path: str = ""):
+        if backend not in CACHE_BACKENDS:
+            raise ValueError(f"Backend cache không hợp lệ: {backend} (chọn một trong {CACHE_BACKENDS})")
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.path = path
+
+        self._entries = OrderedDict()  # key -> (created_at, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._store = None
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _get_store(self):
+        if self._store is None and self.backend != "memory":
+            if self.backend == "file":
+                self._store = _FileStore(self.path or "face_embedding_cache", self.max_entries,
+                                         self.max_bytes, self.ttl)
+            else:
+                self._store = _SQLiteStore(self.path or "face_embedding_cache.sqlite3", self.max_entries)
+        return self._store
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if self.ttl and time.time() - created_at > self.ttl:
+                    self._pop(key)
+                    self._stats["expired"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+
+        store = self._get_store()
+        if store is not None:
+            value = store.get(key, self.ttl)
+            if value is not None:
+                self._put(key, value)
+                with self._lock:
+                    self._stats["shared_hits"] += 1
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value: np.ndarray):
+        value = np.ascontiguousarray(value)
+        self._put(key, value)
+        store = self._get_store()
+        if store is not None:
+            try:
+                store.set(key, value)
+            except (OSError, sqlite3.Error) as e:
+                print(f"[FACE_CACHE] Không ghi được cache dùng chung: {e}")
+
+    def _put(self, key, value):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.time(), value)
+            self._bytes += value.nbytes
+            while self._entries and (
+                len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._pop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _pop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= value.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        store = self._get_store()
+        if store is not None:
+            store.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"entries": len(self._entries), "bytes": self._bytes})
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 4) if lookups else 0.0
+        stats.update({
+            "backend": self.backend,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+        })
+        if isinstance(self._store, _FileStore):
+            stats["shared_evictions"] = self._store.evictions
+        return stats
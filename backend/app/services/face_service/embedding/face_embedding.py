@@ -1,7 +1,15 @@
 
 
 
-from app.services.face_service.models_services import net
+from app.services.face_service.embedding.model_registry import (
+    adaface_models,
+    get_model,
+    load_pretrained_model,
+)
+from app.services.face_service.embedding.micro_batcher import MicroBatcher
+from app.services.face_service.embedding.embedding_cache import EmbeddingCache, content_key
+from app.services.face_service.inference_pool import inference_pool
+from app.core.config import settings
 import torch
 import os
 from ..face_alignment import align
@@ -20,49 +28,84 @@ def fix_seed(seed: int = 42):
 
 fix_seed()
 
-# BASE_DIR phải trỏ đến thư mục face_service (thư mục cha của embedding)
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-adaface_models = {
-    'ir_101': os.path.join(BASE_DIR, "models_services", "adaface_ir101_webface12m.ckpt"),
-}
-# Load model
-def load_pretrained_model(architecture='ir_101'):
-    assert architecture in adaface_models.keys(), "Architecture không hợp lệ!"
-    model = net.build_model(architecture)
-    statedict = torch.load(adaface_models[architecture], map_location='cpu')['state_dict']
-
-    # Bỏ prefix 'model.' trong checkpoint keys
-    model_statedict = {key[6:]: val for key, val in statedict.items() if key.startswith('model.')}
-    model.load_state_dict(model_statedict, strict=False)
-    model.eval()
-    return model
+# Gom các request embedding đồng thời thành một forward pass
+micro_batcher = MicroBatcher(
+    lambda: get_model('ir_101'),
+    max_batch_size=settings.FACE_BATCH_MAX_SIZE,
+    max_wait_ms=settings.FACE_BATCH_MAX_WAIT_MS,
+    num_threads=inference_pool.torch_threads,
+)
+
+# Cache embedding theo hash nội dung ảnh (retry, double-submit, frame trùng)
+embedding_cache = EmbeddingCache(
+    max_entries=settings.FACE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.FACE_CACHE_TTL_SECONDS,
+    max_bytes=settings.FACE_CACHE_MAX_BYTES,
+    backend=settings.FACE_CACHE_BACKEND,
+    path=settings.FACE_CACHE_PATH,
+)
+
+# Chạy model trên tensor [N,3,H,W] -> features [N, embedding_dim]
+def embed_tensor(tensor_input):
+    if settings.FACE_BATCH_ENABLED:
+        return micro_batcher.submit(tensor_input)
+    model = get_model('ir_101')
+    with torch.no_grad():
+        features, _ = model(tensor_input)
+    return features
 
 # Chuyển ảnh PIL -> tensor chuẩn hóa
 def to_input(pil_rgb_image):
-    np_img = np.array(pil_rgb_image)
-    bgr_img = ((np_img[:, :, ::-1] / 255.0) - 0.5) / 0.5  # RGB -> BGR + normalize [-1,1]
-    tensor = torch.tensor([bgr_img.transpose(2, 0, 1)]).float()  # [1,3,H,W]
-    return tensor
+    return to_input_batch([pil_rgb_image])  # [1,3,H,W]
 
-# Hàm chính: nhận 1 ảnh, trả về 1 embedding
-def get_face_embedding(image_path):
-    model = load_pretrained_model('ir_101')
+# Nhiều ảnh PIL (hoặc mảng RGB uint8) -> 1 tensor batch [N,3,H,W]
+def to_input_batch(pil_rgb_images):
+    # uint8 [N,H,W,3] -> float32 [N,3,H,W], RGB -> BGR, chuẩn hóa về [-1,1] (x/255 - 0.5)/0.5
+    np_imgs = np.stack([np.asarray(img, dtype=np.uint8) for img in pil_rgb_images])
+    bgr_imgs = np.ascontiguousarray(np_imgs[:, :, :, ::-1].transpose(0, 3, 1, 2))
+    tensor = torch.from_numpy(bgr_imgs).float()
+    return tensor.div_(127.5).sub_(1.0)
 
-    # Align khuôn mặt
-    aligned_rgb_img = align.get_aligned_face(image_path)
+# Hàm chính: nhận 1 ảnh, trả về 1 embedding
+def get_face_embedding(image_path, profile=None, quality=False):
+    # Ảnh đã gặp thì trả luôn kết quả, không chạy detector / model
+    key = None
+    if settings.FACE_CACHE_ENABLED:
+        key = content_key(image_path, profile, settings.FACE_DETECTOR_BACKEND, settings.FACE_MODEL_RUNTIME,
+                          settings.FACE_MODEL_QUANTIZE, quality and settings.FACE_QUALITY_ENABLED)
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            return torch.from_numpy(cached.copy())
+
+    # Align khuôn mặt (profile: xem DETECTION_PROFILES trong face_alignment/mtcnn.py)
+    # quality=True: khuôn mặt mờ / nhỏ / nghiêng bị từ chối trước khi chạy model
+    aligned_rgb_img = align.get_aligned_face(image_path, profile=profile, quality=quality)
     if aligned_rgb_img is None:
         raise ValueError(f"Không tìm thấy khuôn mặt trong ảnh: {image_path}")
 
     # Chuẩn hóa input
     tensor_input = to_input(aligned_rgb_img)
 
-    # Dự đoán embedding
-    with torch.no_grad():
-        feature, _ = model(tensor_input)  # feature shape: [1, embedding_dim]
+    # Dự đoán embedding (qua micro-batcher nếu bật)
+    feature = embed_tensor(tensor_input)  # feature shape: [1, embedding_dim]
 
+    if key is not None:
+        embedding_cache.set(key, feature[0].numpy().copy())
     return feature[0]  # trả về vector embedding dạng [embedding_dim]
 
+# Nhận 1 ảnh nhiều khuôn mặt, trả về (bboxes, embeddings [N, embedding_dim])
+def get_face_embeddings(image_path, limit=None, profile=None, quality=False):
+    bboxes, aligned_faces = align.get_aligned_faces(image_path, limit=limit, profile=profile, quality=quality)
+    if len(aligned_faces) == 0:
+        return [], None
+
+    return bboxes, embed_faces(aligned_faces)
+
+# Các khuôn mặt đã align -> embeddings [N, embedding_dim], một lần forward
+def embed_faces(aligned_faces):
+    tensor_input = to_input_batch(aligned_faces)
+    return embed_tensor(tensor_input).numpy()
+
 # # Test
 # if __name__ == '__main__':
 #     img_path = 'imgs/test.jpg'  # ảnh test
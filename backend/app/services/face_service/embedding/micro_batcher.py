@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+
+class MicroBatcher:
+    """
+    Gom các request embedding đồng thời thành một batch cho model
+
+    Mỗi caller gửi tensor [n,3,112,112] và chờ kết quả. Thread nền lấy request
+    đầu tiên, gom thêm tới khi đủ max_batch_size khuôn mặt hoặc hết max_wait_ms,
+    chạy một forward pass rồi trả kết quả về đúng từng caller. Request làm batch
+    vượt max_batch_size được giữ lại cho batch sau.
+
+    Forward pass của IR-101 chạy trên thread nền này (không phải worker của
+    inference_pool), nên num_threads được đặt lại cho chính thread đó.
+    """
+
+    def __init__(self, model_getter, max_batch_size: int = 32, max_wait_ms: float = 5.0, num_threads: int = 0):
+        self.model_getter = model_getter
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.num_threads = num_threads
+
+        self._queue = queue.Queue()
+        # Request không vừa batch trước, được đưa vào đầu batch sau (chỉ thread nền dùng)
+        self._carry = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+        self._forward_time = 0.0
+        self._batch_size_histogram = {}
+        self._started_at = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._started_at = time.monotonic()
+                self._thread = threading.Thread(target=self._loop, name="face-micro-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, tensor_input: torch.Tensor) -> torch.Tensor:
+        """Gửi tensor [n,3,H,W], chờ và trả về features [n, embedding_dim]"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((tensor_input, future))
+        return future.result()
+
+    def _collect(self):
+        # Request đầu tiên luôn được nhận, kể cả khi lớn hơn max_batch_size (chạy một mình)
+        first = self._carry if self._carry is not None else self._queue.get()
+        self._carry = None
+        batch = [first]
+        size = first[0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + item[0].shape[0] > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            size += item[0].shape[0]
+        return batch, size
+
+    def _loop(self):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        while True:
+            batch, size = self._collect()
+            futures = [future for _, future in batch]
+            try:
+                model = self.model_getter()
+                start_time = time.perf_counter()
+                with torch.no_grad():
+                    features, _ = model(torch.cat([tensor for tensor, _ in batch], dim=0))
+                self._record(len(batch), size, time.perf_counter() - start_time)
+
+                offset = 0
+                for tensor, future in batch:
+                    n = tensor.shape[0]
+                    future.set_result(features[offset:offset + n])
+                    offset += n
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @staticmethod
+    def _bucket(size: int) -> str:
+        # Nhóm theo lũy thừa của 2: 1, 2, 3-4, 5-8, ...
+        upper = 1
+        while upper < size:
+            upper *= 2
+        lower = upper // 2 + 1
+        return str(upper) if lower >= upper else f"{lower}-{upper}"
+
+    def _record(self, requests: int, size: int, forward_time: float):
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += requests
+            self._items += size
+            self._forward_time += forward_time
+            bucket = self._bucket(size)
+            self._batch_size_histogram[bucket] = self._batch_size_histogram.get(bucket, 0) + 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": self._batches,
+                "requests": self._requests,
+                "faces": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "avg_forward_ms": round(self._forward_time * 1000 / self._batches, 1) if self._batches else 0.0,
+                "faces_per_second": round(self._items / uptime, 2) if uptime else 0.0,
+                "batch_size_histogram": dict(self._batch_size_histogram),
+            }
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+
+import torch
+
+from app.core.config import settings
+from app.services.face_service.models_services import net
+from app.services.face_service.models_services.exported import artifact_path, load_artifact
+
+# BASE_DIR phải trỏ đến thư mục face_service (thư mục cha của embedding)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+adaface_models = {
+    'ir_101': os.path.join(BASE_DIR, "models_services", "adaface_ir101_webface12m.ckpt"),
+}
+
+# Registry: mỗi architecture chỉ load một lần cho cả process
+_models = {}
+_model_stats = {}
+_lock = threading.Lock()
+
+
+# Load model
+def load_pretrained_model(architecture='ir_101'):
+    assert architecture in adaface_models.keys(), "Architecture không hợp lệ!"
+    model = net.build_model(architecture)
+    statedict = torch.load(adaface_models[architecture], map_location='cpu')['state_dict']
+
+    # Bỏ prefix 'model.' trong checkpoint keys
+    model_statedict = {key[6:]: val for key, val in statedict.items() if key.startswith('model.')}
+    model.load_state_dict(model_statedict, strict=False)
+    model.eval()
+    return model
+
+
+def _model_memory_bytes(model, path=None):
+    """Tổng dung lượng parameters + buffers của model (bytes), artifact ONNX thì lấy kích thước file"""
+    if isinstance(model, torch.nn.Module):
+        tensors = list(model.parameters()) + list(model.buffers())
+        size = sum(t.numel() * t.element_size() for t in tensors)
+        if size or path is None:
+            return size
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+
+def _load_model(architecture):
+    """Load model theo FACE_MODEL_RUNTIME: eager (checkpoint gốc), torchscript hoặc onnx"""
+    runtime = settings.FACE_MODEL_RUNTIME
+    if runtime == "eager":
+        return load_pretrained_model(architecture), adaface_models[architecture]
+
+    quantize = settings.FACE_MODEL_QUANTIZE
+    artifact_dir = settings.FACE_MODEL_ARTIFACT_DIR or None
+    model = load_artifact(architecture, runtime, quantize, artifact_dir,
+                          num_threads=settings.FACE_INFERENCE_TORCH_THREADS)
+    return model, artifact_path(architecture, runtime, quantize, artifact_dir)
+
+
+def get_model(architecture='ir_101'):
+    """
+    Lấy model đã load sẵn trong process, load lần đầu nếu chưa có
+
+    Model ở chế độ eval và chỉ dùng để suy luận nên có thể dùng chung
+    giữa các thread. Lock chỉ bảo vệ lần load đầu tiên.
+    """
+    model = _models.get(architecture)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(architecture)
+        if model is None:
+            start_time = time.perf_counter()
+            model, path = _load_model(architecture)
+            load_time_ms = (time.perf_counter() - start_time) * 1000
+
+            _model_stats[architecture] = {
+                "architecture": architecture,
+                "runtime": settings.FACE_MODEL_RUNTIME,
+                "quantized": settings.FACE_MODEL_QUANTIZE and settings.FACE_MODEL_RUNTIME != "eager",
+                "checkpoint": path,
+                "load_time_ms": round(load_time_ms, 1),
+                "memory_mb": round(_model_memory_bytes(model, path) / (1024 * 1024), 2),
+                "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            _models[architecture] = model
+            print(f"[FACE_MODEL] Loaded {architecture} in {load_time_ms:.1f}ms "
+                  f"({_model_stats[architecture]['memory_mb']} MB)")
+    return model
+
+
+def preload_models(architectures=('ir_101',)):
+    """Load trước các model khi khởi động server"""
+    for architecture in architectures:
+        get_model(architecture)
+
+
+def get_model_stats():
+    """Thông tin thời gian load và bộ nhớ của các model đã load"""
+    return list(_model_stats.values())
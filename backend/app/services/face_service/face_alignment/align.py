@@ -1,7 +1,9 @@
 import sys
 import os
 
-from ..face_alignment import mtcnn
+from app.services.face_service.detector.face_detector import get_detector
+from app.services.face_service.quality import LowQualityFaceError, quality_gate
+from app.services.face_service.shared.image import to_rgb_array
 
 import argparse
 from PIL import Image
@@ -9,7 +11,6 @@ from io import BytesIO
 from tqdm import tqdm
 import random
 from datetime import datetime
-mtcnn_model = mtcnn.MTCNN(device='cpu', crop_size=(112, 112))
 
 def add_padding(pil_img, top, right, bottom, left, color=(0,0,0)):
     width, height = pil_img.size
@@ -19,16 +20,22 @@ def add_padding(pil_img, top, right, bottom, left, color=(0,0,0)):
     result.paste(pil_img, (left, top))
     return result
 
-def get_aligned_face(image_path, rgb_pil_image=None):
+def get_aligned_face(image_path, rgb_pil_image=None, profile=None, quality=False):
+    # image_path: bytes của file ảnh hoặc mảng RGB uint8 đã decode
+    # quality=True: raise LowQualityFaceError nếu khuôn mặt không qua cổng chất lượng
     if rgb_pil_image is None:
-        img = Image.open(BytesIO(image_path)).convert('RGB')
+        img = to_rgb_array(image_path)
     else:
         assert isinstance(rgb_pil_image, Image.Image), 'Face alignment module requires PIL image or path to the image'
         img = rgb_pil_image
     # find face
     try:
-        bboxes, faces = mtcnn_model.align_multi(img, limit=1)
+        bboxes, landmarks, faces = get_detector().detect_and_align(img, limit=1, profile=profile)
         face = faces[0]
+        if quality:
+            quality_gate.check(face, bboxes[0], landmarks[0])
+    except LowQualityFaceError:
+        raise
     except Exception as e:
         print('Face detection Failed due to error.')
         print(e)
@@ -37,3 +44,25 @@ def get_aligned_face(image_path, rgb_pil_image=None):
     return face
 
 
+def get_aligned_faces(image_path, rgb_pil_image=None, limit=None, profile=None, quality=False):
+    """
+    Phát hiện và căn chỉnh tất cả khuôn mặt trong ảnh, trả về (bboxes, faces)
+
+    quality=True: bỏ các khuôn mặt không qua cổng chất lượng
+    """
+    if rgb_pil_image is None:
+        img = to_rgb_array(image_path)
+    else:
+        assert isinstance(rgb_pil_image, Image.Image), 'Face alignment module requires PIL image or path to the image'
+        img = rgb_pil_image
+    try:
+        bboxes, landmarks, faces = get_detector().detect_and_align(img, limit=limit, profile=profile)
+        if quality:
+            keep = quality_gate.filter(faces, bboxes, landmarks)
+            bboxes, faces = bboxes[keep], [faces[i] for i in keep]
+    except Exception as e:
+        print('Face detection Failed due to error.')
+        print(e)
+        bboxes, faces = [], []
+
+    return bboxes, faces
@@ -1,4 +1,5 @@
 from typing import Tuple
+import cv2
 import numpy as np
 import torch
 from PIL import Image
@@ -11,10 +12,43 @@ sys.path.insert(0, os.path.dirname(__file__))
 
 from mtcnn_pytorch.src.get_nets import PNet, RNet, ONet
 from mtcnn_pytorch.src.box_utils import nms, calibrate_box, get_image_boxes, convert_to_square
-from mtcnn_pytorch.src.first_stage import run_first_stage
+from mtcnn_pytorch.src.first_stage import run_first_stage_pyramid
 from mtcnn_pytorch.src.align_trans import get_reference_facial_points, warp_and_crop_face
 
 
+# Profile phát hiện theo chế độ triển khai
+# - min_face_size: kích thước khuôn mặt nhỏ nhất (px) trên ảnh đã thu nhỏ
+# - max_side: cạnh dài tối đa của ảnh đưa vào pyramid, None = giữ nguyên độ phân giải
+DETECTION_PROFILES = {
+    'default': {'min_face_size': 20, 'factor': 0.85, 'max_side': None},
+    'selfie_kiosk': {'min_face_size': 60, 'factor': 0.709, 'max_side': 640},
+    'classroom': {'min_face_size': 12, 'factor': 0.85, 'max_side': 1920},
+    'camera_stream': {'min_face_size': 20, 'factor': 0.8, 'max_side': 1280},
+}
+
+
+def build_eager_nets(device='cpu'):
+    """Tạo P-Net, R-Net, O-Net (PyTorch eager) với trọng số đã train"""
+    # change working dir to this file location to load npz files. Then switch back
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(__file__))
+    try:
+        nets = {'pnet': PNet(), 'rnet': RNet(), 'onet': ONet()}
+    finally:
+        os.chdir(cwd)
+    for net in nets.values():
+        net.to(device)
+        net.eval()
+    return nets
+
+
+def _image_size(img):
+    """(width, height) của PIL.Image hoặc mảng [h, w, c]"""
+    if isinstance(img, np.ndarray):
+        return img.shape[1], img.shape[0]
+    return img.size
+
+
 class MTCNN():
     def __init__(self, device: str = 'cuda:0', crop_size: Tuple[int, int] = (112, 112)):
 
@@ -23,16 +57,10 @@ class MTCNN():
         assert crop_size in [(112, 112), (96, 112)]
         self.crop_size = crop_size
 
-        # change working dir to this file location to load npz files. Then switch back
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(__file__))
-
-        self.pnet = PNet().to(self.device)
-        self.rnet = RNet().to(self.device)
-        self.onet = ONet().to(self.device)
-        self.pnet.eval()
-        self.rnet.eval()
-        self.onet.eval()
+        nets = build_eager_nets(self.device)
+        self.pnet = nets['pnet']
+        self.rnet = nets['rnet']
+        self.onet = nets['onet']
         self.refrence = get_reference_facial_points(default_square=crop_size[0] == crop_size[1])
 
         self.min_face_size = 20
@@ -40,17 +68,52 @@ class MTCNN():
         self.nms_thresholds = [0.7, 0.7, 0.7]
         self.factor = 0.85
 
+    def load_exported_nets(self, runtime: str, quantize: bool = False, artifact_dir: str = None):
+        """Thay P/R/O-Net bằng artifact đã export (TorchScript hoặc ONNX Runtime)"""
+        from app.services.face_service.models_services.exported import load_artifact
+        self.pnet = load_artifact('pnet', runtime, quantize, artifact_dir)
+        self.rnet = load_artifact('rnet', runtime, quantize, artifact_dir)
+        self.onet = load_artifact('onet', runtime, quantize, artifact_dir)
 
-        os.chdir(cwd)
+    def detect(self, img, profile=None):
+        """
+        Phát hiện khuôn mặt theo profile, trả về (boxes, landmarks) theo tọa độ ảnh gốc
 
-    def align(self, img):
-        _, landmarks = self.detect_faces(img, self.min_face_size, self.thresholds, self.nms_thresholds, self.factor)
+        Ảnh lớn hơn max_side được thu nhỏ trước khi dựng pyramid, boxes và
+        landmarks được nhân ngược lại để align trên ảnh độ phân giải đầy đủ.
+        """
+        if profile is None or profile == 'default':
+            return self.detect_faces(img, self.min_face_size, self.thresholds, self.nms_thresholds, self.factor)
+        if profile not in DETECTION_PROFILES:
+            raise ValueError(f"Profile phát hiện không hợp lệ: {profile}")
+
+        params = DETECTION_PROFILES[profile]
+        scale = 1.0
+        max_side = params['max_side']
+        width, height = _image_size(img)
+        if max_side and max(width, height) > max_side:
+            scale = max_side / max(width, height)
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            if isinstance(img, np.ndarray):
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            else:
+                img = img.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+        boxes, landmarks = self.detect_faces(img, params['min_face_size'], self.thresholds, self.nms_thresholds,
+                                             params['factor'])
+        if scale != 1.0 and len(boxes) > 0:
+            boxes[:, 0:4] /= scale
+            landmarks /= scale
+        return boxes, landmarks
+
+    def align(self, img, profile=None):
+        _, landmarks = self.detect(img, profile)
         facial5points = [[landmarks[0][j], landmarks[0][j + 5]] for j in range(5)]
         warped_face = warp_and_crop_face(np.array(img), facial5points, self.refrence, crop_size=self.crop_size)
         return Image.fromarray(warped_face)
 
-    def align_multi(self, img, limit=None):
-        boxes, landmarks = self.detect_faces(img, self.min_face_size, self.thresholds, self.nms_thresholds, self.factor)
+    def align_multi(self, img, limit=None, profile=None):
+        boxes, landmarks = self.detect(img, profile)
         if limit:
             boxes = boxes[:limit]
             landmarks = landmarks[:limit]
@@ -64,7 +127,7 @@ class MTCNN():
     def detect_faces(self, image, min_face_size, thresholds, nms_thresholds, factor):
         """
         Arguments:
-            image: an instance of PIL.Image.
+            image: an instance of PIL.Image or a uint8 RGB numpy array [h, w, 3].
             min_face_size: a float number.
             thresholds: a list of length 3.
             nms_thresholds: a list of length 3.
@@ -74,6 +137,12 @@ class MTCNN():
             bounding boxes and facial landmarks.
         """
 
+        # the array is shared by the R-Net / O-Net crops,
+        # the pyramid is resampled from a PIL image
+        image_array = np.asarray(image, 'uint8')
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image_array)
+
         # BUILD AN IMAGE PYRAMID
         width, height = image.size
         min_length = min(height, width)
@@ -98,20 +167,11 @@ class MTCNN():
 
         # STAGE 1
 
-        # it will be returned
-        bounding_boxes = []
-
         with torch.no_grad():
-            # run P-Net on different scales
-            for s in scales:
-                boxes = run_first_stage(image, self.pnet, scale=s, threshold=thresholds[0])
-                bounding_boxes.append(boxes)
-
-            # collect boxes (and offsets, and scores) from different scales
-            bounding_boxes = [i for i in bounding_boxes if i is not None]
-            if len(bounding_boxes) == 0:
+            # run P-Net on all scales in a few batched passes
+            bounding_boxes = run_first_stage_pyramid(image, self.pnet, scales, threshold=thresholds[0])
+            if bounding_boxes is None:
                 return [], []
-            bounding_boxes = np.vstack(bounding_boxes)
 
             keep = nms(bounding_boxes[:, 0:5], nms_thresholds[0])
             bounding_boxes = bounding_boxes[keep]
@@ -125,7 +185,7 @@ class MTCNN():
 
             # STAGE 2
 
-            img_boxes = get_image_boxes(bounding_boxes, image, size=24)
+            img_boxes = get_image_boxes(bounding_boxes, image_array, size=24)
             img_boxes = torch.FloatTensor(img_boxes).to(self.device)
 
             output = self.rnet(img_boxes)
@@ -145,7 +205,7 @@ class MTCNN():
 
             # STAGE 3
 
-            img_boxes = get_image_boxes(bounding_boxes, image, size=48)
+            img_boxes = get_image_boxes(bounding_boxes, image_array, size=48)
             if len(img_boxes) == 0:
                 return [], []
             img_boxes = torch.FloatTensor(img_boxes).to(self.device)
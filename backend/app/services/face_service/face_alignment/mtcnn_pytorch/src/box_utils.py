@@ -1,10 +1,100 @@
+import cv2
 import numpy as np
-from PIL import Image
+import torch
+
+try:
+    import torchvision
+except ImportError:
+    torchvision = None
+
+# above this size the overlap matrix (n x n) is not built at once
+_NMS_MATRIX_LIMIT = 2048
 
 
 def nms(boxes, overlap_threshold=0.5, mode='union'):
     """Non-maximum suppression.
 
+    'union' mode uses torchvision.ops.nms when torchvision is installed,
+    everything else goes through the vectorized NumPy implementation.
+    Both give the same result as nms_reference.
+
+    Arguments:
+        boxes: a float numpy array of shape [n, 5],
+            where each row is (xmin, ymin, xmax, ymax, score).
+        overlap_threshold: a float number.
+        mode: 'union' or 'min'.
+
+    Returns:
+        list with indices of the selected boxes
+    """
+    if len(boxes) == 0:
+        return []
+    if mode == 'union' and torchvision is not None:
+        return _nms_torchvision(boxes, overlap_threshold)
+    return nms_vectorized(boxes, overlap_threshold, mode)
+
+
+def _nms_torchvision(boxes, overlap_threshold):
+    # visit boxes in the same order as nms_reference, ties included:
+    # boxes are passed pre-sorted with strictly decreasing rank scores
+    order = np.argsort(boxes[:, 4])[::-1]
+    # torchvision computes areas as (x2 - x1)*(y2 - y1),
+    # shift the bottom right corner to keep the +1 convention of this module
+    coords = torch.from_numpy(np.ascontiguousarray(boxes[order, 0:4], dtype='float64'))
+    coords[:, 2:4] += 1.0
+    ranks = torch.arange(len(order), 0, -1, dtype=torch.float64)
+    return order[torchvision.ops.nms(coords, ranks, overlap_threshold).numpy()]
+
+
+def nms_vectorized(boxes, overlap_threshold=0.5, mode='union'):
+    """Non-maximum suppression without per-iteration allocations.
+
+    Boxes are sorted by score once. For up to _NMS_MATRIX_LIMIT boxes the
+    whole overlap matrix is computed in one go, otherwise the overlaps of
+    every picked box with the remaining ones are computed on the fly.
+    """
+    if len(boxes) == 0:
+        return []
+
+    order = np.argsort(boxes[:, 4])[::-1]
+    x1, y1, x2, y2 = [boxes[order, i] for i in range(4)]
+    area = (x2 - x1 + 1.0)*(y2 - y1 + 1.0)
+
+    def overlaps(i, j):
+        w = np.maximum(0.0, np.minimum(x2[i], x2[j]) - np.maximum(x1[i], x1[j]) + 1.0)
+        h = np.maximum(0.0, np.minimum(y2[i], y2[j]) - np.maximum(y1[i], y1[j]) + 1.0)
+        inter = w*h
+        if mode == 'min':
+            return inter/np.minimum(area[i], area[j])
+        return inter/(area[i] + area[j] - inter)
+
+    n = len(order)
+    suppressed = np.zeros(n, dtype=bool)
+    pick = []
+    if n <= _NMS_MATRIX_LIMIT:
+        idx = np.arange(n)
+        matrix = overlaps(idx[:, None], idx[None, :]) > overlap_threshold
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            pick.append(i)
+            suppressed |= matrix[i]
+    else:
+        for i in range(n):
+            if suppressed[i]:
+                continue
+            pick.append(i)
+            rest = np.arange(i + 1, n)
+            suppressed[rest[overlaps(i, rest) > overlap_threshold]] = True
+
+    return order[pick]
+
+
+def nms_reference(boxes, overlap_threshold=0.5, mode='union'):
+    """Non-maximum suppression, original pure NumPy loop.
+
+    Kept as the reference for the equivalence test (tests/test_nms.py).
+
     Arguments:
         boxes: a float numpy array of shape [n, 5],
             where each row is (xmin, ymin, xmax, ymax, score).
@@ -127,9 +217,12 @@ def calibrate_box(bboxes, offsets):
 def get_image_boxes(bounding_boxes, img, size=24):
     """Cut out boxes from the image.
 
+    The image is converted to an array and zero-padded only once, every
+    cutout is then a view on that shared buffer resized with cv2.
+
     Arguments:
         bounding_boxes: a float numpy array of shape [n, 5].
-        img: an instance of PIL.Image.
+        img: an instance of PIL.Image or a uint8 numpy array of shape [h, w, 3].
         size: an integer, size of cutouts.
 
     Returns:
@@ -137,26 +230,34 @@ def get_image_boxes(bounding_boxes, img, size=24):
     """
 
     num_boxes = len(bounding_boxes)
-    width, height = img.size
+    if num_boxes == 0:
+        return np.zeros((0, 3, size, size), 'float32')
 
-    [dy, edy, dx, edx, y, ey, x, ex, w, h] = correct_bboxes(bounding_boxes, width, height)
-    img_boxes = np.zeros((num_boxes, 3, size, size), 'float32')
+    img_array = np.asarray(img, 'uint8')
+    height, width = img_array.shape[:2]
 
-    for i in range(num_boxes):
-        img_box = np.zeros((h[i], w[i], 3), 'uint8')
+    [dy, edy, dx, edx, y, ey, x, ex, w, h] = correct_bboxes(bounding_boxes, width, height)
 
-        img_array = np.asarray(img, 'uint8')
-        img_box[dy[i]:(edy[i] + 1), dx[i]:(edx[i] + 1), :] =\
-            img_array[y[i]:(ey[i] + 1), x[i]:(ex[i] + 1), :]
+    # top-left corner of every cutout in image coordinates (may be negative)
+    top, left = y - dy, x - dx
 
-        # resize
-        img_box = Image.fromarray(img_box)
-        img_box = img_box.resize((size, size), Image.BILINEAR)
-        img_box = np.asarray(img_box, 'float32')
+    # pad once so that every cutout lies inside the buffer,
+    # parts outside of the image stay zero as before
+    pad_top = max(0, -int(top.min()))
+    pad_left = max(0, -int(left.min()))
+    pad_bottom = max(0, int((top + h).max()) - height)
+    pad_right = max(0, int((left + w).max()) - width)
+    padded = np.pad(img_array, ((pad_top, pad_bottom), (pad_left, pad_right), (0, 0)))
 
-        img_boxes[i, :, :, :] = _preprocess(img_box)
+    top, left = top + pad_top, left + pad_left
+    img_boxes = np.empty((num_boxes, size, size, 3), 'uint8')
+    for i in range(num_boxes):
+        img_box = padded[top[i]:top[i] + h[i], left[i]:left[i] + w[i]]
+        # INTER_AREA when shrinking is the closest match to PIL's antialiased BILINEAR
+        interpolation = cv2.INTER_AREA if h[i] > size or w[i] > size else cv2.INTER_LINEAR
+        img_boxes[i] = cv2.resize(img_box, (size, size), interpolation=interpolation)
 
-    return img_boxes
+    return _preprocess_batch(img_boxes)
 
 
 def correct_bboxes(bboxes, width, height):
@@ -236,3 +337,18 @@ def _preprocess(img):
     img = np.expand_dims(img, 0)
     img = (img - 127.5)*0.0078125
     return img
+
+
+def _preprocess_batch(imgs):
+    """Preprocessing step for a batch of cutouts.
+
+    Arguments:
+        imgs: a uint8 numpy array of shape [n, h, w, c].
+
+    Returns:
+        a float numpy array of shape [n, c, h, w].
+    """
+    imgs = imgs.transpose((0, 3, 1, 2)).astype('float32')
+    imgs -= 127.5
+    imgs *= 0.0078125
+    return imgs
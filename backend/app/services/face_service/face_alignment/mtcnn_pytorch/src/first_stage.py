@@ -30,7 +30,9 @@ def run_first_stage(image, net, scale, threshold):
     img = image.resize((sw, sh), Image.BILINEAR)
     img = np.asarray(img, 'float32')
 
-    img = torch.FloatTensor(_preprocess(img)).to(net.features.conv1.weight.device)
+    # net có thể là artifact TorchScript / ONNX Runtime (không có .features)
+    net_device = net.features.conv1.weight.device if hasattr(net, 'features') else 'cpu'
+    img = torch.FloatTensor(_preprocess(img)).to(net_device)
     with torch.no_grad():
         output = net(img)
         probs = output[1].cpu().data.numpy()[0, 1, :, :]
@@ -46,6 +48,103 @@ def run_first_stage(image, net, scale, threshold):
     return boxes[keep]
 
 
+def run_first_stage_pyramid(image, net, scales, threshold, bucket_fill=0.5):
+    """Run P-Net on the whole image pyramid with a few batched forward passes.
+
+    Scaled images are packed into size buckets and zero-padded on the top and
+    left to the largest image of the bucket. The padding is kept even and every
+    image ends at the bottom-right corner of the canvas, so the valid part of
+    the P-Net output is exactly what an unpadded forward pass would produce.
+    P-Net applies softmax along the width axis, so face probabilities are
+    renormalized over the valid columns of each image.
+
+    Arguments:
+        image: an instance of PIL.Image.
+        net: P-Net (eager, TorchScript or ONNX Runtime).
+        scales: a list of floats, the image pyramid.
+        threshold: a float number.
+        bucket_fill: a float number, an image joins a bucket only if
+            its area is at least this fraction of the bucket canvas.
+
+    Returns:
+        a float numpy array of shape [n_boxes, 9] or None,
+            same boxes as calling run_first_stage for every scale.
+    """
+    width, height = image.size
+    levels = []
+    for s in scales:
+        sw, sh = math.ceil(width*s), math.ceil(height*s)
+        img = image.resize((sw, sh), Image.BILINEAR)
+        levels.append((s, _preprocess(np.asarray(img, 'float32'))[0]))
+
+    net_device = net.features.conv1.weight.device if hasattr(net, 'features') else 'cpu'
+    all_boxes = []
+    with torch.no_grad():
+        for bucket in _pyramid_buckets(levels, bucket_fill):
+            canvas_h, canvas_w = bucket[0][1].shape[1:]
+            canvas = np.zeros((len(bucket), 3, canvas_h, canvas_w), 'float32')
+            for i, (_, img) in enumerate(bucket):
+                h, w = img.shape[1:]
+                canvas[i, :, canvas_h - h:, canvas_w - w:] = img
+
+            output = net(torch.from_numpy(canvas).to(net_device))
+            offsets = output[0].cpu().data.numpy()
+            probs = output[1].cpu().data.numpy()[:, 1]
+
+            for i, (s, img) in enumerate(bucket):
+                # P-Net has stride 2, padding is even
+                top, left = (canvas_h - img.shape[1]) // 2, (canvas_w - img.shape[2]) // 2
+                level_probs = probs[i, top:, left:]
+                if left:
+                    row_sum = level_probs.sum(axis=1, keepdims=True)
+                    level_probs = np.divide(level_probs, row_sum, out=np.zeros_like(level_probs), where=row_sum > 0)
+                level_offsets = offsets[i:i + 1, :, top:, left:]
+
+                boxes = _generate_bboxes(level_probs, level_offsets, s, threshold)
+                if len(boxes) > 0:
+                    all_boxes.append((len(all_boxes), boxes))
+
+    if len(all_boxes) == 0:
+        return None
+
+    # NMS inside every scale in one call: boxes of different scales are
+    # shifted apart so that they never overlap each other
+    boxes = np.vstack([b for _, b in all_boxes])
+    level_ids = np.concatenate([np.full(len(b), i) for i, b in all_boxes])
+    shift = (boxes[:, 0:4].max() - min(boxes[:, 0:4].min(), 0.0) + 1.0)*level_ids
+    shifted = boxes[:, 0:5].copy()
+    shifted[:, 0:4] += shift[:, None]
+    keep = nms(shifted, overlap_threshold=0.5)
+    return boxes[keep]
+
+
+def _pyramid_buckets(levels, bucket_fill):
+    """Group pyramid levels into buckets that can share one padded batch.
+
+    Images in one bucket have the same height and width parity so that the
+    top and left padding is even.
+    """
+    by_parity = {}
+    for level in levels:
+        h, w = level[1].shape[1:]
+        by_parity.setdefault((h % 2, w % 2), []).append(level)
+
+    buckets = []
+    for group in by_parity.values():
+        group.sort(key=lambda level: level[1].shape[1]*level[1].shape[2], reverse=True)
+        bucket, canvas_area = [], 0
+        for level in group:
+            area = level[1].shape[1]*level[1].shape[2]
+            if bucket and area < bucket_fill*canvas_area:
+                buckets.append(bucket)
+                bucket = []
+            if not bucket:
+                canvas_area = area
+            bucket.append(level)
+        buckets.append(bucket)
+    return buckets
+
+
 def _generate_bboxes(probs, offsets, scale, threshold):
     """Generate bounding boxes at places
     where there is probably a face.
@@ -0,0 +1,542 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có khóa file giữa các process
+    fcntl = None
+
+from app.core.config import settings
+from app.models.student_faces import StudentFace
+from app.services.face_service.index.index_factory import (
+    METRICS,
+    base_index,
+    build_index,
+    configure_search,
+    min_train_size,
+    reconstruct_all,
+    scores_to_similarity,
+    search_parameters,
+    supports_remove,
+    train_index,
+)
+from app.services.face_service.index.templates import iter_index_entries
+
+
+LEGACY_INDEX_MESSAGE = (
+    "File FAISS index không có ID map (định dạng cũ theo vị trí), vị trí trong index không phải face_id. "
+    "Chạy `python -m app.services.face_service.cli rebuild-index` để tạo lại từ database."
+)
+
+
+class _RWLock:
+    """Khóa đọc/ghi: nhiều search chạy song song, add/reload chạy độc quyền"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._writer or self._readers > 0:
+                self._cond.wait()
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class FaceIndexManager:
+    """
+    Giữ FAISS index trong bộ nhớ cho cả process
+
+    Index được bọc bởi IndexIDMap2 với id = StudentFace.face_id, kết quả search
+    tra cứu được trực tiếp bằng khóa chính.
+
+    - search: dùng chung index đã load, không đọc file mỗi request
+    - add / remove: cập nhật trực tiếp index, ghi file bất đồng bộ (checkpoint)
+    - reload: khi worker khác ghi lại file (mtime thay đổi) thì load lại, các thay đổi
+      chưa ghi của worker này (delta log) được áp lại lên bản vừa đọc
+    - flush: giữ khóa file độc quyền, gộp với file mới nhất rồi mới ghi đè
+    - rebuild_from_db: tạo lại index từ bảng student_faces
+
+    Loại index (flat / hnsw / ivf_flat / ivf_pq), metric (ip / l2) và tham số recall
+    lấy từ index_options. Kết quả search luôn trả về cosine similarity.
+    """
+
+    backend = "faiss"
+
+    def __init__(self, index_path: str, checkpoint_interval: float = 5.0, reload_check_interval: float = 2.0,
+                 index_options: dict = None):
+        self.index_path = index_path
+        self.checkpoint_interval = checkpoint_interval
+        self.reload_check_interval = reload_check_interval
+        self.index_options = {
+            "index_type": "flat",
+            "metric": "ip",
+            "hnsw_m": 32,
+            "ef_construction": 80,
+            "ef_search": 64,
+            "nlist": 256,
+            "nprobe": 16,
+            "pq_m": 64,
+            "pq_nbits": 8,
+            "train_size": 50000,
+            **(index_options or {}),
+        }
+
+        self._index = None
+        self._lock = _RWLock()
+        self._io_lock = threading.Lock()
+        self._flush_timer = None
+
+        self._loaded_mtime = None
+        self._last_reload_check = 0.0
+        self._version = 0
+        self._persisted_version = 0
+        self._reload_count = 0
+        self._legacy_file = False  # file hiện tại là index cũ theo vị trí, không dùng được
+        self._last_persisted_at = None
+
+        # Delta log: thay đổi chưa ghi xuống file, áp lại khi worker khác đã ghi file trước
+        self._pending_add = {}  # face_id -> vector
+        self._pending_remove = set()
+        self._overwrite = False  # rebuild / convert: bản trong bộ nhớ thay thế hoàn toàn file
+
+    # ------------------------------------------------------------------
+    # Load / reload
+    # ------------------------------------------------------------------
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.index_path)
+        except OSError:
+            return None
+
+    def _create_index(self, d: int, train_vectors: np.ndarray = None) -> faiss.Index:
+        """Tạo index rỗng theo cấu hình, train nếu loại index yêu cầu"""
+        opts = self.index_options
+        index_type = opts["index_type"]
+        required = min_train_size(index_type, opts["nlist"], opts["pq_nbits"])
+        if required and (train_vectors is None or len(train_vectors) < required):
+            print(f"[FAISS] ⚠️ Cần ít nhất {required} embedding để train index {index_type}, tạm dùng flat. "
+                  f"Chạy rebuild-index khi đủ dữ liệu.")
+            index_type = "flat"
+
+        index = build_index(
+            index_type, d,
+            metric=METRICS[opts["metric"]],
+            hnsw_m=opts["hnsw_m"],
+            ef_construction=opts["ef_construction"],
+            nlist=opts["nlist"],
+            pq_m=opts["pq_m"],
+            pq_nbits=opts["pq_nbits"],
+        )
+        if not index.is_trained:
+            train_index(index, train_vectors)
+        configure_search(index, ef_search=opts["ef_search"], nprobe=opts["nprobe"])
+        return index
+
+    def _search_parameters(self, selector=None):
+        return search_parameters(
+            self._index, selector,
+            ef_search=self.index_options["ef_search"],
+            nprobe=self.index_options["nprobe"],
+        )
+
+    def _is_dirty(self) -> bool:
+        return self._version != self._persisted_version
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and self._index is not None and now - self._last_reload_check < self.reload_check_interval:
+            return
+        self._last_reload_check = now
+
+        mtime = self._file_mtime()
+        if mtime is None or mtime == self._loaded_mtime:
+            return
+        # Index vừa rebuild / convert chưa ghi thì bản trong bộ nhớ thắng
+        if self._overwrite and self._is_dirty():
+            return
+
+        index = faiss.read_index(self.index_path)
+        if not isinstance(index, faiss.IndexIDMap):
+            # Không nạp: search sẽ đọc vị trí như face_id và trả về sai sinh viên
+            with self._lock.write():
+                self._index = None
+                self._legacy_file = True
+                self._loaded_mtime = mtime
+            print(f"[FAISS] ⚠️ {LEGACY_INDEX_MESSAGE}")
+            return
+        if index.metric_type != METRICS[self.index_options["metric"]]:
+            print(f"[FAISS] ⚠️ Metric của index khác cấu hình ({self.index_options['metric']}). "
+                  f"Chạy `python -m app.services.face_service.cli convert-index` để chuyển đổi.")
+        configure_search(index, ef_search=self.index_options["ef_search"], nprobe=self.index_options["nprobe"])
+        with self._lock.write():
+            if self._file_mtime() != mtime:
+                return  # file lại vừa bị ghi trong lúc đọc, lần kiểm tra sau sẽ load bản mới
+            # Worker khác đã ghi file: giữ thay đổi của worker này bằng cách áp lại delta log
+            if self._is_dirty():
+                index = self._apply_pending(index)
+            self._index = index
+            self._legacy_file = False
+            self._loaded_mtime = mtime
+            self._reload_count += 1
+        print(f"[FAISS] Loaded index from {self.index_path} ({index.ntotal} vectors)")
+
+    def _apply_pending(self, index: faiss.Index) -> faiss.Index:
+        """Áp delta log lên index vừa đọc từ file (idempotent: xóa id trước khi thêm lại)"""
+        replaced = self._pending_remove | set(self._pending_add)
+        if replaced:
+            index, _ = self._remove_from(index, np.fromiter(replaced, dtype=np.int64))
+        if self._pending_add:
+            ids = np.fromiter(self._pending_add, dtype=np.int64)
+            index.add_with_ids(np.vstack(list(self._pending_add.values())).astype(np.float32), ids)
+        return index
+
+    def reload(self):
+        """Buộc đọc lại index từ file"""
+        self._maybe_reload(force=True)
+
+    # ------------------------------------------------------------------
+    # Search / add
+    # ------------------------------------------------------------------
+    def search(self, query_vectors: np.ndarray, k: int = 1, ids=None):
+        """
+        Tìm k vector gần nhất (query phải được chuẩn hóa L2)
+
+        Args:
+            query_vectors: ma trận float32 [n, d]
+            k: số kết quả cho mỗi vector
+            ids: nếu có, chỉ tìm trong các id này (vd: sinh viên của lớp học)
+
+        Returns:
+            (S, I): S là cosine similarity [n, k], I là face_id [n, k],
+            id = -1 (similarity = -1) nếu không đủ k kết quả
+        """
+        self._maybe_reload()
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+
+        selector = None
+        if ids is not None:
+            ids = np.ascontiguousarray(ids, dtype=np.int64)
+            # ids phải được giữ tham chiếu tới khi search xong
+            selector = faiss.IDSelectorBatch(ids.size, faiss.swig_ptr(ids))
+
+        with self._lock.read():
+            if self._legacy_file:
+                raise ValueError(LEGACY_INDEX_MESSAGE)
+            if self._index is None or self._index.ntotal == 0:
+                raise ValueError("Không tìm thấy file FAISS index. Vui lòng tạo ít nhất một sinh viên trước.")
+            if selector is None:
+                D, I = self._index.search(query_vectors, k)
+            else:
+                D, I = self._index.search(query_vectors, k, params=self._search_parameters(selector))
+            return scores_to_similarity(D, I, self._index.metric_type), I
+
+    def add(self, vectors: np.ndarray, ids, db=None) -> list:
+        """
+        Thêm vector vào index trong bộ nhớ và lên lịch ghi file
+
+        Args:
+            vectors: ma trận float32 [n, d]
+            ids: face_id tương ứng với từng vector
+            db: không dùng (chỉ backend pgvector cần session của transaction đang ghi)
+
+        Returns:
+            list: các id vừa thêm
+        """
+        return self.replace([], vectors, ids)
+
+    def replace(self, remove_ids, vectors: np.ndarray, ids, db=None) -> list:
+        """
+        Xóa remove_ids rồi thêm (vectors, ids) trong cùng một lần giữ khóa ghi
+
+        Search không bao giờ thấy trạng thái giữa chừng (vd: thay vector trung bình của
+        sinh viên ở chế độ centroid). db: không dùng, như add().
+        """
+        remove_ids = np.ascontiguousarray(remove_ids, dtype=np.int64).reshape(-1)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        ids = np.ascontiguousarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) != len(vectors):
+            raise ValueError("Số lượng id không khớp với số vector.")
+
+        # Luôn kiểm tra file trước khi sửa để không thêm vào một bản cũ
+        self._maybe_reload(force=True)
+        with self._lock.write():
+            if self._legacy_file:
+                # Thêm vào index mới rồi ghi đè sẽ làm mất toàn bộ sinh viên trong file cũ
+                raise ValueError(LEGACY_INDEX_MESSAGE)
+            if self._index is None:
+                if not len(ids):
+                    return []
+                self._index = self._create_index(vectors.shape[1])
+            if remove_ids.size:
+                self._index, _ = self._remove_from(self._index, remove_ids)
+                for face_id in remove_ids.tolist():
+                    self._pending_add.pop(face_id, None)
+                    self._pending_remove.add(face_id)
+            if len(ids):
+                self._index.add_with_ids(vectors, ids)
+                for face_id, vector in zip(ids.tolist(), vectors):
+                    self._pending_add[face_id] = vector
+                    self._pending_remove.discard(face_id)
+            self._version += 1
+        self._schedule_flush()
+        return ids.tolist()
+
+    def remove(self, ids) -> int:
+        """Xóa các vector theo face_id, trả về số vector đã xóa"""
+        ids = np.ascontiguousarray(ids, dtype=np.int64).reshape(-1)
+        if ids.size == 0:
+            return 0
+
+        self._maybe_reload(force=True)
+        with self._lock.write():
+            if self._index is None:
+                return 0
+            self._index, removed = self._remove_from(self._index, ids)
+            for face_id in ids.tolist():
+                self._pending_add.pop(face_id, None)
+                self._pending_remove.add(face_id)
+            if removed:
+                self._version += 1
+        if removed:
+            self._schedule_flush()
+        return removed
+
+    def _remove_from(self, index: faiss.Index, ids: np.ndarray):
+        """Xóa vector theo id, trả về (index, số vector đã xóa)"""
+        if supports_remove(index):
+            return index, index.remove_ids(ids)
+        return self._remove_by_rebuild(index, ids)
+
+    def _remove_by_rebuild(self, index: faiss.Index, ids: np.ndarray):
+        """Xóa vector với index không hỗ trợ remove_ids (HNSW): tạo lại từ các vector còn lại"""
+        all_ids = faiss.vector_to_array(index.id_map)
+        keep = ~np.isin(all_ids, ids)
+        removed = int((~keep).sum())
+        if removed == 0:
+            return index, 0
+
+        base = base_index(index)
+        vectors = base.reconstruct_n(0, base.ntotal)[keep]
+        rebuilt = self._create_index(index.d, vectors)
+        if len(vectors):
+            rebuilt.add_with_ids(vectors, all_ids[keep])
+        return rebuilt, removed
+
+    def _replace_index(self, index: faiss.Index):
+        """Thay toàn bộ index (rebuild / convert), file hiện có sẽ bị ghi đè thay vì gộp"""
+        with self._lock.write():
+            self._index = index
+            self._legacy_file = False
+            self._pending_add.clear()
+            self._pending_remove.clear()
+            self._overwrite = True
+            self._version += 1
+
+    def convert(self) -> int:
+        """
+        Chuyển index hiện có sang loại index / metric đang cấu hình mà không cần database
+
+        Chỉ chạy với index có ID map; index cũ theo vị trí phải tạo lại bằng rebuild-index
+        vì vị trí không phải face_id.
+
+        Returns:
+            int: số vector đã chuyển
+        """
+        self._maybe_reload(force=True)
+        with self._lock.write():
+            if self._legacy_file:
+                raise ValueError(LEGACY_INDEX_MESSAGE)
+            if self._index is None:
+                raise ValueError("Không tìm thấy file FAISS index.")
+            ids, vectors = reconstruct_all(self._index)
+            d = self._index.d
+        index = self._create_index(d, vectors[:self.index_options["train_size"]])
+        if len(vectors):
+            index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+        self._replace_index(index)
+        self.flush()
+        print(f"[FAISS] Converted index to {self.index_options['index_type']}/{self.index_options['metric']} "
+              f"({index.ntotal} vectors)")
+        return index.ntotal
+
+    def rebuild_from_db(self, db, batch_size: int = 1000, template_mode: str = "all") -> int:
+        """
+        Tạo lại index từ StudentFace.embedding_vector, đọc theo từng lô
+
+        Với index IVF, FACE_INDEX_TRAIN_SIZE embedding đầu tiên được dùng để train.
+        template_mode: all (mọi template) hoặc centroid (một vector trung bình / sinh viên).
+
+        Returns:
+            int: số vector trong index mới
+        """
+        train_vectors = None
+        if min_train_size(self.index_options["index_type"], self.index_options["nlist"], self.index_options["pq_nbits"]):
+            train_rows = db.query(StudentFace.embedding_vector).filter(
+                StudentFace.embedding_vector.isnot(None)
+            ).limit(self.index_options["train_size"]).all()
+            if train_rows:
+                train_vectors = np.vstack([np.frombuffer(blob, dtype=np.float32) for (blob,) in train_rows])
+
+        index = None
+        batch_ids, batch_vectors = [], []
+
+        def add_batch():
+            index.add_with_ids(
+                np.vstack(batch_vectors).astype(np.float32),
+                np.asarray(batch_ids, dtype=np.int64)
+            )
+            batch_ids.clear()
+            batch_vectors.clear()
+
+        for face_id, vector in iter_index_entries(db, template_mode, batch_size):
+            if index is None:
+                index = self._create_index(vector.shape[0], train_vectors)
+            batch_ids.append(face_id)
+            batch_vectors.append(vector)
+            if len(batch_ids) >= batch_size:
+                add_batch()
+
+        if index is None:
+            raise ValueError("Không có embedding nào trong bảng student_faces.")
+        if batch_ids:
+            add_batch()
+
+        self._replace_index(index)
+        self.flush()
+        print(f"[FAISS] Rebuilt index from database ({index.ntotal} vectors)")
+        return index.ntotal
+
+    # ------------------------------------------------------------------
+    # Persist
+    # ------------------------------------------------------------------
+    def _schedule_flush(self):
+        with self._io_lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.checkpoint_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    @contextmanager
+    def _file_lock(self):
+        """Khóa độc quyền giữa các worker trong lúc gộp và ghi file index"""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.index_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def flush(self):
+        """
+        Ghi index xuống file nếu có thay đổi (ghi file tạm rồi thay thế)
+
+        Trong khóa file: nếu worker khác đã ghi file từ lần load cuối thì đọc lại và áp
+        delta log của worker này trước khi ghi, không ghi đè mất vector của worker khác.
+        """
+        with self._io_lock:
+            self._flush_timer = None
+            if not self._is_dirty() or self._index is None:
+                return
+
+            with self._file_lock():
+                self._maybe_reload(force=True)
+                with self._lock.read():
+                    version = self._version
+                    data = faiss.serialize_index(self._index)
+
+                tmp_path = f"{self.index_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data.tobytes())
+                os.replace(tmp_path, self.index_path)
+                mtime = self._file_mtime()
+
+            with self._lock.write():
+                self._persisted_version = version
+                self._loaded_mtime = mtime
+                # Có thay đổi mới trong lúc ghi thì giữ delta log (áp lại nhiều lần vẫn đúng)
+                if self._version == version:
+                    self._pending_add.clear()
+                    self._pending_remove.clear()
+                    self._overwrite = False
+            self._last_persisted_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            print(f"[FAISS] Persisted index to {self.index_path}")
+
+    def stats(self) -> dict:
+        index = self._index
+        return {
+            "backend": self.backend,
+            "index_path": self.index_path,
+            "ntotal": index.ntotal if index is not None else 0,
+            "dimension": index.d if index is not None else None,
+            "index_type": type(base_index(index)).__name__ if index is not None else None,
+            "configured_type": self.index_options["index_type"],
+            "metric": ("ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2") if index is not None else None,
+            "dirty": self._is_dirty(),
+            "legacy_file": self._legacy_file,
+            "pending_changes": len(self._pending_add) + len(self._pending_remove),
+            "reload_count": self._reload_count,
+            "last_persisted_at": self._last_persisted_at,
+        }
+
+
+def _create_face_index():
+    if settings.FACE_INDEX_BACKEND == "pgvector":
+        from app.services.face_service.index.pgvector_index import PgVectorFaceIndex
+
+        return PgVectorFaceIndex(ef_search=settings.FACE_INDEX_EF_SEARCH, probes=settings.FACE_INDEX_NPROBE)
+    if settings.FACE_INDEX_BACKEND != "faiss":
+        raise ValueError(f"FACE_INDEX_BACKEND không hợp lệ: {settings.FACE_INDEX_BACKEND} (faiss | pgvector)")
+    return FaceIndexManager(
+        settings.FACE_INDEX_PATH,
+        checkpoint_interval=settings.FACE_INDEX_CHECKPOINT_SECONDS,
+        reload_check_interval=settings.FACE_INDEX_RELOAD_CHECK_SECONDS,
+        index_options={
+            "index_type": settings.FACE_INDEX_TYPE,
+            "metric": settings.FACE_INDEX_METRIC,
+            "hnsw_m": settings.FACE_INDEX_HNSW_M,
+            "ef_construction": settings.FACE_INDEX_EF_CONSTRUCTION,
+            "ef_search": settings.FACE_INDEX_EF_SEARCH,
+            "nlist": settings.FACE_INDEX_NLIST,
+            "nprobe": settings.FACE_INDEX_NPROBE,
+            "pq_m": settings.FACE_INDEX_PQ_M,
+            "pq_nbits": settings.FACE_INDEX_PQ_NBITS,
+            "train_size": settings.FACE_INDEX_TRAIN_SIZE,
+        },
+    )
+
+
+face_index = _create_face_index()
@@ -0,0 +1,127 @@
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+# Embedding đã chuẩn hóa L2 nên inner product = cosine similarity
+METRICS = {
+    "l2": faiss.METRIC_L2,
+    "ip": faiss.METRIC_INNER_PRODUCT,
+}
+
+
+def min_train_size(index_type: str, nlist: int, pq_nbits: int = 8) -> int:
+    """Số vector tối thiểu để train index (0 nếu không cần train)"""
+    if index_type == "ivf_flat":
+        return nlist
+    if index_type == "ivf_pq":
+        return max(nlist, 2 ** pq_nbits)
+    return 0
+
+
+def build_index(index_type: str, d: int, metric=faiss.METRIC_L2,
+                hnsw_m: int = 32, ef_construction: int = 80,
+                nlist: int = 256, pq_m: int = 64, pq_nbits: int = 8) -> faiss.Index:
+    """
+    Tạo index rỗng theo cấu hình, bọc trong IndexIDMap2 (id = face_id)
+
+    - flat: quét toàn bộ, kết quả chính xác
+    - hnsw: đồ thị HNSW, không cần train
+    - ivf_flat: phân cụm IVF, cần train
+    - ivf_pq: IVF + nén Product Quantization, cần train, tốn ít bộ nhớ nhất
+    """
+    if index_type == "flat":
+        description = "IDMap2,Flat"
+    elif index_type == "hnsw":
+        description = f"IDMap2,HNSW{hnsw_m}"
+    elif index_type == "ivf_flat":
+        description = f"IDMap2,IVF{nlist},Flat"
+    elif index_type == "ivf_pq":
+        if d % pq_m != 0:
+            raise ValueError(f"Số chiều {d} phải chia hết cho FACE_INDEX_PQ_M={pq_m}")
+        description = f"IDMap2,IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    else:
+        raise ValueError(f"Loại index không hợp lệ: {index_type} (hỗ trợ: {', '.join(INDEX_TYPES)})")
+
+    index = faiss.index_factory(d, description, metric)
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efConstruction = ef_construction
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """Index thực sự bên trong IndexIDMap"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def configure_search(index: faiss.Index, ef_search: int = 64, nprobe: int = 16):
+    """Đặt tham số recall mặc định (efSearch / nprobe) cho index"""
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = nprobe
+
+
+def search_parameters(index: faiss.Index, selector=None, ef_search: int = 64, nprobe: int = 16):
+    """
+    Tạo SearchParameters đúng loại với index (IVF/HNSW bắt buộc dùng loại riêng)
+    """
+    base = base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search
+    elif isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW không hỗ trợ remove_ids, phải tạo lại index"""
+    return not isinstance(base_index(index), faiss.IndexHNSW)
+
+
+def scores_to_similarity(D: np.ndarray, I: np.ndarray, metric_type) -> np.ndarray:
+    """
+    Đổi kết quả search sang cosine similarity (vector đã chuẩn hóa L2)
+
+    - METRIC_INNER_PRODUCT: D chính là cosine
+    - METRIC_L2: D là L2 bình phương, cos = 1 - D / 2
+    Vị trí không có kết quả (id = -1) nhận similarity = -1.
+    """
+    if metric_type == faiss.METRIC_INNER_PRODUCT:
+        similarity = D.astype(np.float32)
+    else:
+        similarity = 1.0 - D.astype(np.float32) / 2.0
+    similarity[I < 0] = -1.0
+    return similarity
+
+
+def reconstruct_all(index: faiss.Index):
+    """
+    Lấy lại toàn bộ (ids, vectors) của index (PQ chỉ khôi phục xấp xỉ)
+
+    Chỉ dùng cho index có ID map: vị trí trong index cũ không phải face_id.
+    """
+    if not isinstance(index, faiss.IndexIDMap):
+        raise ValueError("Index không có ID map (định dạng cũ theo vị trí), không thể khôi phục face_id. "
+                         "Chạy `python -m app.services.face_service.cli rebuild-index` để tạo lại từ database.")
+    base = base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    vectors = base.reconstruct_n(0, base.ntotal)
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    return ids, vectors
+
+
+def train_index(index: faiss.Index, train_vectors: np.ndarray):
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
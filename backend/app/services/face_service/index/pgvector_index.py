@@ -0,0 +1,244 @@
+import numpy as np
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services.face_service.index.templates import iter_index_entries
+
+ANN_INDEX_NAME = "ix_student_faces_embedding_ann"
+ANN_INDEX_TYPES = ("hnsw", "ivfflat")
+
+# Mỗi vector truy vấn là một dòng của unnest(), k-NN chạy trong LATERAL để dùng được index ANN
+_MATCH_SQL = """
+SELECT q.ord, m.face_id, m.distance
+FROM unnest(CAST(:queries AS text[])) WITH ORDINALITY AS q(vec, ord)
+CROSS JOIN LATERAL (
+    SELECT sf.face_id, sf.embedding <=> CAST(q.vec AS vector) AS distance
+    FROM student_faces sf
+    {join}
+    WHERE sf.embedding IS NOT NULL {where}
+    ORDER BY sf.embedding <=> CAST(q.vec AS vector)
+    LIMIT :k
+) m
+ORDER BY q.ord, m.distance
+"""
+
+# Tìm có lọc (theo lớp / danh sách id): index ANN lọc sau khi đã lấy ef_search ứng viên toàn bảng
+# nên lớp nhỏ trong bảng lớn thường thiếu kết quả. Lấy trước các dòng của lớp (MATERIALIZED
+# để planner không gộp lại vào ORDER BY trên index) rồi tính khoảng cách chính xác trên tập đó.
+_FILTERED_MATCH_SQL = """
+WITH candidates AS MATERIALIZED (
+    SELECT sf.face_id, sf.embedding
+    FROM student_faces sf
+    {join}
+    WHERE sf.embedding IS NOT NULL {where}
+)
+SELECT q.ord, m.face_id, m.distance
+FROM unnest(CAST(:queries AS text[])) WITH ORDINALITY AS q(vec, ord)
+CROSS JOIN LATERAL (
+    SELECT c.face_id, c.embedding <=> CAST(q.vec AS vector) AS distance
+    FROM candidates c
+    ORDER BY distance
+    LIMIT :k
+) m
+ORDER BY q.ord, m.distance
+"""
+
+_ROSTER_JOIN = """
+    JOIN enrollments e ON e.student_id = sf.student_id
+    JOIN schedules sc ON sc.course_class_id = e.course_class_id AND sc.schedule_id = :schedule_id
+"""
+
+
+def to_pgvector(vector) -> str:
+    """numpy vector -> chuỗi '[x1,x2,...]' của pgvector"""
+    return "[" + ",".join("%.7g" % v for v in np.asarray(vector, dtype=np.float32).ravel()) + "]"
+
+
+class PgVectorFaceIndex:
+    """
+    Backend nhận diện lưu embedding trong cột student_faces.embedding (pgvector)
+
+    Cùng interface với FaceIndexManager nhưng không có file index: mọi worker đọc
+    cùng một bảng nên không cần reload / checkpoint. Embedding nhị phân trong
+    embedding_vector vẫn là nguồn gốc, rebuild_from_db() chép lại sang cột vector.
+
+    Tìm kiếm dùng khoảng cách cosine (<=>) với index HNSW hoặc IVFFlat,
+    kết quả trả về cosine similarity như FAISS. Tìm trong một lớp / danh sách id
+    tính chính xác trên các dòng đã lọc, không qua index ANN.
+    """
+
+    backend = "pgvector"
+
+    def __init__(self, session_factory=SessionLocal, ef_search: int = 64, probes: int = 16):
+        self.session_factory = session_factory
+        self.ef_search = ef_search
+        self.probes = probes
+
+    def _match(self, query_vectors: np.ndarray, k: int, join: str = "", where: str = "", params: dict = None):
+        """join / where: lọc ứng viên, có lọc thì tính khoảng cách chính xác thay vì qua index ANN"""
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        S = np.full((len(query_vectors), k), -1.0, dtype=np.float32)
+        I = np.full((len(query_vectors), k), -1, dtype=np.int64)
+        if len(query_vectors) == 0:
+            return S, I
+
+        db = self.session_factory()
+        try:
+            # Tham số ANN chỉ áp dụng cho transaction hiện tại
+            db.execute(text(f"SET LOCAL hnsw.ef_search = {int(self.ef_search)}"))
+            db.execute(text(f"SET LOCAL ivfflat.probes = {int(self.probes)}"))
+            sql = _FILTERED_MATCH_SQL if join or where else _MATCH_SQL
+            rows = db.execute(
+                text(sql.format(join=join, where=where)),
+                {"queries": [to_pgvector(v) for v in query_vectors], "k": k, **(params or {})},
+            ).all()
+        finally:
+            db.close()
+
+        filled = {}
+        for ord_, face_id, distance in rows:
+            row = ord_ - 1
+            col = filled.get(row, 0)
+            S[row, col] = 1.0 - distance
+            I[row, col] = face_id
+            filled[row] = col + 1
+        return S, I
+
+    def search(self, query_vectors: np.ndarray, k: int = 1, ids=None):
+        """
+        Tìm k embedding gần nhất, ids: chỉ tìm trong các face_id này
+
+        Returns:
+            (S, I): cosine similarity và face_id [n, k], -1 nếu không đủ k kết quả
+        """
+        if ids is None:
+            return self._match(query_vectors, k)
+        return self._match(query_vectors, k, where="AND sf.face_id = ANY(:ids)",
+                           params={"ids": [int(i) for i in ids]})
+
+    def search_schedule(self, query_vectors: np.ndarray, schedule_id: int, k: int = 1):
+        """Như search() nhưng chỉ so với khuôn mặt của sinh viên đăng ký lớp (khoảng cách chính xác)"""
+        return self._match(query_vectors, k, join=_ROSTER_JOIN, params={"schedule_id": schedule_id})
+
+    def add(self, vectors: np.ndarray, ids, db=None) -> list:
+        """
+        Ghi embedding vào cột vector của các dòng student_faces đã có
+
+        db: session của transaction đang tạo dòng (chưa commit); không truyền thì dùng session riêng
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        ids = [int(i) for i in ids]
+        session = db or self.session_factory()
+        try:
+            session.execute(
+                text("UPDATE student_faces SET embedding = CAST(:embedding AS vector) WHERE face_id = :face_id"),
+                [{"face_id": face_id, "embedding": to_pgvector(v)} for face_id, v in zip(ids, vectors)],
+            )
+            if db is None:
+                session.commit()
+        finally:
+            if db is None:
+                session.close()
+        return ids
+
+    def replace(self, remove_ids, vectors: np.ndarray, ids, db=None) -> list:
+        """Xóa vector của remove_ids rồi ghi (vectors, ids) trong cùng một transaction (của db nếu có)"""
+        remove_ids = [int(i) for i in np.asarray(remove_ids).reshape(-1)]
+        session = db or self.session_factory()
+        try:
+            if remove_ids:
+                session.execute(
+                    text("UPDATE student_faces SET embedding = NULL WHERE face_id = ANY(:ids) AND embedding IS NOT NULL"),
+                    {"ids": remove_ids},
+                )
+            ids = self.add(vectors, ids, db=session) if len(ids) else []
+            if db is None:
+                session.commit()
+        finally:
+            if db is None:
+                session.close()
+        return ids
+
+    def remove(self, ids) -> int:
+        ids = [int(i) for i in np.asarray(ids).reshape(-1)]
+        if not ids:
+            return 0
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                text("UPDATE student_faces SET embedding = NULL WHERE face_id = ANY(:ids) AND embedding IS NOT NULL"),
+                {"ids": ids},
+            )
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+    def rebuild_from_db(self, db, batch_size: int = 1000, template_mode: str = "all") -> int:
+        """
+        Chép lại embedding_vector (bytes float32) sang cột vector, theo từng lô
+
+        template_mode=centroid: chỉ dòng ảnh chính của mỗi sinh viên giữ vector trung bình.
+        """
+        db.execute(text("UPDATE student_faces SET embedding = NULL WHERE embedding IS NOT NULL"))
+
+        total = 0
+        batch = []
+        for face_id, vector in iter_index_entries(db, template_mode, batch_size):
+            batch.append((face_id, vector))
+            if len(batch) >= batch_size:
+                total += len(batch)
+                self.add([v for _, v in batch], [i for i, _ in batch], db=db)
+                batch = []
+        if batch:
+            total += len(batch)
+            self.add([v for _, v in batch], [i for i, _ in batch], db=db)
+        if total == 0:
+            raise ValueError("Không có embedding nào trong bảng student_faces.")
+        db.commit()
+        print(f"[PGVECTOR] Backfilled {total} embeddings")
+        return total
+
+    def create_ann_index(self, db, index_type: str = "hnsw", m: int = 16, ef_construction: int = 64,
+                         lists: int = 100) -> str:
+        """Tạo lại index ANN trên cột vector (HNSW hoặc IVFFlat, IVFFlat nên tạo sau khi đã có dữ liệu)"""
+        if index_type not in ANN_INDEX_TYPES:
+            raise ValueError(f"Loại index pgvector không hợp lệ: {index_type} (chọn một trong {ANN_INDEX_TYPES})")
+        if index_type == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            options = f"lists = {int(lists)}"
+        db.execute(text(f"DROP INDEX IF EXISTS {ANN_INDEX_NAME}"))
+        db.execute(text(
+            f"CREATE INDEX {ANN_INDEX_NAME} ON student_faces USING {index_type} (embedding vector_cosine_ops) "
+            f"WITH ({options})"
+        ))
+        db.commit()
+        return f"{index_type} ({options})"
+
+    def convert(self) -> int:
+        raise ValueError("convert-index chỉ dùng cho FAISS, với pgvector hãy chạy pgvector-index.")
+
+    def reload(self):
+        pass  # dữ liệu nằm trong database, không có bản sao trong process
+
+    def flush(self):
+        pass
+
+    def stats(self) -> dict:
+        db = self.session_factory()
+        try:
+            total = db.execute(text("SELECT count(*) FROM student_faces WHERE embedding IS NOT NULL")).scalar()
+            definition = db.execute(
+                text("SELECT indexdef FROM pg_indexes WHERE tablename = 'student_faces' AND indexname = :name"),
+                {"name": ANN_INDEX_NAME},
+            ).scalar()
+        finally:
+            db.close()
+        return {
+            "backend": self.backend,
+            "ntotal": total,
+            "ann_index": definition,
+            "ef_search": self.ef_search,
+            "probes": self.probes,
+        }
@@ -0,0 +1,72 @@
+import numpy as np
+
+from app.models.student_faces import StudentFace
+
+# all: mọi template của sinh viên đều nằm trong index (id = face_id)
+# centroid: mỗi sinh viên một vector trung bình, id = face_id của ảnh chính
+TEMPLATE_MODES = ("all", "centroid")
+AGGREGATIONS = ("max", "mean")
+
+
+def centroid(vectors: np.ndarray) -> np.ndarray:
+    """Trung bình các embedding đã chuẩn hóa, chuẩn hóa lại -> [1, d]"""
+    mean = np.asarray(vectors, dtype=np.float32).mean(axis=0, keepdims=True)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm else mean
+
+
+def _group_entries(rows):
+    """rows (face_id, is_primary, vector) của một sinh viên -> (id ảnh chính, vector trung bình)"""
+    primary = next((face_id for face_id, is_primary, _ in rows if is_primary), rows[0][0])
+    return primary, centroid(np.vstack([vector for _, _, vector in rows]))[0]
+
+
+def iter_index_entries(db, mode: str = "all", batch_size: int = 1000):
+    """
+    Các cặp (id, vector) cần có trong index theo chế độ template, đọc student_faces theo từng lô
+
+    Chế độ centroid đọc theo student_id để gom các template liên tiếp của cùng sinh viên.
+    """
+    if mode not in TEMPLATE_MODES:
+        raise ValueError(f"FACE_TEMPLATE_MODE không hợp lệ: {mode} (chọn một trong {TEMPLATE_MODES})")
+
+    query = db.query(
+        StudentFace.face_id, StudentFace.student_id, StudentFace.is_primary, StudentFace.embedding_vector
+    ).filter(StudentFace.embedding_vector.isnot(None))
+
+    if mode == "all":
+        for face_id, _, _, blob in query.order_by(StudentFace.face_id).yield_per(batch_size):
+            yield face_id, np.frombuffer(blob, dtype=np.float32)
+        return
+
+    current, rows = None, []
+    for face_id, student_id, is_primary, blob in query.order_by(
+        StudentFace.student_id, StudentFace.face_id
+    ).yield_per(batch_size):
+        if student_id != current and rows:
+            yield _group_entries(rows)
+            rows = []
+        current = student_id
+        rows.append((face_id, is_primary, np.frombuffer(blob, dtype=np.float32)))
+    if rows:
+        yield _group_entries(rows)
+
+
+def student_index_entries(db, student_id: int, mode: str = "all"):
+    """
+    Cập nhật index cho một sinh viên: (id cần xóa, id cần thêm, vector cần thêm)
+
+    Chế độ all thêm lại mọi template, centroid thay vector trung bình dưới id ảnh chính.
+    """
+    rows = db.query(StudentFace.face_id, StudentFace.is_primary, StudentFace.embedding_vector).filter(
+        StudentFace.student_id == student_id, StudentFace.embedding_vector.isnot(None)
+    ).order_by(StudentFace.face_id).all()
+    remove_ids = [face_id for face_id, _, _ in rows]
+    if not rows:
+        return remove_ids, [], np.zeros((0, 0), dtype=np.float32)
+
+    rows = [(face_id, is_primary, np.frombuffer(blob, dtype=np.float32)) for face_id, is_primary, blob in rows]
+    if mode == "centroid":
+        primary, vector = _group_entries(rows)
+        return remove_ids, [primary], vector[None]
+    return remove_ids, remove_ids, np.vstack([vector for _, _, vector in rows])
@@ -0,0 +1,118 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+
+class InferencePool:
+    """
+    Thread pool riêng cho các tác vụ nhận diện nặng CPU
+
+    Endpoint async await kết quả thay vì gọi trực tiếp, event loop của uvicorn
+    không bị chặn. Số tác vụ đang chờ bị giới hạn (back-pressure): vượt quá thì
+    trả về 503 ngay, chờ quá timeout thì trả về 504.
+
+    Chỉ gửi phần inference (decode, detection, embedding) vào pool: tác vụ quá timeout
+    vẫn chạy tiếp, nên không được dùng session database của request (get_db đóng nó
+    khi request kết thúc, Session không thread-safe).
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16, timeout: float = 30.0, torch_threads: int = 0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # Chia đều số core cho các worker để các forward pass không tranh nhau
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // max_workers)
+
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "active": 0,
+            "pending": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "total_time_ms": 0.0,
+        }
+
+    def _init_worker(self):
+        # Số thread intra-op đặt trong chính từng worker, không đặt global từ thread gọi đầu tiên
+        torch.set_num_threads(self.torch_threads)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="face-inference", initializer=self._init_worker
+            )
+        return self._executor
+
+    def _update(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _run_task(self, func, args, kwargs):
+        self._update(pending=-1, active=1)
+        start_time = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            self._update(completed=1)
+            return result
+        except Exception:
+            self._update(failed=1)
+            raise
+        finally:
+            self._update(active=-1, total_time_ms=(time.perf_counter() - start_time) * 1000)
+            self._slots.release()
+
+    async def run(self, func, *args, **kwargs):
+        """Chạy func trong pool và await kết quả"""
+        if not self._slots.acquire(blocking=False):
+            self._update(rejected=1)
+            raise HTTPException(status_code=503, detail="Hệ thống nhận diện đang quá tải, vui lòng thử lại sau.")
+
+        self._update(pending=1)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._get_executor(), functools.partial(self._run_task, func, args, kwargs)
+        )
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Tác vụ vẫn chạy nốt trong worker, slot được trả khi nó kết thúc
+            self._update(timeouts=1)
+            raise HTTPException(status_code=504, detail="Quá thời gian xử lý nhận diện khuôn mặt.")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        finished = stats["completed"] + stats["failed"]
+        stats["avg_time_ms"] = round(stats.pop("total_time_ms") / finished, 1) if finished else 0.0
+        stats.update({
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "torch_threads": self.torch_threads,
+        })
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+inference_pool = InferencePool(
+    max_workers=settings.FACE_INFERENCE_WORKERS,
+    max_queue=settings.FACE_INFERENCE_QUEUE_SIZE,
+    timeout=settings.FACE_INFERENCE_TIMEOUT_SECONDS,
+    torch_threads=settings.FACE_INFERENCE_TORCH_THREADS,
+)
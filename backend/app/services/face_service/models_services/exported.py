@@ -0,0 +1,152 @@
+"""
+Export model sang TorchScript / ONNX và load lại để chạy suy luận trên CPU
+
+- backbone: IR-101 (AdaFace)
+- pnet, rnet, onet: 3 mạng của MTCNN
+
+Artifact được đặt tên <name>[.int8].<pt|onnx> trong thư mục artifact_dir.
+"""
+import os
+
+import numpy as np
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ARTIFACT_DIR = os.path.join(BASE_DIR, "exported")
+
+RUNTIMES = ("eager", "torchscript", "onnx")
+
+# Kích thước input mẫu và trục động của từng model
+MODEL_SPECS = {
+    "ir_101": {"example": (1, 3, 112, 112), "dynamic_axes": {0: "batch"}, "outputs": ["feature", "norm"]},
+    "pnet": {"example": (1, 3, 120, 160), "dynamic_axes": {0: "batch", 2: "height", 3: "width"}, "outputs": ["offsets", "probs"],
+             "output_axes": {0: "batch", 2: "out_height", 3: "out_width"}},
+    "rnet": {"example": (4, 3, 24, 24), "dynamic_axes": {0: "batch"}, "outputs": ["offsets", "probs"]},
+    "onet": {"example": (4, 3, 48, 48), "dynamic_axes": {0: "batch"}, "outputs": ["landmarks", "offsets", "probs"]},
+}
+
+
+def artifact_path(name: str, runtime: str, quantize: bool = False, artifact_dir: str = None) -> str:
+    ext = "pt" if runtime == "torchscript" else "onnx"
+    suffix = ".int8" if quantize else ""
+    return os.path.join(artifact_dir or DEFAULT_ARTIFACT_DIR, f"{name}{suffix}.{ext}")
+
+
+class OnnxModule:
+    """Bọc onnxruntime.InferenceSession để gọi giống nn.Module (nhận / trả torch.Tensor)"""
+
+    def __init__(self, path: str, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("Cần cài onnxruntime để dùng FACE_MODEL_RUNTIME=onnx (pip install onnxruntime)") from e
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor):
+        outputs = self.session.run(None, {self.input_name: np.ascontiguousarray(x.detach().cpu().numpy())})
+        return tuple(torch.from_numpy(output) for output in outputs)
+
+    def eval(self):
+        return self
+
+
+def export_module(module: torch.nn.Module, name: str, runtime: str, quantize: bool = False,
+                  artifact_dir: str = None) -> str:
+    """
+    Export một model eager ra artifact
+
+    Với TorchScript, quantize dùng torch dynamic quantization (INT8 cho các lớp Linear).
+    Với ONNX, quantize dùng onnxruntime dynamic quantization (INT8 cho Conv/MatMul).
+    """
+    if runtime not in ("torchscript", "onnx"):
+        raise ValueError(f"Runtime export không hợp lệ: {runtime}")
+
+    spec = MODEL_SPECS[name]
+    path = artifact_path(name, runtime, quantize, artifact_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    module.eval()
+    example = torch.randn(*spec["example"])
+
+    if runtime == "torchscript":
+        if quantize:
+            module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        with torch.no_grad():
+            traced = torch.jit.trace(module, example)
+            traced = torch.jit.freeze(traced)
+        torch.jit.save(traced, path)
+        return path
+
+    fp32_path = artifact_path(name, runtime, False, artifact_dir)
+    dynamic_axes = {"input": spec["dynamic_axes"]}
+    dynamic_axes.update({output: spec.get("output_axes", {0: "batch"}) for output in spec["outputs"]})
+    with torch.no_grad():
+        torch.onnx.export(
+            module, example, fp32_path,
+            input_names=["input"],
+            output_names=spec["outputs"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    return path
+
+
+def load_artifact(name: str, runtime: str, quantize: bool = False, artifact_dir: str = None, num_threads: int = 0):
+    """Load artifact đã export, trả về đối tượng gọi được như model eager"""
+    path = artifact_path(name, runtime, quantize, artifact_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Không tìm thấy artifact {path}. Chạy `python -m app.services.face_service.cli export-models "
+            f"--runtime {runtime}{' --quantize' if quantize else ''}` trước."
+        )
+
+    if runtime == "onnx":
+        return OnnxModule(path, num_threads)
+
+    module = torch.jit.load(path, map_location="cpu")
+    module.eval()
+    if not quantize:
+        try:
+            # Gộp Conv+BN, dùng kernel oneDNN cho CPU
+            module = torch.jit.optimize_for_inference(module)
+        except Exception as e:
+            print(f"[FACE_MODEL] optimize_for_inference không áp dụng được cho {name}: {e}")
+    return module
+
+
+def cosine_parity(reference_outputs, outputs) -> float:
+    """Cosine similarity nhỏ nhất giữa output của model eager và artifact (theo từng mẫu, từng output)"""
+    worst = 1.0
+    for ref, out in zip(reference_outputs, outputs):
+        ref = ref.detach().reshape(ref.shape[0], -1).double()
+        out = out.detach().reshape(out.shape[0], -1).double()
+        cosine = torch.nn.functional.cosine_similarity(ref, out, dim=1)
+        worst = min(worst, float(cosine.min()))
+    return worst
+
+
+def parity_inputs(name: str, n_random: int) -> torch.Tensor:
+    """Input kiểm tra: ảnh khuôn mặt mẫu đã align (cho backbone) + input ngẫu nhiên"""
+    shape = MODEL_SPECS[name]["example"]
+    inputs = [torch.rand(n_random, *shape[1:]) * 2 - 1]
+    if name == "ir_101":
+        import glob
+        from app.services.face_service.embedding.face_embedding import to_input
+        from app.services.face_service.face_alignment import align
+
+        pattern = os.path.join(os.path.dirname(align.__file__), "test_images", "*")
+        for image_file in sorted(glob.glob(pattern)):
+            with open(image_file, "rb") as f:
+                face = align.get_aligned_face(f.read())
+            if face is not None:
+                inputs.append(to_input(face))
+    return torch.cat(inputs, dim=0)
@@ -0,0 +1,147 @@
+import threading
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+# Phương sai Laplacian của khuôn mặt 112x112 rõ nét, dùng để chuẩn hóa điểm tổng hợp
+SHARPNESS_REFERENCE = 200.0
+
+
+class LowQualityFaceError(ValueError):
+    """Khuôn mặt phát hiện được không đạt ngưỡng chất lượng để embedding"""
+
+    def __init__(self, report: dict):
+        self.report = report
+        super().__init__(f"Khuôn mặt không đạt chất lượng ({', '.join(report['reasons'])}), vui lòng chụp lại.")
+
+
+def sharpness(face) -> float:
+    """Phương sai Laplacian trên ảnh xám của khuôn mặt đã align (càng lớn càng nét)"""
+    gray = cv2.cvtColor(np.asarray(face, dtype=np.uint8), cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def pose(landmark):
+    """
+    Ước lượng độ quay đầu từ 5 landmark (x1..x5, y1..y5) -> (yaw, pitch) trong [0, 1], 0 là nhìn thẳng
+
+    yaw: chênh lệch khoảng cách từ mũi tới hai mắt.
+    pitch: độ lệch của mũi khỏi điểm giữa đường mắt -> miệng.
+    """
+    landmark = np.asarray(landmark, dtype=np.float64)
+    left_eye, right_eye, nose, left_mouth, right_mouth = np.stack([landmark[:5], landmark[5:10]], axis=1)
+
+    d_left = np.linalg.norm(nose - left_eye)
+    d_right = np.linalg.norm(nose - right_eye)
+    yaw = abs(d_left - d_right) / max(d_left + d_right, 1e-6)
+
+    eye_center = (left_eye + right_eye) / 2
+    axis = (left_mouth + right_mouth) / 2 - eye_center
+    length = float(np.dot(axis, axis))
+    if length < 1e-6:
+        return float(yaw), 1.0
+    t = np.dot(nose - eye_center, axis) / length  # ~0.5 khi nhìn thẳng
+    return float(yaw), float(min(1.0, abs(t - 0.5) * 2))
+
+
+class QualityGate:
+    """
+    Cổng chất lượng giữa bước căn chỉnh và model embedding
+
+    Chấm độ nét (phương sai Laplacian), kích thước khuôn mặt, góc quay từ landmark
+    và độ tin cậy của detector; khuôn mặt không đạt ngưỡng không được đưa vào IR-101.
+    """
+
+    def __init__(self, enabled: bool = True, min_sharpness: float = 30.0, min_face_size: float = 32.0,
+                 max_yaw: float = 0.4, max_pitch: float = 0.5, min_confidence: float = 0.8):
+        self.enabled = enabled
+        self.min_sharpness = min_sharpness
+        self.min_face_size = min_face_size
+        self.max_yaw = max_yaw
+        self.max_pitch = max_pitch
+        self.min_confidence = min_confidence
+
+        self._lock = threading.Lock()
+        self._stats = {"assessed": 0, "passed": 0, "rejected": 0}
+        self._reasons = {"blur": 0, "small": 0, "pose": 0, "confidence": 0}
+
+    def assess(self, face, box, landmark) -> dict:
+        """face: khuôn mặt đã align (PIL / mảng RGB), box: x1,y1,x2,y2[,score], landmark: x1..x5,y1..y5"""
+        size = float(min(box[2] - box[0], box[3] - box[1]))
+        confidence = float(box[4]) if len(box) > 4 else 1.0
+        sharp = sharpness(face)
+        yaw, pitch = pose(landmark)
+
+        reasons = []
+        if sharp < self.min_sharpness:
+            reasons.append("blur")
+        if size < self.min_face_size:
+            reasons.append("small")
+        if yaw > self.max_yaw or pitch > self.max_pitch:
+            reasons.append("pose")
+        if confidence < self.min_confidence:
+            reasons.append("confidence")
+
+        # Điểm tổng hợp chỉ dùng để chọn frame tốt nhất của cùng một khuôn mặt
+        score = (confidence * (1 - yaw) * (1 - pitch) * min(1.0, sharp / SHARPNESS_REFERENCE)
+                 * min(1.0, size / 112))
+
+        with self._lock:
+            self._stats["assessed"] += 1
+            self._stats["rejected" if reasons else "passed"] += 1
+            for reason in reasons:
+                self._reasons[reason] += 1
+
+        return {
+            "passed": not reasons,
+            "reasons": reasons,
+            "score": round(score, 4),
+            "sharpness": round(sharp, 1),
+            "size": round(size, 1),
+            "yaw": round(yaw, 3),
+            "pitch": round(pitch, 3),
+            "confidence": round(confidence, 4),
+        }
+
+    def check(self, face, box, landmark):
+        """Kiểm tra một khuôn mặt, raise LowQualityFaceError nếu không đạt"""
+        if not self.enabled:
+            return None
+        report = self.assess(face, box, landmark)
+        if not report["passed"]:
+            raise LowQualityFaceError(report)
+        return report
+
+    def filter(self, faces, boxes, landmarks):
+        """Chỉ số các khuôn mặt đạt ngưỡng"""
+        if not self.enabled:
+            return list(range(len(faces)))
+        return [i for i, (face, box, landmark) in enumerate(zip(faces, boxes, landmarks))
+                if self.assess(face, box, landmark)["passed"]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["rejected_by"] = dict(self._reasons)
+        stats["pass_rate"] = round(stats["passed"] / stats["assessed"], 4) if stats["assessed"] else 0.0
+        stats.update({
+            "enabled": self.enabled,
+            "min_sharpness": self.min_sharpness,
+            "min_face_size": self.min_face_size,
+            "max_yaw": self.max_yaw,
+            "max_pitch": self.max_pitch,
+            "min_confidence": self.min_confidence,
+        })
+        return stats
+
+
+quality_gate = QualityGate(
+    enabled=settings.FACE_QUALITY_ENABLED,
+    min_sharpness=settings.FACE_QUALITY_MIN_SHARPNESS,
+    min_face_size=settings.FACE_QUALITY_MIN_FACE_SIZE,
+    max_yaw=settings.FACE_QUALITY_MAX_YAW,
+    max_pitch=settings.FACE_QUALITY_MAX_PITCH,
+    min_confidence=settings.FACE_QUALITY_MIN_CONFIDENCE,
+)
@@ -1,10 +1,25 @@
 # shared/image.py
 import numpy as np
 import cv2
+from PIL import Image
 
-def read_imagefile(file_bytes: bytes) -> np.ndarray:
+def read_imagefile(file_bytes: bytes, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
     np_arr = np.frombuffer(file_bytes, np.uint8)
-    img = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)  # BGR
+    img = cv2.imdecode(np_arr, flags)  # BGR
     if img is None:
         raise ValueError("Không đọc được file ảnh")
     return img
+
+def read_rgb_image(file_bytes: bytes) -> np.ndarray:
+    """Decode ảnh một lần thành mảng RGB uint8 liên tục [H,W,3]"""
+    # Bỏ qua EXIF orientation giống cách PIL đọc ảnh trước đây
+    img = read_imagefile(file_bytes, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def to_rgb_array(image) -> np.ndarray:
+    """bytes (file ảnh) / PIL.Image / mảng RGB -> mảng RGB uint8 liên tục, không copy nếu đã đúng dạng"""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return read_rgb_image(bytes(image))
+    if isinstance(image, Image.Image):
+        image = image.convert('RGB')
+    return np.ascontiguousarray(image, dtype=np.uint8)
@@ -0,0 +1,190 @@
+import itertools
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU giữa từng cặp box [n,4] x [m,4] (x1, y1, x2, y2) -> [n, m]"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :4]
+    b = boxes_b[None, :, :4]
+    w = np.maximum(0.0, np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]))
+    h = np.maximum(0.0, np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]))
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    """Một khuôn mặt được theo dõi qua nhiều frame, nhận dạng bằng bỏ phiếu"""
+
+    def __init__(self, track_id: int, box, landmarks):
+        self.track_id = track_id
+        self.box = box
+        self.landmarks = landmarks
+        self.hits = 1
+        self.missed = 0
+        self.frames_since_embedding = 1  # số frame đã thấy kể từ lần embed trước
+        self.candidate = None  # (điểm chất lượng, khuôn mặt đã align) tốt nhất chờ embed
+        self.embeddings = 0
+        self.votes = {}  # student_id (None = không khớp) -> [similarity, ...]
+        self.best_match = {}  # student_id -> (similarity, face_id) cao nhất
+        self.identity = None
+        self.closed = False  # đã đủ phiếu hoặc hết lượt embed
+        self.recorded = False
+
+    def update(self, box, landmarks):
+        self.box = box
+        self.landmarks = landmarks
+        self.hits += 1
+        self.missed = 0
+        self.frames_since_embedding += 1
+
+    @property
+    def center(self):
+        return np.array([(self.box[0] + self.box[2]) / 2, (self.box[1] + self.box[3]) / 2])
+
+    @property
+    def size(self):
+        return max(self.box[2] - self.box[0], self.box[3] - self.box[1])
+
+    def offer(self, face, score: float):
+        """Giữ lại khuôn mặt có điểm chất lượng cao nhất kể từ lần embed trước"""
+        if self.candidate is None or score > self.candidate[0]:
+            self.candidate = (score, face)
+
+    def take_candidate(self):
+        face = self.candidate[1]
+        self.candidate = None
+        return face
+
+    def add_vote(self, student_id, similarity: float, face_id: int, min_votes: int, max_embeddings: int):
+        self.embeddings += 1
+        self.frames_since_embedding = 0
+        self.votes.setdefault(student_id, []).append(similarity)
+        if student_id is not None:
+            best = self.best_match.get(student_id)
+            if best is None or similarity > best[0]:
+                self.best_match[student_id] = (similarity, face_id)
+
+        # Ứng viên có nhiều phiếu nhất (hòa thì lấy tổng similarity lớn hơn)
+        candidate, scores = max(self.votes.items(), key=lambda item: (len(item[1]), sum(item[1])))
+        others = max((len(v) for k, v in self.votes.items() if k != candidate), default=0)
+        if candidate is not None and len(scores) >= min_votes and len(scores) > others:
+            self.identity = candidate
+            self.closed = True
+        elif self.embeddings >= max_embeddings:
+            self.closed = True
+
+    def match_details(self):
+        """(similarity trung bình, face_id khớp tốt nhất) của identity"""
+        if self.identity is None:
+            return None, None
+        similarities = self.votes[self.identity]
+        return float(np.mean(similarities)), self.best_match[self.identity][1]
+
+
+class FaceTracker:
+    """
+    Tracker nhẹ cho khuôn mặt: gán detection vào track theo IoU, không khớp
+    IoU thì theo khoảng cách tâm (so với kích thước khuôn mặt)
+
+    Mỗi track chỉ được embed tối đa max_embeddings lần; mỗi lần embed dùng khuôn mặt
+    chất lượng tốt nhất trong embed_interval frame gần nhất. Identity được chốt khi
+    một sinh viên đạt min_votes phiếu.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 10, max_embeddings: int = 3,
+                 embed_interval: int = 3, min_votes: int = 2, max_center_distance: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_embeddings = max_embeddings
+        self.embed_interval = embed_interval
+        self.min_votes = min(min_votes, max_embeddings)
+        self.max_center_distance = max_center_distance
+
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.total_tracks = 0
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes, landmarks):
+        """Cập nhật với detection của frame mới, trả về các track đang thấy trong frame"""
+        # boxes [n,5], landmarks [n,10] như output của FaceDetector.detect
+        boxes = np.asarray(boxes, dtype=np.float32)
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+
+        unmatched_tracks = set(range(len(self.tracks)))
+        unmatched_dets = set(range(len(boxes)))
+        pairs = []
+
+        if self.tracks and len(boxes):
+            track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32)
+            ious = iou_matrix(track_boxes, boxes)
+            # Ghép tham lam theo IoU giảm dần
+            for t, d in sorted(zip(*np.nonzero(ious >= self.iou_threshold)), key=lambda td: -ious[td]):
+                if t in unmatched_tracks and d in unmatched_dets:
+                    pairs.append((t, d))
+                    unmatched_tracks.discard(t)
+                    unmatched_dets.discard(d)
+
+            # Khuôn mặt di chuyển nhanh (IoU thấp): ghép theo khoảng cách tâm
+            for t in sorted(unmatched_tracks):
+                track = self.tracks[t]
+                best, best_distance = None, self.max_center_distance
+                for d in unmatched_dets:
+                    center = np.array([(boxes[d, 0] + boxes[d, 2]) / 2, (boxes[d, 1] + boxes[d, 3]) / 2])
+                    distance = np.linalg.norm(center - track.center) / max(track.size, 1.0)
+                    if distance < best_distance:
+                        best, best_distance = d, distance
+                if best is not None:
+                    pairs.append((t, best))
+                    unmatched_dets.discard(best)
+            unmatched_tracks -= {t for t, _ in pairs}
+
+        visible = []
+        for t, d in pairs:
+            self.tracks[t].update(boxes[d], landmarks[d])
+            visible.append(self.tracks[t])
+        for t in unmatched_tracks:
+            self.tracks[t].missed += 1
+        for d in sorted(unmatched_dets):
+            track = Track(next(self._ids), boxes[d], landmarks[d])
+            self.tracks.append(track)
+            self.total_tracks += 1
+            visible.append(track)
+
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return visible
+
+    def needs_embedding(self, track: Track) -> bool:
+        if track.closed or track.candidate is None:
+            return False
+        return track.frames_since_embedding >= self.embed_interval
+
+    def add_vote(self, track: Track, student_id, similarity: float, face_id: int):
+        track.add_vote(student_id, similarity, face_id, self.min_votes, self.max_embeddings)
+
+    def stats(self) -> dict:
+        return {
+            "active_tracks": len(self.tracks),
+            "identified_tracks": sum(1 for t in self.tracks if t.identity is not None),
+            "total_tracks": self.total_tracks,
+        }
+
+
+def create_tracker() -> FaceTracker:
+    """Tracker với tham số FACE_TRACK_* trong config"""
+    return FaceTracker(
+        iou_threshold=settings.FACE_TRACK_IOU_THRESHOLD,
+        max_missed=settings.FACE_TRACK_MAX_MISSED,
+        max_embeddings=settings.FACE_TRACK_MAX_EMBEDDINGS,
+        embed_interval=settings.FACE_TRACK_EMBED_INTERVAL,
+        min_votes=settings.FACE_TRACK_MIN_VOTES,
+    )
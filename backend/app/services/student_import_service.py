@@ -0,0 +1,275 @@
+import csv
+import io
+import multiprocessing
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.security import get_password_hash
+from app.models.student import Student as StudentModel
+from app.models.student_faces import StudentFace
+from app.models.user import User as UserModel
+from app.schemas.student import StudentCreate
+from app.services.face_service.embedding.face_embedding import embed_faces
+from app.services.face_service.face_alignment import align
+from app.services.face_service.index.face_index import face_index
+from app.services.student_service import generate_student_code
+
+# Giống các CheckConstraint của bảng students, kiểm tra trước để một dòng sai không làm hỏng cả lô
+GENDERS = ("Nam", "Nữ", "Khác")
+EDUCATION_TYPES = ("Đại học chính quy", "Liên thông", "Cao đẳng")
+
+# ==============================================================================
+# UTILITY FUNCTIONS
+# ==============================================================================
+
+def hash_passwords(passwords, workers: int = 0):
+    """Hash bcrypt song song trên nhiều process (mỗi hash tốn CPU, không chạy song song được bằng thread)"""
+    workers = workers or os.cpu_count() or 1
+    if len(passwords) < 2 * workers:
+        return [get_password_hash(p) for p in passwords]
+    # spawn: process con không kế thừa các thread của torch / micro-batcher
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+def next_student_codes(db: Session, count: int):
+    """count mã sinh viên liên tiếp bắt đầu từ mã kế tiếp của generate_student_code"""
+    first = generate_student_code(db)
+    prefix, start = first[:-6], int(first[-6:])
+    return [f"{prefix}{start + i:06d}" for i in range(count)]
+
+def _parse_rows(csv_bytes: bytes, avatars: dict, report: list):
+    """Đọc và kiểm tra từng dòng CSV, trả về các dòng hợp lệ (entry báo cáo, dữ liệu sinh viên, ảnh)"""
+    reader = csv.DictReader(io.StringIO(csv_bytes.decode("utf-8-sig")))
+    rows = []
+    for line_no, raw in enumerate(reader, start=2):  # dòng 1 là header
+        entry = {"row": line_no, "status": "failed", "student_id": None, "student_code": None, "error": None}
+        report.append(entry)
+
+        data = {key.strip(): value.strip() for key, value in raw.items()
+                if key and isinstance(value, str) and value.strip()}
+        avatar_name = data.pop("avatar", None)
+        try:
+            student = StudentCreate(**data)
+        except ValidationError as e:
+            entry["error"] = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            continue
+
+        student_data = student.model_dump(by_alias=False, exclude_unset=True,
+                                          exclude={"avatar_file", "avatar", "student_code", "user_id"})
+        if student.gender and student.gender not in GENDERS:
+            entry["error"] = f"Giới tính không hợp lệ: {student.gender} (Nam, Nữ hoặc Khác)"
+        elif student.education_type and student.education_type not in EDUCATION_TYPES:
+            entry["error"] = f"Hệ đào tạo không hợp lệ: {student.education_type}"
+        elif not avatar_name:
+            entry["error"] = "Thiếu cột avatar (tên file ảnh trong zip)"
+        elif os.path.basename(avatar_name) not in avatars:
+            entry["error"] = f"Không tìm thấy ảnh {avatar_name} trong file zip"
+        else:
+            rows.append((entry, student_data, avatars[os.path.basename(avatar_name)]))
+    return rows
+
+def _check_emails(db: Session, rows):
+    """Loại các dòng trùng email với sinh viên đã có hoặc với dòng trước đó trong file (một query)"""
+    emails = [data["email"] for _, data, _ in rows if data.get("email")]
+    existing = set()
+    if emails:
+        existing = {email for (email,) in db.query(StudentModel.email).filter(StudentModel.email.in_(emails)).all()}
+
+    valid, seen = [], set()
+    for entry, data, avatar in rows:
+        email = data.get("email")
+        if email in existing:
+            entry["error"] = f"Email {email} đã được sử dụng bởi sinh viên khác"
+        elif email and email in seen:
+            entry["error"] = f"Email {email} bị trùng trong file"
+        else:
+            seen.add(email)
+            valid.append((entry, data, avatar))
+    return valid
+
+def _embed_avatars(archive: zipfile.ZipFile, rows):
+    """Align từng ảnh, embedding theo lô FACE_BATCH_MAX_SIZE khuôn mặt; trả về các dòng có khuôn mặt"""
+    ready, faces = [], []
+    max_bytes = settings.STUDENT_IMPORT_MAX_AVATAR_BYTES
+    for entry, data, avatar in rows:
+        # Kiểm tra kích thước khai báo trước khi giải nén, ZipExtFile không đọc quá file_size
+        if avatar.file_size > max_bytes:
+            entry["error"] = f"Ảnh {avatar.filename} vượt quá {max_bytes // (1024 * 1024)}MB"
+            continue
+        content = archive.read(avatar)
+        face = align.get_aligned_face(content, profile=settings.FACE_PROFILE_SINGLE)
+        if face is None:
+            entry["error"] = f"Không phát hiện khuôn mặt trong ảnh {avatar.filename}"
+            continue
+        ready.append((entry, data, avatar, content))
+        faces.append(face)
+
+    if not faces:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    batch_size = settings.FACE_BATCH_MAX_SIZE
+    embeddings = np.vstack([embed_faces(faces[i:i + batch_size]) for i in range(0, len(faces), batch_size)])
+    embeddings = embeddings.astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return ready, embeddings
+
+def _insert_chunk(db: Session, chunk, avatar_dir: str):
+    """Một transaction cho cả lô: bulk insert users -> students -> student_faces, trả về face_id theo thứ tự"""
+    saved_files = []
+    try:
+        for item in chunk:
+            ext = os.path.splitext(item["avatar"].filename)[1].lower() or ".jpg"
+            unique_name = f"{uuid.uuid4().hex}{ext}"
+            with open(os.path.join(avatar_dir, unique_name), "wb") as f:
+                f.write(item["content"])
+            saved_files.append(os.path.join(avatar_dir, unique_name))
+            item["student"]["avatar"] = f"/{avatar_dir.strip('/')}/{unique_name}"
+
+        user_ids = dict(db.execute(
+            insert(UserModel).returning(UserModel.username, UserModel.user_id),
+            [
+                {
+                    "username": item["code"],
+                    "email": item["student"].get("email") or f"{item['code']}@edunera.edu",
+                    "password": item["password"],
+                    "role": "student",
+                }
+                for item in chunk
+            ],
+        ).all())
+        student_ids = dict(db.execute(
+            insert(StudentModel).returning(StudentModel.student_code, StudentModel.student_id),
+            [
+                {
+                    **item["student"],
+                    "student_code": item["code"],
+                    "user_id": user_ids[item["code"]],
+                    "email": item["student"].get("email") or f"{item['code']}@edunera.edu",
+                }
+                for item in chunk
+            ],
+        ).all())
+        face_ids = dict(db.execute(
+            insert(StudentFace).returning(StudentFace.student_id, StudentFace.face_id),
+            [
+                {
+                    "student_id": student_ids[item["code"]],
+                    "embedding_vector": item["embedding"].tobytes(),
+                    "is_primary": True,
+                }
+                for item in chunk
+            ],
+        ).all())
+        db.commit()
+    except Exception:
+        db.rollback()
+        for path in saved_files:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    for item in chunk:
+        item["entry"].update({
+            "status": "created",
+            "student_id": student_ids[item["code"]],
+            "student_code": item["code"],
+            "error": None,
+        })
+    return [face_ids[student_ids[item["code"]]] for item in chunk]
+
+# ==============================================================================
+# BULK IMPORT
+# ==============================================================================
+
+def import_students(db: Session, csv_bytes: bytes, avatars_zip: bytes, avatar_dir: str = "static/avatars",
+                    chunk_size: int = None):
+    """
+    Import sinh viên hàng loạt từ CSV + zip ảnh đại diện
+
+    CSV dùng tên trường của StudentCreate (camelCase hoặc snake_case), cột avatar là tên file
+    ảnh trong zip. Mật khẩu mặc định ({mã sinh viên}@) được hash trên nhiều process, khuôn mặt
+    được embedding theo lô, mỗi lô chunk_size sinh viên ghi trong một transaction bằng bulk
+    insert và toàn bộ vector được thêm vào index bằng một lần gọi.
+
+    Returns:
+        dict: Tổng kết và kết quả từng dòng (created / failed kèm lỗi)
+    """
+    chunk_size = chunk_size or settings.STUDENT_IMPORT_CHUNK_SIZE
+    timings = {}
+    started = time.perf_counter()
+
+    # 1. Đọc CSV, kiểm tra dữ liệu và email trùng
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(avatars_zip))
+    except zipfile.BadZipFile:
+        raise ValueError("File ảnh không phải file zip hợp lệ")
+    avatars = {os.path.basename(info.filename): info for info in archive.infolist() if not info.is_dir()}
+    report = []
+    try:
+        rows = _check_emails(db, _parse_rows(csv_bytes, avatars, report))
+    except UnicodeDecodeError:
+        raise ValueError("File CSV phải được mã hóa UTF-8")
+    timings["parse_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # 2. Phát hiện + embedding khuôn mặt theo lô
+    step = time.perf_counter()
+    ready, embeddings = _embed_avatars(archive, rows)
+    timings["embedding_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+    # 3. Mã sinh viên + hash mật khẩu mặc định song song
+    step = time.perf_counter()
+    codes = next_student_codes(db, len(ready))
+    passwords = hash_passwords([f"{code}@" for code in codes], settings.STUDENT_IMPORT_HASH_WORKERS)
+    timings["password_hash_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+    items = [
+        {"entry": entry, "student": data, "avatar": avatar, "content": content,
+         "code": code, "password": password, "embedding": embedding}
+        for (entry, data, avatar, content), code, password, embedding in zip(ready, codes, passwords, embeddings)
+    ]
+
+    # 4. Ghi database theo lô, lô lỗi không ảnh hưởng các lô khác
+    step = time.perf_counter()
+    os.makedirs(avatar_dir, exist_ok=True)
+    face_ids, vectors = [], []
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    for chunk_no, chunk in enumerate(chunks, start=1):
+        try:
+            face_ids.extend(_insert_chunk(db, chunk, avatar_dir))
+            vectors.extend(item["embedding"] for item in chunk)
+            print(f"[IMPORT] Lô {chunk_no}/{len(chunks)}: đã tạo {len(chunk)} sinh viên")
+        except Exception as e:
+            print(f"[IMPORT] Lô {chunk_no}/{len(chunks)} lỗi: {e}")
+            for item in chunk:
+                item["entry"]["error"] = f"Lỗi ghi database (lô {chunk_no}): {e}"
+    timings["insert_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+    # 5. Thêm toàn bộ vector vào index một lần
+    step = time.perf_counter()
+    index_error = None
+    if face_ids:
+        try:
+            face_index.add(np.vstack(vectors), face_ids)
+        except Exception as e:
+            index_error = f"{e} (chạy cli rebuild-index để đồng bộ lại)"
+            print(f"[IMPORT] Lỗi thêm vector vào index: {index_error}")
+    timings["index_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+    created = sum(1 for entry in report if entry["status"] == "created")
+    return {
+        "total_rows": len(report),
+        "created": created,
+        "failed": len(report) - created,
+        "index_error": index_error,
+        "elapsed_seconds": round(time.perf_counter() - started, 2),
+        "timings": timings,
+        "rows": report,
+    }
@@ -5,7 +5,6 @@ from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
 from typing import Optional
 
-import faiss
 import os
 import numpy as np
 from fastapi import HTTPException
@@ -23,11 +22,13 @@ from app.models.semester import Semester
 from app.schemas.student import StudentCreate, StudentUpdate
 from app.schemas.user import UserCreate
 
+from app.core.config import settings
 from app.core.security import get_password_hash
 from app.services.face_service.embedding.face_embedding import get_face_embedding
+from app.services.face_service.index.face_index import face_index
+from app.services.face_service.index.templates import student_index_entries
 from app.models.student_faces import StudentFace
 
-FAISS_INDEX_PATH = "face.index"
 IMAGE_DIR = "app/static/images/"  # Thư mục lưu ảnh
 # ==============================================================================
 # UTILITY FUNCTIONS
@@ -66,17 +67,6 @@ def generate_student_code(db: Session) -> str:
             pass
     new_number = max_number + 1
     return f"{prefix}{new_number:06d}"
-# ----------- FAISS Index -----------
-def load_or_create_faiss_index(d: int) -> faiss.Index:
-    """Load FAISS index nếu có, nếu chưa thì tạo mới"""
-    if os.path.exists(FAISS_INDEX_PATH):
-        return faiss.read_index(FAISS_INDEX_PATH)
-    return faiss.IndexFlatL2(d)
-
-
-def save_faiss_index(index: faiss.Index):
-    """Lưu FAISS index ra file"""
-    faiss.write_index(index, FAISS_INDEX_PATH)
 # ==============================================================================
 # CRUD OPERATIONS
 # ==============================================================================
@@ -97,7 +87,37 @@ def search_students(db: Session, q: str):
         ) 
     ).all()
 
-def create_student(db: Session, student_payload: StudentCreate):
+def embed_face_image(content: bytes, quality: bool = False) -> np.ndarray:
+    """Embedding đã chuẩn hóa của khuôn mặt trong ảnh (chỉ inference, không dùng database)"""
+    try:
+        emb = get_face_embedding(content, profile=settings.FACE_PROFILE_SINGLE, quality=quality)
+        if emb is None or len(emb) == 0:
+            raise ValueError("Face not detected")
+    except Exception as e:
+        raise ValueError(f"Face embedding error: {str(e)}")
+    emb = np.array(emb, dtype=np.float32).flatten()
+    return emb / np.linalg.norm(emb)
+
+def embed_avatar(avatar_path: str) -> np.ndarray:
+    """Embedding của ảnh đại diện đã lưu (URL path /static/...), chạy trong inference pool"""
+    try:
+        # Chuyển đổi URL path thành đường dẫn file thực
+        if avatar_path.startswith("/"):
+            avatar_path = avatar_path.lstrip("/")  # Loại bỏ "/" ở đầu
+
+        print(f"Opening file at: {avatar_path}")
+        with open(avatar_path, "rb") as img_file:
+            content = img_file.read()
+        return embed_face_image(content)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Face embedding error: {str(e)}")
+
+def create_student(db: Session, student_payload: StudentCreate, emb: np.ndarray = None):
+    """emb: embedding ảnh đại diện đã tính trước (embed_avatar), không có thì tính tại chỗ"""
+    if emb is None:
+        emb = embed_avatar(student_payload.avatar)
     try:
         # 1. Sinh student_code
         student_code = generate_student_code(db)
@@ -136,47 +156,27 @@ def create_student(db: Session, student_payload: StudentCreate):
         if "class_name" in student_data and student_data["class_name"] is None:
             student_data.pop("class_name")
         print(f"Creating student with data: {student_data}")
-        # ---------- 2. Lấy embedding từ ảnh ----------
-        try:
-            # Chuyển đổi URL path thành đường dẫn file thực
-            avatar_path = student_payload.avatar
-            if avatar_path.startswith("/"):
-                avatar_path = avatar_path.lstrip("/")  # Loại bỏ "/" ở đầu
-            
-            print(f"Opening file at: {avatar_path}")
-            with open(avatar_path, "rb") as img_file:
-                content = img_file.read()
-            emb = get_face_embedding(content)
-            if emb is None or len(emb) == 0:
-                raise ValueError("Face not detected")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Face embedding error: {str(e)}")
-
-        # Chuẩn hóa vector
-        emb = np.array(emb, dtype=np.float32).flatten()
-        emb /= np.linalg.norm(emb)
-
-        # ---------- 3. Thêm vào FAISS ----------
-        index = load_or_create_faiss_index(len(emb))
-        index.add(np.expand_dims(emb, axis=0))
-        faiss_index = index.ntotal - 1  # vị trí mới thêm vào
-        save_faiss_index(index)
-
         new_student = StudentModel(**student_data)
         db.add(new_student)
         db.commit()
         db.refresh(new_student)
 
-            # ---------- 5. Lưu embedding vào bảng student_faces ----------
+            # ---------- 5. Lưu embedding vào bảng student_faces + FAISS (id = face_id) ----------
         try:
             new_face = StudentFace(
                 student_id=new_student.student_id,
                 embedding_vector=emb.tobytes(),  # lưu numpy array thành nhị phân
-                is_primary=True,  # ảnh đầu tiên làm ảnh chính
-                faiss_index=faiss_index
+                is_primary=True  # ảnh đầu tiên làm ảnh chính
             )
             db.add(new_face)
-            db.commit()
+            db.flush()  # lấy face_id trước khi thêm vào index
+
+            face_index.add(np.expand_dims(emb, axis=0), [new_face.face_id], db=db)
+            try:
+                db.commit()
+            except Exception:
+                face_index.remove([new_face.face_id])
+                raise
             db.refresh(new_face)
         except Exception as e:
             db.rollback()
@@ -205,6 +205,58 @@ def create_student(db: Session, student_payload: StudentCreate):
         print(f"Lỗi tạo sinh viên không mong đợi: {str(e)}")
         raise e
     
+def add_student_face(db: Session, student_id: int, emb: np.ndarray):
+    """
+    Thêm một ảnh khuôn mặt (template) cho sinh viên
+
+    emb: embedding đã qua cổng chất lượng, tính trước bằng embed_face_image(content, quality=True).
+    Chế độ FACE_TEMPLATE_MODE=all thêm vector mới vào index, centroid thay vector trung bình
+    của sinh viên trong index.
+    """
+    student = db.query(StudentModel).filter(StudentModel.student_id == student_id).first()
+    if not student:
+        return None
+
+    count = db.query(func.count(StudentFace.face_id)).filter(StudentFace.student_id == student_id).scalar()
+    if count >= settings.FACE_TEMPLATES_MAX:
+        raise ValueError(f"Sinh viên đã có tối đa {settings.FACE_TEMPLATES_MAX} ảnh khuôn mặt")
+
+    new_face = StudentFace(
+        student_id=student_id,
+        embedding_vector=emb.tobytes(),
+        is_primary=count == 0
+    )
+    try:
+        if settings.FACE_TEMPLATE_MODE == "centroid":
+            # Vector trung bình hiện tại, để khôi phục nếu commit lỗi
+            _, old_ids, old_vectors = student_index_entries(db, student_id, "centroid")
+            db.add(new_face)
+            db.flush()
+            # Thay vector trung bình của sinh viên (id = face_id ảnh chính) trong một lần cập nhật index,
+            # pgvector ghi trong cùng transaction với dòng mới
+            remove_ids, ids, vectors = student_index_entries(db, student_id, "centroid")
+            face_index.replace(remove_ids, vectors, ids, db=db)
+            try:
+                db.commit()
+            except Exception:
+                db.rollback()  # trả khóa dòng trước khi pgvector khôi phục bằng session riêng
+                face_index.replace(ids, old_vectors, old_ids)
+                raise
+        else:
+            db.add(new_face)
+            db.flush()
+            face_index.add(np.expand_dims(emb, axis=0), [new_face.face_id], db=db)
+            try:
+                db.commit()
+            except Exception:
+                face_index.remove([new_face.face_id])
+                raise
+        db.refresh(new_face)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error saving embedding to DB: {str(e)}")
+    return new_face
+
 def update_student(db: Session, student_id: int, payload: StudentUpdate):
     student = db.query(StudentModel).filter(StudentModel.student_id == student_id).first()
     if not student:
@@ -241,10 +293,13 @@ def delete_student(db: Session, student_id: int) -> bool:
     
     try:
         user = db.query(UserModel).filter(UserModel.user_id == student.user_id).first()
+        face_ids = [face.face_id for face in student.student_faces]
         db.delete(student)
         if user:
             db.delete(user)
         db.commit()
+        # Xóa vector khỏi FAISS index sau khi đã xóa trong database
+        face_index.remove(face_ids)
         return True
     except IntegrityError as e:
         db.rollback()
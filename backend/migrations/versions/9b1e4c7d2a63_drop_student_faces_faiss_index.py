@@ -0,0 +1,30 @@
+"""drop_student_faces_faiss_index
+
+Revision ID: 9b1e4c7d2a63
+Revises: 445bf9eeeab8
+Create Date: 2026-10-18 09:12:40.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1e4c7d2a63'
+down_revision: Union[str, Sequence[str], None] = '445bf9eeeab8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FAISS index dùng IndexIDMap2 với id = face_id, không còn lưu vị trí vector.
+    # Sau khi upgrade cần chạy: python -m app.services.face_service.cli rebuild-index
+    op.drop_column('student_faces', 'faiss_index')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('student_faces', sa.Column('faiss_index', sa.Integer(), nullable=True))
@@ -0,0 +1,71 @@
+"""add_student_faces_pgvector
+
+Revision ID: c4e81f3a9d27
+Revises: 9b1e4c7d2a63
+Create Date: 2026-10-18 14:05:11.402317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e81f3a9d27'
+down_revision: Union[str, Sequence[str], None] = '9b1e4c7d2a63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EMBEDDING_DIM = 512
+BATCH_SIZE = 1000
+
+
+def _has_pgvector(bind) -> bool:
+    return bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")).first() is not None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Cột vector chỉ cần cho FACE_INDEX_BACKEND=pgvector; server không có extension thì bỏ qua
+    if not _has_pgvector(bind):
+        print("⚠️ PostgreSQL chưa cài extension pgvector, bỏ qua cột student_faces.embedding")
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute(f"ALTER TABLE student_faces ADD COLUMN IF NOT EXISTS embedding vector({EMBEDDING_DIM})")
+
+    # Backfill từ embedding_vector (bytes float32), đọc và ghi theo lô
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text(
+            "SELECT face_id, embedding_vector FROM student_faces "
+            "WHERE face_id > :last_id AND embedding_vector IS NOT NULL ORDER BY face_id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE student_faces SET embedding = CAST(:embedding AS vector) WHERE face_id = :face_id"),
+            [
+                {
+                    "face_id": face_id,
+                    "embedding": "[" + ",".join("%.7g" % v for v in np.frombuffer(blob, dtype=np.float32)) + "]",
+                }
+                for face_id, blob in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+    # HNSW tạo được trên bảng rỗng; đổi sang IVFFlat bằng: cli pgvector-index --type ivfflat
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_student_faces_embedding_ann ON student_faces "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_student_faces_embedding_ann")
+    op.execute("ALTER TABLE student_faces DROP COLUMN IF EXISTS embedding")
@@ -429,14 +429,12 @@ CREATE TABLE student_faces (
     student_id INT NOT NULL REFERENCES students(student_id) ON DELETE CASCADE,
     embedding_vector BYTEA NOT NULL,           -- Lưu vector nhị phân
     is_primary BOOLEAN DEFAULT FALSE,          -- Đánh dấu ảnh chính
-    faiss_index INT,                            -- Vị trí vector trong FAISS index
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Tạo index tối ưu cho truy vấn
 CREATE INDEX idx_student_faces_student_id ON student_faces(student_id);
-CREATE INDEX idx_student_faces_faiss_index ON student_faces(faiss_index);
 
 -- 12. ATTENDANCE_LOGS
 CREATE TABLE attendance_logs (
@@ -178,7 +178,6 @@ CREATE_SCHEMA_SQL = """
         student_id INT NOT NULL REFERENCES students(student_id) ON DELETE CASCADE,
         embedding_vector BYTEA NOT NULL,
         is_primary BOOLEAN DEFAULT FALSE,
-        faiss_index INT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
@@ -236,7 +235,6 @@ CREATE_SCHEMA_SQL = """
 
     -- Create Indexes
     CREATE INDEX idx_student_faces_student_id ON student_faces(student_id);
-    CREATE INDEX idx_student_faces_faiss_index ON student_faces(faiss_index);
     CREATE INDEX idx_attendance_logs ON attendance_logs(student_id, schedule_id, date);
     CREATE INDEX idx_attendances ON attendances(student_id, date);
 """
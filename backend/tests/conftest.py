@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+# Settings bắt buộc có DATABASE_URL / SECRET_KEY; test không kết nối database của app,
+# test cần database dùng TEST_DATABASE_URL (xem fixture test_db)
+os.environ.setdefault("DATABASE_URL", os.environ.get("TEST_DATABASE_URL", "postgresql://localhost/qldt_test"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("FACE_PRELOAD_MODELS", "false")
+
+
+@pytest.fixture
+def test_db():
+    """
+    Session trên TEST_DATABASE_URL (database riêng đã chạy alembic upgrade head)
+
+    Mọi thay đổi nằm trong một transaction được rollback khi test kết thúc;
+    db.commit() trong service chỉ kết thúc một savepoint.
+    """
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("Chưa đặt TEST_DATABASE_URL")
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    import app.models  # noqa: F401  đăng ký toàn bộ model với SQLAlchemy
+
+    engine = create_engine(url)
+    connection = engine.connect()
+    transaction = connection.begin()
+    db = Session(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield db
+    finally:
+        db.close()
+        transaction.rollback()
+        connection.close()
+        engine.dispose()
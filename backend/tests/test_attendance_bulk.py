@@ -0,0 +1,92 @@
+"""POST /attendances/bulk: đánh dấu vắng chỉ xóa bản ghi hôm nay của lịch học"""
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+
+@pytest.fixture
+def enrolled(test_db):
+    """Một lịch học với hai sinh viên đăng ký, trả về (schedule_id, [student_id], user_id)"""
+    from app.models.course import Course
+    from app.models.course_class import CourseClass
+    from app.models.enrollment import Enrollment
+    from app.models.period import Period
+    from app.models.room import Room
+    from app.models.schedule import Schedule
+    from app.models.student import Student
+    from app.models.teacher import Teacher
+    from app.models.user import User
+
+    db = test_db
+    user = User(username="test_bulk_teacher", password="x", role="teacher")
+    db.add(user)
+    db.flush()
+    teacher = Teacher(teacher_code="TBULK01", first_name="Bulk", last_name="Test", user_id=user.user_id)
+    course = Course(course_code="TBULK101", name="Bulk attendance", credits=3)
+    room = Room(room_name="TBULK", capacity=60)
+    period = Period(period_number=1, start_time=time(7, 0), end_time=time(7, 50), day="Thứ 2")
+    db.add_all([teacher, course, room, period])
+    db.flush()
+    course_class = CourseClass(course_id=course.course_id, teacher_id=teacher.teacher_id, section="01")
+    db.add(course_class)
+    db.flush()
+    schedule = Schedule(course_class_id=course_class.course_class_id, room_id=room.room_id, day_of_week=2,
+                        period_start=period.period_id, period_end=period.period_id, week_number=1)
+    students = [Student(first_name=f"SV{i}", last_name="Bulk", student_code=f"TBULK{i:04d}") for i in range(2)]
+    db.add_all([schedule, *students])
+    db.flush()
+    db.add_all([Enrollment(student_id=s.student_id, course_class_id=course_class.course_class_id) for s in students])
+    db.commit()
+    return schedule.schedule_id, [s.student_id for s in students], user.user_id
+
+
+def test_bulk_absent_keeps_earlier_dates(test_db, enrolled):
+    from app.models.attendance import Attendance
+    from app.schemas.attendance import AttendanceBulkItem
+    from app.services.attendance_service import mark_attendances_bulk, upsert_attendances
+
+    db = test_db
+    schedule_id, (absent_id, present_id), user_id = enrolled
+    earlier = date.today() - timedelta(days=7)
+    db.add_all([
+        Attendance(student_id=sid, schedule_id=schedule_id, date=earlier, status="present",
+                   confirmed_at=datetime.now(), confirmed_by=user_id)
+        for sid in (absent_id, present_id)
+    ])
+    db.commit()
+    upsert_attendances(schedule_id, {absent_id: "present"}, db, confirmed_by=user_id)
+
+    result = mark_attendances_bulk(schedule_id, [
+        AttendanceBulkItem(student_id=absent_id, status="absent"),
+        AttendanceBulkItem(student_id=present_id, status="late"),
+    ], user_id, db)
+
+    actions = {row["student_id"]: row.get("action") for row in result["results"]}
+    assert actions == {absent_id: "deleted", present_id: "created"}
+
+    rows = {
+        (sid, day): status for sid, day, status in db.query(
+            Attendance.student_id, Attendance.date, Attendance.status
+        ).filter(Attendance.schedule_id == schedule_id).all()
+    }
+    assert rows == {
+        (absent_id, earlier): "present",
+        (present_id, earlier): "present",
+        (present_id, date.today()): "late",
+    }
+
+
+def test_bulk_rejects_students_outside_roster(test_db, enrolled):
+    from app.schemas.attendance import AttendanceBulkItem
+    from app.services.attendance_service import mark_attendances_bulk
+
+    schedule_id, (student_id, _), user_id = enrolled
+    result = mark_attendances_bulk(schedule_id, [
+        AttendanceBulkItem(student_id=student_id, status="present"),
+        AttendanceBulkItem(student_id=-1, status="present"),
+    ], user_id, test_db)
+
+    assert result["succeeded"] == 1
+    assert result["results"][1]["success"] is False
@@ -0,0 +1,55 @@
+"""Artifact TorchScript / ONNX (fp32 và INT8) phải cho output gần như model eager"""
+import importlib.util
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from app.services.face_service.embedding.model_registry import adaface_models, load_pretrained_model  # noqa: E402
+from app.services.face_service.face_alignment.mtcnn import build_eager_nets  # noqa: E402
+from app.services.face_service.models_services.exported import (  # noqa: E402
+    cosine_parity,
+    export_module,
+    load_artifact,
+    parity_inputs,
+)
+
+MIN_COSINE = 0.99
+MODELS = ("ir_101", "pnet", "rnet", "onet")
+
+pytestmark = [
+    pytest.mark.slow,
+    pytest.mark.skipif(not os.path.exists(adaface_models["ir_101"]),
+                       reason="Chưa có checkpoint AdaFace IR-101"),
+]
+
+
+@pytest.fixture(scope="module")
+def eager_models():
+    models = {"ir_101": load_pretrained_model("ir_101")}
+    models.update(build_eager_nets("cpu"))
+    return models
+
+
+@pytest.fixture(scope="module")
+def artifact_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("exported"))
+
+
+@pytest.mark.parametrize("quantize", [False, True], ids=["fp32", "int8"])
+@pytest.mark.parametrize("runtime", ["torchscript", "onnx"])
+@pytest.mark.parametrize("name", MODELS)
+def test_exported_model_matches_eager(eager_models, artifact_dir, name, runtime, quantize):
+    if runtime == "onnx" and importlib.util.find_spec("onnxruntime") is None:
+        pytest.skip("Chưa cài onnxruntime")
+
+    torch.manual_seed(0)
+    module = eager_models[name]
+    export_module(module, name, runtime, quantize, artifact_dir)
+    exported = load_artifact(name, runtime, quantize, artifact_dir)
+
+    x = parity_inputs(name, 8)
+    with torch.no_grad():
+        worst = cosine_parity(module(x), exported(x))
+    assert worst > MIN_COSINE, f"{name} {runtime} quantize={quantize}: min cosine {worst:.5f}"
@@ -0,0 +1,64 @@
+"""nms (torchvision / vectorized) phải giữ đúng các box như nms_reference"""
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("cv2")
+
+from app.services.face_service.face_alignment.mtcnn_pytorch.src.box_utils import (  # noqa: E402
+    _NMS_MATRIX_LIMIT,
+    nms,
+    nms_reference,
+    nms_vectorized,
+)
+
+MODES = ("union", "min")
+THRESHOLDS = (0.3, 0.5, 0.7)
+SIZES = (1, 2, 50, 500, _NMS_MATRIX_LIMIT + 300)  # cỡ cuối đi qua nhánh không dựng ma trận overlap
+
+
+def random_boxes(n, seed, ties=False, degenerate=False, image_size=1920):
+    """Box (x1, y1, x2, y2, score) gom quanh một số tâm như output P-Net"""
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, image_size, size=(max(1, n // 20), 2))
+    picks = centers[rng.integers(0, len(centers), size=n)]
+    sizes = rng.uniform(12, 200, size=(n, 1))
+    xy1 = np.round(picks + rng.normal(0, 10, size=(n, 2)) - sizes / 2)
+    xy2 = np.round(xy1 + sizes)
+    scores = rng.uniform(0, 1, size=(n, 1))
+    boxes = np.hstack([xy1, xy2, scores])
+
+    if ties:
+        # Điểm trùng nhau và box trùng hẳn nhau (cùng tọa độ, cùng điểm)
+        boxes[:, 4] = np.round(boxes[:, 4], 1)
+        duplicates = rng.integers(0, n, size=n // 5)
+        boxes[duplicates[1::2]] = boxes[duplicates[::2][:len(duplicates[1::2])]]
+    if degenerate:
+        # Box rộng / cao 0 pixel và box chỉ là một điểm
+        rows = rng.integers(0, n, size=max(1, n // 10))
+        boxes[rows[0::3], 2] = boxes[rows[0::3], 0]
+        boxes[rows[1::3], 3] = boxes[rows[1::3], 1]
+        boxes[rows[2::3], 2:4] = boxes[rows[2::3], 0:2]
+    return boxes
+
+
+def kept(func, boxes, threshold, mode):
+    return [int(i) for i in func(boxes.copy(), threshold, mode)]
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("variant", ["plain", "ties", "degenerate"])
+@pytest.mark.parametrize("n", SIZES)
+def test_nms_matches_reference(n, variant, mode, threshold):
+    boxes = random_boxes(n, seed=n, ties=variant == "ties", degenerate=variant == "degenerate")
+    expected = kept(nms_reference, boxes, threshold, mode)
+
+    assert kept(nms_vectorized, boxes, threshold, mode) == expected
+    assert kept(nms, boxes, threshold, mode) == expected
+
+
+def test_nms_empty():
+    empty = np.zeros((0, 5))
+    for func in (nms, nms_vectorized, nms_reference):
+        assert list(func(empty, 0.5, "union")) == []